@@ -0,0 +1,155 @@
+"""Bound the grid to the sensitive region of the magnet.
+
+A voxel contributes to the signal if its resonance offset is within the
+linewidth of zero for a cantilever position in its swing. The resonance
+offset is evaluated on a coarse grid that spans the search grid. A coarse
+point is flagged if ``abs(B_offset)`` is within the linewidth plus the
+change of the offset to its neighbors, so that a resonant shell that passes
+between two coarse points flags both of them. The bounding box of the
+flagged points is dilated by the cantilever amplitude in x, padded by one
+coarse step and the safety margin, and snapped to the grid step.
+"""
+
+import numpy as np
+from mrfmsim import formula
+from mrfmsim.component import Grid
+
+
+def coarse_grid(grid, coarse_shape):
+    """Return a grid with at most ``coarse_shape`` points over the grid range.
+
+    :param Grid grid: the search grid
+    :param tuple coarse_shape: the maximum number of points along x, y, z
+    :rtype: Grid
+    """
+
+    shape = np.minimum(coarse_shape, grid.grid_shape)
+    step = np.where(
+        shape > 1, grid.grid_range / np.maximum(shape - 1, 1), grid.grid_step
+    )
+    return Grid(
+        grid_shape=tuple(int(n) for n in shape),
+        grid_step=step,
+        grid_origin=grid.grid_origin,
+    )
+
+
+def _neighbor_change(array):
+    """The largest absolute change of the array to the neighboring points."""
+
+    change = np.zeros(array.shape)
+    for axis in range(array.ndim):
+        diff = np.abs(np.diff(array, axis=axis))
+        lower = [slice(None)] * array.ndim
+        upper = [slice(None)] * array.ndim
+        lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+        np.maximum(change[tuple(lower)], diff, out=change[tuple(lower)])
+        np.maximum(change[tuple(upper)], diff, out=change[tuple(upper)])
+    return change
+
+
+def sensitive_extents(
+    grid, magnet, h, B0, f_rf, Gamma, dB, x_0p=0.0, coarse_shape=(41, 41, 41)
+):
+    """Find the bounding box of the sensitive region in the grid.
+
+    :param Grid grid: the search grid
+    :param magnet: the magnet object
+    :param list h: tip-sample separation [nm]
+    :param float B0: external field [mT]
+    :param float f_rf: microwave frequency [Hz]
+    :param float Gamma: gyromagnetic ratio [rad/s.mT]
+    :param float dB: the half width of the sensitive band of the resonance
+        offset, for example a few linewidths [mT]
+    :param float x_0p: the cantilever amplitude [nm]
+    :param tuple coarse_shape: the maximum number of coarse points along x,
+        y, z
+    :return: the extents of the flagged coarse points, dilated by ``x_0p``
+        in x, shape (3, 2) [nm]
+    :rtype: ndarray
+    :raises ValueError: if no coarse point is within the band
+    """
+
+    coarse = coarse_grid(grid, coarse_shape)
+    Bz = formula.field_func(magnet.Bz_method, coarse.grid_array, h)
+    B_tot = B0 + np.broadcast_to(Bz, coarse.grid_shape)
+    B_offset = formula.B_offset(B_tot, f_rf, Gamma)
+    flagged = np.abs(B_offset) <= dB + _neighbor_change(B_offset)
+    if not flagged.any():
+        raise ValueError("the sensitive region is not in the grid")
+
+    extents = np.empty((3, 2))
+    for axis, coordinate in enumerate(coarse.grid_array):
+        other = tuple(i for i in range(3) if i != axis)
+        index = np.flatnonzero(flagged.any(axis=other))
+        extents[axis] = np.ravel(coordinate)[[index[0], index[-1]]]
+    extents[0] += [-x_0p, x_0p]
+    return extents
+
+
+def bounding_grid(
+    grid,
+    magnet,
+    h,
+    B0,
+    f_rf,
+    Gamma,
+    dB,
+    x_0p=0.0,
+    margin=0.0,
+    grid_step=None,
+    coarse_shape=(41, 41, 41),
+):
+    """Return the grid bounded to the sensitive region of the search grid.
+
+    Without ``grid_step``, the bounded grid is the block of the search grid
+    points that covers the sensitive region. With ``grid_step``, it is a
+    new grid with the step that covers the sensitive region. The grid does
+    not extend beyond the search grid, except to complete the last step.
+
+    :param Grid grid: the search grid
+    :param float margin: the safety margin on each side [nm]
+    :param list grid_step: the step of a new grid [nm]
+    :return: the bounded grid, and the distance from the sensitive region
+        to the grid extents on each side, shape (3, 2) [nm]; a negative
+        distance means that the search grid cuts the sensitive region
+    :rtype: tuple(Grid, ndarray)
+
+    See ``sensitive_extents`` for the other parameters.
+    """
+
+    sensitive = sensitive_extents(
+        grid, magnet, h, B0, f_rf, Gamma, dB, x_0p, coarse_shape
+    )
+    pad = np.array(coarse_grid(grid, coarse_shape).grid_step) + margin
+    box = np.clip(
+        sensitive + np.column_stack((-pad, pad)),
+        grid.grid_extents[:, :1],
+        grid.grid_extents[:, 1:],
+    )
+
+    if grid_step is None:
+        step = np.array(grid.grid_step, dtype=float)
+        start = grid.grid_extents[:, 0]
+        # the tolerance prevents an extra point from the rounding errors
+        first = np.floor((box[:, 0] - start) / step + 1e-9)
+        last = np.ceil((box[:, 1] - start) / step - 1e-9)
+        shape = last - first + 1
+        origin = start + (first + last) / 2 * step
+    else:
+        step = np.array(grid_step, dtype=float)
+        shape = np.ceil((box[:, 1] - box[:, 0]) / step - 1e-9) + 1
+        origin = box.mean(axis=1)
+
+    bounded = Grid(
+        grid_shape=tuple(int(n) for n in shape),
+        grid_step=step,
+        grid_origin=origin,
+    )
+    distance = np.column_stack(
+        (
+            sensitive[:, 0] - bounded.grid_extents[:, 0],
+            bounded.grid_extents[:, 1] - sensitive[:, 1],
+        )
+    )
+    return bounded, distance
@@ -0,0 +1,300 @@
+"""Execute an experiment on blocks of the grid under a memory budget.
+
+The CERMIT and IBM signals are sums over the voxels, and the intermediate
+arrays of the graph, including the extended grids of the cantilever motion,
+have the size of the grid. The grid is split into blocks along y and z that
+keep the full x axis, so the windows of the cantilever motion in x, such as
+``min_abs_offset`` and ``rel_dpol_sat_td``, and the extended grids are
+computed for each block exactly as for the full grid. The partial results of
+the blocks are summed.
+
+The peak memory of an execution grows linearly with the number of (y, z)
+columns of the grid. The slope and the intercept are measured with
+``tracemalloc`` on two small probe blocks, and the largest block within the
+byte budget is used.
+
+A spin density array that broadcasts to the grid and varies along y or z,
+for example an ``np.memmap`` of a sample file or a ``(1, ny, nz)`` layer
+density, is sliced for each block along its non-singleton axes, so only the
+block is read into memory. The block occupancy index marks the blocks with
+a non-zero density, and the empty blocks are skipped, so the cost of a
+mostly empty sample scales with its occupied volume.
+"""
+
+import dataclasses
+import tracemalloc
+import numpy as np
+from mrfmsim.component import Grid
+from mrfmsim.formula.math import GRID_NDIM
+
+
+def check_grid(grid, execution):
+    """Check the grid is a uniform ``Grid``.
+
+    The block, scan, and padded grid executions rely on the uniform step
+    and the origin of ``Grid``.
+
+    :param grid: the grid component
+    :param str execution: the name of the execution in the error message
+    :raises ValueError: if the grid is not a ``Grid``
+    """
+
+    if not isinstance(grid, Grid):
+        raise ValueError(
+            f"the {execution} requires a Grid, not {type(grid).__name__}"
+        )
+
+
+def block_grid(grid, y_slice, z_slice):
+    """Return the block of the grid with the full x axis.
+
+    :param Grid grid: the grid
+    :param slice y_slice: the y indices of the block
+    :param slice z_slice: the z indices of the block
+    :rtype: Grid
+    """
+
+    shape = np.array(grid.grid_shape)
+    start = np.array([0, y_slice.start, z_slice.start])
+    block_shape = np.array(
+        [shape[0], y_slice.stop - y_slice.start, z_slice.stop - z_slice.start]
+    )
+    center = grid.grid_extents[:, 0] + (start + (block_shape - 1) / 2) * np.array(
+        grid.grid_step
+    )
+    return Grid(
+        grid_shape=tuple(int(n) for n in block_shape),
+        grid_step=grid.grid_step,
+        grid_origin=center,
+    )
+
+
+def block_slices(grid, block_shape):
+    """Return the y and z index slices of the blocks in row-major order.
+
+    :param Grid grid: the grid
+    :param tuple block_shape: the number of y and z points of the blocks,
+        the blocks at the end can be smaller
+    :rtype: list
+    """
+
+    _, ny, nz = grid.grid_shape
+    by, bz = block_shape
+    return [
+        (slice(j, min(j + by, ny)), slice(k, min(k + bz, nz)))
+        for j in range(0, ny, by)
+        for k in range(0, nz, bz)
+    ]
+
+
+def grid_blocks(grid, block_shape):
+    """Split the grid into blocks along y and z.
+
+    :param Grid grid: the grid
+    :param tuple block_shape: the number of y and z points of the blocks,
+        the blocks at the end can be smaller
+    :return: the block grids
+    :rtype: list
+    """
+
+    return [block_grid(grid, *slices) for slices in block_slices(grid, block_shape)]
+
+
+def _is_block_density(spin_density, grid_shape):
+    """Whether the density broadcasts to the grid and varies along y or z."""
+
+    shape = np.shape(spin_density)[-GRID_NDIM:]
+    grid_shape = tuple(grid_shape)[GRID_NDIM - len(shape) :]
+    return all(n in (1, m) for n, m in zip(shape, grid_shape)) and any(
+        n > 1 for n in shape[-2:]
+    )
+
+
+def _density_inputs(inputs, grid_shape):
+    """The names of the inputs with a spin density array to slice."""
+
+    return [
+        name
+        for name, value in inputs.items()
+        if np.ndim(getattr(value, "spin_density", None)) > 0
+        and _is_block_density(value.spin_density, grid_shape)
+    ]
+
+
+def _block_density(spin_density, y_slice, z_slice):
+    """Slice the density along its non-singleton y and z axes."""
+
+    shape = np.shape(spin_density)[-2:]
+    slices = (y_slice, z_slice)[2 - len(shape) :]
+    index = tuple(slice(None) if n == 1 else s for n, s in zip(shape, slices))
+    return np.asarray(spin_density[(Ellipsis,) + index])
+
+
+def block_inputs(grid, y_slice, z_slice, **inputs):
+    """Return the inputs of a grid block.
+
+    The grid is replaced by the block grid, and the components with a spin
+    density array that broadcasts to the grid are replaced by copies with
+    the density of the block. A memory-mapped density only reads the block.
+
+    :param Grid grid: the grid
+    :param slice y_slice: the y indices of the block
+    :param slice z_slice: the z indices of the block
+    :param inputs: the other experiment inputs
+    :rtype: dict
+    """
+
+    for name in _density_inputs(inputs, grid.grid_shape):
+        density = _block_density(inputs[name].spin_density, y_slice, z_slice)
+        inputs[name] = dataclasses.replace(inputs[name], spin_density=density)
+    inputs["grid"] = block_grid(grid, y_slice, z_slice)
+    return inputs
+
+
+def block_occupancy(spin_density, block_shape, grid_shape=None):
+    """Mark the blocks with a non-zero spin density.
+
+    The density is broadcast to the grid as a view and read one slab of
+    ``block_shape[0]`` y points at a time, so a memory-mapped density is
+    streamed from the file. The index can be computed once for a sample and
+    reused for other executions with the same block shape.
+
+    :param ndarray spin_density: the spin density that broadcasts to the grid
+    :param tuple block_shape: the number of y and z points of the blocks
+    :param tuple grid_shape: the grid shape, the last three axes of the
+        density if None
+    :return: the occupancy of each block, with the shape of the number of
+        blocks along y and z
+    :rtype: ndarray
+    """
+
+    if grid_shape is None:
+        grid_shape = np.shape(spin_density)[-GRID_NDIM:]
+    shape = np.broadcast_shapes(np.shape(spin_density), tuple(grid_shape))
+    density = np.broadcast_to(spin_density, shape)
+    ny, nz = shape[-2:]
+    by, bz = block_shape
+    # the slab is reduced over all the axes but z
+    axis = tuple(range(len(shape) - 1))
+    occupancy = np.empty((-(-ny // by), -(-nz // bz)), dtype=bool)
+    for i, j in enumerate(range(0, ny, by)):
+        columns = np.any(np.asarray(density[..., j : j + by, :]) != 0, axis=axis)
+        occupancy[i] = np.logical_or.reduceat(columns, np.arange(0, nz, bz))
+    return occupancy
+
+
+def peak_bytes(experiment, **inputs):
+    """Measure the peak memory allocated during an execution [bytes]."""
+
+    tracemalloc.start()
+    try:
+        experiment(**inputs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def budget_block_shape(experiment, max_bytes, probe_columns=16, **inputs):
+    """Choose the largest block of (y, z) columns within the byte budget.
+
+    The experiment is executed on a block of one column, as a warm-up and
+    for the intercept, and on a block of ``probe_columns`` columns for the
+    memory per column.
+
+    :param Experiment experiment: the experiment
+    :param int max_bytes: the peak memory budget of a block [bytes]
+    :param int probe_columns: the number of columns of the larger probe
+    :param inputs: the experiment inputs, including "grid"
+    :return: the number of y and z points of the blocks
+    :rtype: tuple(int, int)
+    :raises ValueError: if one column does not fit in the budget
+    """
+
+    grid = inputs.pop("grid")
+    _, ny, nz = grid.grid_shape
+    bz = min(nz, probe_columns)
+    by = min(ny, max(probe_columns // bz, 1))
+
+    small = block_inputs(grid, slice(0, 1), slice(0, 1), **inputs)
+    large = block_inputs(grid, slice(0, by), slice(0, bz), **inputs)
+    peak_bytes(experiment, **small)
+    intercept = peak_bytes(experiment, **small)
+    large_peak = peak_bytes(experiment, **large)
+    slope = max(large_peak - intercept, 0) / max(by * bz - 1, 1)
+
+    columns = (max_bytes - intercept) / slope + 1 if slope else ny * nz
+    if columns < 1:
+        raise ValueError(
+            f"the budget of {max_bytes} bytes is smaller than one grid column "
+            f"({intercept} bytes)"
+        )
+    columns = int(columns)
+    bz = min(nz, columns)
+    return min(ny, max(columns // bz, 1)), bz
+
+
+def chunked_run(experiment, max_bytes=None, block_shape=None, occupancy=None, **inputs):
+    """Execute the experiment on grid blocks and sum the results.
+
+    The returns of the experiment should be sums over the voxels, or linear
+    functions of them, which is the case for the signals of the CERMIT and
+    IBM experiments. For a spin density array that broadcasts to the grid
+    and varies along y or z, the blocks without spins are skipped.
+
+    :param Experiment experiment: the experiment
+    :param int max_bytes: the peak memory budget of a block [bytes]
+    :param tuple block_shape: the number of y and z points of the blocks,
+        used instead of the budget
+    :param ndarray occupancy: the block occupancy index of the spin density
+        (see ``block_occupancy``), computed from the density if None
+    :param inputs: the experiment inputs, including "grid"
+    :return: the summed results, with the structure of the experiment returns
+    :raises ValueError: if the grid is not a ``Grid``, or uses a quadrature
+        rule other than the midpoint rule, whose weights do not split into
+        blocks, or if the occupancy does not match the blocks
+    """
+
+    check_grid(inputs["grid"], "chunked execution")
+    if inputs["grid"].grid_quadrature != "midpoint":
+        raise ValueError("the chunked execution requires the midpoint quadrature")
+    if block_shape is None:
+        if max_bytes is None:
+            raise ValueError("either max_bytes or block_shape is required")
+        block_shape = budget_block_shape(experiment, max_bytes, **inputs)
+
+    grid = inputs.pop("grid")
+    slices = block_slices(grid, block_shape)
+    densities = _density_inputs(inputs, grid.grid_shape)
+    if occupancy is None and densities:
+        occupancy = np.logical_or.reduce(
+            [
+                block_occupancy(
+                    inputs[name].spin_density, block_shape, grid.grid_shape
+                )
+                for name in densities
+            ]
+        )
+    if occupancy is None:
+        occupied = [True] * len(slices)
+    elif np.size(occupancy) != len(slices):
+        raise ValueError(
+            f"the occupancy of {np.size(occupancy)} blocks does not match "
+            f"the {len(slices)} blocks of the grid"
+        )
+    else:
+        occupied = np.ravel(occupancy).tolist()
+        # an empty sample is executed on one block for the zero results
+        occupied[0] = occupied[0] or not any(occupied)
+
+    total = None
+    for (y_slice, z_slice), block_occupied in zip(slices, occupied):
+        if not block_occupied:
+            continue
+        result = experiment(**block_inputs(grid, y_slice, z_slice, **inputs))
+        if total is None:
+            total = result
+        elif isinstance(result, tuple):
+            total = tuple(np.add(a, b) for a, b in zip(total, result))
+        else:
+            total = np.add(total, result)
+    return total
@@ -2,6 +2,6 @@ from .base import ComponentBase
 from .magnet import SphereMagnet, RectangularMagnet
 from .cylindermagnet import CylinderMagnetApprox
 from .cantilever import Cantilever
-from .grid import Grid
-from .sample import Sample
+from .grid import Grid, RectilinearGrid, PointSetGrid, AdaptiveGrid, PointGrid
+from .sample import Sample, MultiSample
 
@@ -2,6 +2,7 @@
 
 from dataclasses import dataclass, asdict
 import numpy as np
+from mrfmsim.formula.math import is_separable
 
 
 @dataclass
@@ -22,15 +23,13 @@ class ComponentBase:
             if isinstance(v, float):
                 # round the float values
                 value = f"{v:{format_}}"
-            elif isinstance(v, (list, np.ndarray)):
-                # with np.set_printoptions(legacy="1.25", precision=3):
-                v = np.array(v)
-                value = np.array2string(
-                    v,
-                    suppress_small=True,
-                    separator=", ",
-                    formatter={"float": lambda x: f"{x:{format_}}"},
+            elif is_separable(v):
+                # the per-axis quadrature weights
+                value = "[{}]".format(
+                    ", ".join(self._array_string(e, format_) for e in v)
                 )
+            elif isinstance(v, (list, np.ndarray)):
+                value = self._array_string(v, format_)
             elif isinstance(v, str):
                 value = repr(v)
             else:
@@ -41,6 +40,19 @@ class ComponentBase:
             self.__class__.__name__, "\n  ".join(str_lines).strip()
         )
 
+    @staticmethod
+    def _array_string(v, format_):
+        """Format the array values with the float format."""
+
+        # with np.set_printoptions(legacy="1.25", precision=3):
+        # the batch values of shape (n, 1, 1, 1) are printed as 1D
+        return np.array2string(
+            np.array(v).squeeze(),
+            suppress_small=True,
+            separator=", ",
+            formatter={"float": lambda x: f"{x:{format_}}"},
+        )
+
     def _get_metadata(self, attr):
         """Get the metadata for the attribute.
 
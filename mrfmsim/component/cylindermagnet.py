@@ -2,6 +2,7 @@ import numpy as np
 import numba as nb
 from dataclasses import dataclass, field
 from mrfmsim.component import ComponentBase
+from mrfmsim.formula.math import split_position
 
 
 @dataclass
@@ -24,96 +25,98 @@ class CylinderMagnetApprox(ComponentBase):
 
     def __post_init__(self):
         d = self.magnet_radius / 10
+        # each bound has the batch axis of a stack of magnet origins
+        x0, y0, z0 = split_position(self.magnet_origin)
 
         self._range = np.array(
             [
                 [
-                    self.magnet_origin[0] - 3 * d,
-                    self.magnet_origin[0] + 3 * d,
-                    self.magnet_origin[1] - 10 * d,
-                    self.magnet_origin[1] + 10 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 3 * d,
+                    x0 + 3 * d,
+                    y0 - 10 * d,
+                    y0 + 10 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] - 5 * d,
-                    self.magnet_origin[0] - 3 * d,
-                    self.magnet_origin[1] - 9 * d,
-                    self.magnet_origin[1] + 9 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 5 * d,
+                    x0 - 3 * d,
+                    y0 - 9 * d,
+                    y0 + 9 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] + 3 * d,
-                    self.magnet_origin[0] + 5 * d,
-                    self.magnet_origin[1] - 9 * d,
-                    self.magnet_origin[1] + 9 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 + 3 * d,
+                    x0 + 5 * d,
+                    y0 - 9 * d,
+                    y0 + 9 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] - 7 * d,
-                    self.magnet_origin[0] - 5 * d,
-                    self.magnet_origin[1] - 8 * d,
-                    self.magnet_origin[1] + 8 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 7 * d,
+                    x0 - 5 * d,
+                    y0 - 8 * d,
+                    y0 + 8 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] + 5 * d,
-                    self.magnet_origin[0] + 7 * d,
-                    self.magnet_origin[1] - 8 * d,
-                    self.magnet_origin[1] + 8 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 + 5 * d,
+                    x0 + 7 * d,
+                    y0 - 8 * d,
+                    y0 + 8 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] - 8 * d,
-                    self.magnet_origin[0] - 7 * d,
-                    self.magnet_origin[1] - 7 * d,
-                    self.magnet_origin[1] + 7 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 8 * d,
+                    x0 - 7 * d,
+                    y0 - 7 * d,
+                    y0 + 7 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] + 7 * d,
-                    self.magnet_origin[0] + 8 * d,
-                    self.magnet_origin[1] - 7 * d,
-                    self.magnet_origin[1] + 7 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 + 7 * d,
+                    x0 + 8 * d,
+                    y0 - 7 * d,
+                    y0 + 7 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] - 9 * d,
-                    self.magnet_origin[0] - 8 * d,
-                    self.magnet_origin[1] - 5 * d,
-                    self.magnet_origin[1] + 5 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 9 * d,
+                    x0 - 8 * d,
+                    y0 - 5 * d,
+                    y0 + 5 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] + 8 * d,
-                    self.magnet_origin[0] + 9 * d,
-                    self.magnet_origin[1] - 5 * d,
-                    self.magnet_origin[1] + 5 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 + 8 * d,
+                    x0 + 9 * d,
+                    y0 - 5 * d,
+                    y0 + 5 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] - 10 * d,
-                    self.magnet_origin[0] - 9 * d,
-                    self.magnet_origin[1] - 3 * d,
-                    self.magnet_origin[1] + 3 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 - 10 * d,
+                    x0 - 9 * d,
+                    y0 - 3 * d,
+                    y0 + 3 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
                 [
-                    self.magnet_origin[0] + 9 * d,
-                    self.magnet_origin[0] + 10 * d,
-                    self.magnet_origin[1] - 3 * d,
-                    self.magnet_origin[1] + 3 * d,
-                    self.magnet_origin[2] - self.magnet_length / 2,
-                    self.magnet_origin[2] + self.magnet_length / 2,
+                    x0 + 9 * d,
+                    x0 + 10 * d,
+                    y0 - 3 * d,
+                    y0 + 3 * d,
+                    z0 - self.magnet_length / 2,
+                    z0 + self.magnet_length / 2,
                 ],
             ]
         )
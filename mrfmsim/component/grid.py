@@ -3,7 +3,43 @@
 
 import numpy as np
 from mrfmsim.component import ComponentBase
+from mrfmsim.formula.math import SeparableWeights
 from dataclasses import dataclass, field
+from typing import ClassVar
+
+
+def quadrature_weights(n, rule):
+    """Return the weights of a composite quadrature rule for n points.
+
+    The weights are in units of the step. The midpoint rule gives unit
+    weights, and the trapezoid, Simpson, and Boole rules integrate between
+    the first and the last point. An axis with a single point has a unit
+    weight for all the rules.
+
+    :param int n: number of points
+    :param str rule: "midpoint", "trapezoid", "simpson", or "boole"
+    :rtype: ndarray
+    :raises ValueError: if the number of points does not fit the rule
+    """
+
+    weights = np.ones(n)
+    if n == 1 or rule == "midpoint":
+        return weights
+    if rule == "trapezoid":
+        weights[[0, -1]] = 0.5
+        return weights
+    if rule == "simpson":
+        if (n - 1) % 2:
+            raise ValueError("the simpson rule requires an odd number of points")
+        weights[1:-1:2], weights[2:-1:2] = 4, 2
+        return weights / 3
+    if rule == "boole":
+        if (n - 1) % 4:
+            raise ValueError("the boole rule requires 4k + 1 points")
+        weights[1:-1:2], weights[2:-1:4], weights[4:-1:4] = 32, 12, 14
+        weights[[0, -1]] = 7
+        return weights * 2 / 45
+    raise ValueError(f"unknown quadrature rule {rule!r}")
 
 
 @dataclass
@@ -14,13 +50,25 @@ class Grid(ComponentBase):
     The grid array uses numpy's open mesh-grid, which has speed and storage
     benefits.
 
+    The sums over the grid use the midpoint rule by default, where each
+    point has the voxel volume. With ``grid_quadrature`` set to
+    "trapezoid", "simpson", or "boole", ``grid_voxel`` is the
+    ``SeparableWeights`` of the per-axis quadrature weights times the step,
+    each broadcastable along its axis. The sums of products multiply them
+    in separately, without a full-grid weight array. These rules integrate
+    between the edge points of the grid, and converge faster in the grid
+    step for the signals that vanish at the grid edges.
+
     :param tuple[int, int, int] grid_shape: grid dimension
         (number of points in x, y, z direction)
     :param list[float] grid_step: grid step size in x, y, z direction [nm]
     :param list[float] grid_origin: the grid origin [nm]
+    :param str grid_quadrature: the quadrature rule of the voxel weights
 
     :ivar ndarray grid_length: array of lengths along (x, y, z)
-    :ivar float grid_voxel: the volume of each grid voxel
+    :ivar grid_voxel: the volume of each grid voxel, or the
+        ``SeparableWeights`` of the per-axis weights for a quadrature rule
+    :vartype grid_voxel: float or SeparableWeights
     :ivar ndarray grid_range: range in (x, y, z direction), shape (3, 2)
     :ivar ndarray grid_length: actual lengths of the grid. This is recalculated
         based on the rounded value of grid shape and step size.
@@ -28,10 +76,15 @@ class Grid(ComponentBase):
     :ivar ndarray grid_array: the grid array in (x, y, z direction), shape (3, n)
     """
 
+    grid_point_set: ClassVar[bool] = False
+
     grid_shape: tuple[int]
     grid_step: list[float] = field(metadata={"unit": "nm", "format": ".1f"})
     grid_origin: list[float] = field(metadata={"unit": "nm", "format": ".1f"})
-    grid_voxel: float = field(init=False, metadata={"unit": "nm^3"})
+    grid_quadrature: str = "midpoint"
+    grid_voxel: float | SeparableWeights = field(
+        init=False, metadata={"unit": "nm^3"}
+    )
     grid_range: np.array = field(init=False, metadata={"unit": "nm", "format": ".1f"})
     grid_length: np.array = field(init=False, metadata={"unit": "nm", "format": ".1f"})
 
@@ -39,6 +92,13 @@ class Grid(ComponentBase):
         """Calculate grid parameters."""
 
         self.grid_voxel = np.array(self.grid_step).prod()
+        if self.grid_quadrature != "midpoint":
+            self.grid_voxel = SeparableWeights(
+                (step * quadrature_weights(n, self.grid_quadrature)).reshape(
+                    [-1 if i == axis else 1 for i in range(3)]
+                )
+                for axis, (n, step) in enumerate(zip(self.grid_shape, self.grid_step))
+            )
         self.grid_range = (np.array(self.grid_shape) - [1, 1, 1]) * self.grid_step
         self.grid_length = np.array(self.grid_shape) * np.array(self.grid_step)
         self.grid_extents = self.grid_extents_method(self.grid_range, self.grid_origin)
@@ -98,3 +158,366 @@ class Grid(ComponentBase):
 
         pts = np.floor(np.array(ext_length) / self.grid_step).astype(int)
         return self.extend_grid_by_points(pts)
+
+
+def _cell_widths(coordinate):
+    """Widths of the cells around the points, bounded at the midpoints."""
+
+    if coordinate.size == 1:
+        return np.ones(1)
+    bounds = np.concatenate(
+        (
+            [1.5 * coordinate[0] - 0.5 * coordinate[1]],
+            (coordinate[1:] + coordinate[:-1]) / 2,
+            [1.5 * coordinate[-1] - 0.5 * coordinate[-2]],
+        )
+    )
+    return np.diff(bounds)
+
+
+@dataclass
+class RectilinearGrid(ComponentBase):
+    """Instantiate a tensor-product grid with non-uniform axes.
+
+    The grid is defined by the coordinates along x, y, and z, for example
+    a uniform x axis and a log-spaced z axis. The grid array is an open
+    mesh-grid, as for ``Grid``. Each point is the center of its voxel, and
+    the voxel bounds are at the midpoints between the points. The voxel
+    volume ``grid_voxel`` is a broadcastable array of the voxel volumes,
+    which varies only along the non-uniform axes.
+
+    The step of a uniform axis is its point spacing, and the step of a
+    non-uniform axis, or an axis with a single point, is ``nan``. An axis
+    with a single point has a unit width. The grid can only be extended along the
+    uniform axes, so that the cantilever windows work if x is uniform.
+
+    :param ndarray grid_x: the increasing x coordinates [nm]
+    :param ndarray grid_y: the increasing y coordinates [nm]
+    :param ndarray grid_z: the increasing z coordinates [nm]
+
+    :ivar tuple grid_shape: number of points in x, y, z direction
+    :ivar ndarray grid_step: the step of each axis, ``nan`` for a non-uniform
+        axis [nm]
+    :ivar ndarray grid_extents: the extents of the points in (x, y, z
+        direction), as for ``Grid``, shape (3, 2) [nm]
+    :ivar ndarray grid_bounds: the outer voxel bounds in (x, y, z
+        direction), shape (3, 2) [nm]
+    """
+
+    grid_point_set: ClassVar[bool] = False
+
+    grid_x: np.ndarray = field(metadata={"unit": "nm", "format": ".1f"})
+    grid_y: np.ndarray = field(metadata={"unit": "nm", "format": ".1f"})
+    grid_z: np.ndarray = field(metadata={"unit": "nm", "format": ".1f"})
+    grid_shape: tuple[int] = field(init=False)
+    grid_step: np.ndarray = field(init=False, metadata={"unit": "nm", "format": ".1f"})
+
+    def __post_init__(self):
+        """Calculate grid parameters."""
+
+        coordinates = []
+        for name in ["grid_x", "grid_y", "grid_z"]:
+            coordinate = np.atleast_1d(np.asarray(getattr(self, name), dtype=float))
+            if np.any(np.diff(coordinate) <= 0):
+                raise ValueError(f"{name} should be strictly increasing")
+            setattr(self, name, coordinate)
+            coordinates.append(coordinate)
+
+        self.grid_shape = tuple(c.size for c in coordinates)
+        self._widths = [_cell_widths(c) for c in coordinates]
+        uniform = [
+            c.size > 1 and np.allclose(w, w[0], rtol=1e-9, atol=0)
+            for c, w in zip(coordinates, self._widths)
+        ]
+        self.grid_step = np.array(
+            [w[0] if u else np.nan for w, u in zip(self._widths, uniform)]
+        )
+        self.grid_extents = np.array([[c[0], c[-1]] for c in coordinates])
+        self.grid_bounds = np.array(
+            [
+                [c[0] - w[0] / 2, c[-1] + w[-1] / 2]
+                for c, w in zip(coordinates, self._widths)
+            ]
+        )
+
+    @property
+    def grid_array(self):
+        """Generate an open mesh-grid of the axis coordinates."""
+
+        return self._ogrid([self.grid_x, self.grid_y, self.grid_z])
+
+    @property
+    def grid_voxel(self):
+        """The broadcastable array of the voxel volumes.
+
+        A uniform axis contributes its step as a scalar factor.
+        """
+
+        volume = 1.0
+        for axis, (width, step) in enumerate(zip(self._widths, self.grid_step)):
+            if np.isnan(step):
+                shape = [1, 1, 1]
+                shape[axis] = width.size
+                volume = volume * width.reshape(shape)
+            else:
+                volume = volume * step
+        return volume
+
+    @staticmethod
+    def _ogrid(coordinates):
+        return [
+            c.reshape([-1 if i == axis else 1 for i in range(3)])
+            for axis, c in enumerate(coordinates)
+        ]
+
+    def extend_grid_by_points(self, ext_pts):
+        """Extend the grid by the number of points along the uniform axes.
+
+        :param list ext_pts: points (one side) to extend along x, y, z
+        :raises ValueError: if a non-uniform axis is extended
+        """
+
+        coordinates = []
+        for c, step, pts in zip(
+            [self.grid_x, self.grid_y, self.grid_z], self.grid_step, ext_pts
+        ):
+            pts = int(pts)
+            if pts and np.isnan(step):
+                raise ValueError("only the uniform axes of the grid can be extended")
+            if pts:
+                c = c[0] + np.arange(-pts, c.size + pts) * step
+            coordinates.append(c)
+        return self._ogrid(coordinates)
+
+    def extend_grid_by_length(self, ext_length):
+        """Extend the grid by the distance along the uniform axes.
+
+        :param list ext_length: distance (one side) to extend along x, y, z
+        """
+
+        ext_length = np.asarray(ext_length, dtype=float)
+        extended = ext_length != 0
+        if np.any(np.isnan(self.grid_step[extended])):
+            raise ValueError("only the uniform axes of the grid can be extended")
+        pts = np.zeros(3, dtype=int)
+        pts[extended] = np.floor(ext_length[extended] / self.grid_step[extended])
+        return self.extend_grid_by_points(pts)
+
+
+# the corners of a unit cell centered at the origin
+_CORNERS = np.array(
+    [[i, j, k] for i in (-1, 1) for j in (-1, 1) for k in (-1, 1)], dtype=float
+)
+
+
+@dataclass
+class PointSetGrid(ComponentBase):
+    """Base class of the grids of a flattened point set.
+
+    The subclasses define the point coordinates ``grid_points`` with the
+    shape (m, 3) and the weight of each point ``point_weights``. The
+    ``grid_array`` and ``grid_voxel`` have the shape ``(1, m, 1)``, and
+    ``grid_point_set`` marks the grid for the nodes that need a
+    rectangular grid.
+    """
+
+    grid_point_set: ClassVar[bool] = True
+
+    @property
+    def grid_size(self):
+        """Number of the grid points."""
+        return self.grid_points.shape[0]
+
+    @property
+    def grid_array(self):
+        """The x, y, z coordinates of the points, each with shape (1, m, 1)."""
+        return [self.grid_points[:, i].reshape(1, -1, 1) for i in range(3)]
+
+    @property
+    def grid_voxel(self):
+        """The weight of each point, with shape (1, m, 1)."""
+        return self.point_weights.reshape(1, -1, 1)
+
+
+@dataclass
+class AdaptiveGrid(PointSetGrid):
+    """Instantiate an adaptive grid of octree cells with per-point volumes.
+
+    The grid points are the centers of the leaf cells of an octree, and each
+    point has the volume of its cell. The points replace the open mesh-grid
+    with the flattened point set: ``grid_array`` has the shape ``(1, m, 1)``
+    for each coordinate, and ``grid_voxel`` is the array of the volumes with
+    the same shape, so that the field nodes and the sum of products run on
+    the points. The grid works with the experiments that use only
+    ``grid_array`` and ``grid_voxel``, such as the stationary tip
+    experiments and ``IBMCyclic``; the cantilever windows along x require
+    a rectangular ``Grid``.
+
+    Use ``AdaptiveGrid.from_field`` to refine the cells near the resonance
+    condition and where the resonance offset changes quickly.
+
+    :param ndarray grid_points: the point coordinates, shape (m, 3) [nm]
+    :param ndarray grid_volumes: the volume of each point, shape (m,) [nm^3]
+    """
+
+    grid_points: np.ndarray = field(metadata={"unit": "nm", "format": ".1f"})
+    grid_volumes: np.ndarray = field(metadata={"unit": "nm^3", "format": ".1f"})
+
+    def __post_init__(self):
+        self.grid_points = np.asarray(self.grid_points, dtype=float).reshape(-1, 3)
+        self.grid_volumes = np.asarray(self.grid_volumes, dtype=float).ravel()
+
+    @property
+    def point_weights(self):
+        """The volume of each point."""
+        return self.grid_volumes
+
+    @classmethod
+    def from_field(
+        cls,
+        magnet,
+        h,
+        B0,
+        f_rf,
+        Gamma,
+        grid_extents,
+        max_step,
+        min_step,
+        dB,
+        dB_max=np.inf,
+    ):
+        """Refine the cells near the resonance condition of the magnet field.
+
+        The box is divided into cells no larger than ``max_step``. The
+        resonance offset is evaluated at the corners and the center of each
+        cell, and a cell is split into eight if the range of its offsets
+        overlaps the band ``[-dB, dB]``, or if the offset changes by more
+        than ``dB_max`` across the cell. The cells are not split below
+        ``min_step``.
+
+        :param magnet: the magnet object
+        :param list h: tip-sample separation [nm]
+        :param float B0: external field [mT]
+        :param float f_rf: microwave frequency [Hz]
+        :param float Gamma: gyromagnetic ratio [rad/s.mT]
+        :param ndarray grid_extents: the box extents, shape (3, 2) [nm]
+        :param list max_step: the largest cell size in x, y, z [nm]
+        :param list min_step: the smallest cell size in x, y, z [nm]
+        :param float dB: the half width of the resonance band [mT]
+        :param float dB_max: the largest change of the resonance offset
+            across a cell [mT]
+        :rtype: AdaptiveGrid
+        """
+
+        extents = np.asarray(grid_extents, dtype=float)
+        length = extents[:, 1] - extents[:, 0]
+        shape = np.ceil(length / np.asarray(max_step) - 1e-9).astype(int)
+        size = length / shape
+        axes = [extents[i, 0] + (np.arange(shape[i]) + 0.5) * size[i] for i in range(3)]
+        centers = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+        B_res = 2 * np.pi * f_rf / Gamma
+
+        points, volumes = [], []
+        while centers.size:
+            # the offsets at the corners and the center of each cell
+            positions = np.concatenate(
+                (centers[:, np.newaxis], centers[:, np.newaxis] + _CORNERS * size / 2),
+                axis=1,
+            )
+            B_offset = (
+                B0
+                + magnet.Bz_method(*(positions - np.asarray(h, dtype=float)).T)
+                - B_res
+            ).T
+            low, high = B_offset.min(axis=1), B_offset.max(axis=1)
+            refine = ((low <= dB) & (high >= -dB)) | (high - low > dB_max)
+            if np.any(size / 2 < np.asarray(min_step) * (1 - 1e-9)):
+                refine[:] = False
+
+            points.append(centers[~refine])
+            volumes.append(np.full(np.count_nonzero(~refine), size.prod()))
+            children = centers[refine][:, np.newaxis] + _CORNERS * size / 4
+            centers, size = children.reshape(-1, 3), size / 2
+
+        return cls(
+            grid_points=np.concatenate(points), grid_volumes=np.concatenate(volumes)
+        )
+
+
+@dataclass
+class PointGrid(PointSetGrid):
+    """Instantiate a grid of arbitrary spin positions with per-point weights.
+
+    The sparse samples, such as dilute defects or molecules on a surface,
+    are represented by the positions of the spins instead of a dense grid
+    over their bounding volume. As for ``AdaptiveGrid``, ``grid_array`` is
+    the flattened point set with the shape ``(1, n, 1)`` for each
+    coordinate, and ``grid_voxel`` is the array of the weights, so that the
+    field nodes and the sums of products run on the points. With the unit
+    weights and a sample ``spin_density`` of 1, the sums count the spins.
+
+    For the experiments with the cantilever windows along x, the extended
+    grid of a point is its x trajectory sampled with ``trajectory_step``:
+    the x coordinate of the extended grid has the shape ``(2 p + 1, n, 1)``,
+    and the windows of the cantilever motion run along the first axis. The
+    cost scales with the number of points.
+
+    :param ndarray grid_points: the point coordinates, shape (n, 3) [nm]
+    :param ndarray grid_weights: the weight of each point, shape (n,),
+        defaults to ones
+    :param float trajectory_step: the x step of the cantilever trajectory
+        sampling [nm]
+
+    :ivar tuple grid_shape: the shape ``(1, n, 1)`` of the point arrays
+    :ivar list grid_step: the trajectory step in x, nan in y and z [nm]
+    """
+
+    grid_points: np.ndarray = field(metadata={"unit": "nm", "format": ".1f"})
+    grid_weights: np.ndarray = None
+    trajectory_step: float = field(default=1.0, metadata={"unit": "nm"})
+    grid_shape: tuple = field(init=False)
+    grid_step: list[float] = field(init=False, metadata={"unit": "nm"})
+
+    def __post_init__(self):
+        self.grid_points = np.asarray(self.grid_points, dtype=float).reshape(-1, 3)
+        n = self.grid_points.shape[0]
+        if self.grid_weights is None:
+            self.grid_weights = np.ones(n)
+        self.grid_weights = np.broadcast_to(
+            np.asarray(self.grid_weights, dtype=float).ravel(), (n,)
+        ).copy()
+        self.grid_shape = (1, n, 1)
+        self.grid_step = np.array([self.trajectory_step, np.nan, np.nan])
+
+    @property
+    def point_weights(self):
+        """The weight of each point."""
+        return self.grid_weights
+
+    def extend_grid_by_points(self, ext_pts):
+        """Sample the x trajectory of each point.
+
+        :param list ext_pts: points (one side) of the trajectory along x,
+            the points along y and z should be zero
+        :return: the x coordinate with the shape ``(2 p + 1, n, 1)``, and
+            the y and z coordinates of the points
+        :raises ValueError: if the points along y or z are not zero
+        """
+
+        if np.any(np.asarray(ext_pts)[1:]):
+            raise ValueError("the point grid can only be extended along x")
+        offsets = np.arange(-ext_pts[0], ext_pts[0] + 1) * self.trajectory_step
+        x, y, z = self.grid_array
+        return [x + offsets.reshape(-1, 1, 1), y, z]
+
+    def extend_grid_by_length(self, ext_length):
+        """Sample the x trajectory of each point over the distance.
+
+        :param list ext_length: distance (one side) of the trajectory along
+            x, the distance along y and z should be zero
+        """
+
+        if np.any(np.asarray(ext_length)[1:]):
+            raise ValueError("the point grid can only be extended along x")
+        pts = int(np.floor(ext_length[0] / self.trajectory_step))
+        return self.extend_grid_by_points([pts, 0, 0])
@@ -2,6 +2,7 @@ import numpy as np
 import numba as nb
 from dataclasses import dataclass, field
 from mrfmsim.component import ComponentBase
+from mrfmsim.formula.math import split_position
 
 
 @dataclass
@@ -41,9 +42,10 @@ class SphereMagnet(ComponentBase):
         magnetization in mT.
         """
 
-        dx = (x - self.magnet_origin[0]) / self.magnet_radius
-        dy = (y - self.magnet_origin[1]) / self.magnet_radius
-        dz = (z - self.magnet_origin[2]) / self.magnet_radius
+        x0, y0, z0 = split_position(self.magnet_origin)
+        dx = (x - x0) / self.magnet_radius
+        dy = (y - y0) / self.magnet_radius
+        dz = (z - z0) / self.magnet_radius
 
         pre_term = self.mu0_Ms / 3.0
 
@@ -96,9 +98,10 @@ class SphereMagnet(ComponentBase):
         :rtype: np.array
         """
 
-        dx = (x - self.magnet_origin[0]) / self.magnet_radius
-        dy = (y - self.magnet_origin[1]) / self.magnet_radius
-        dz = (z - self.magnet_origin[2]) / self.magnet_radius
+        x0, y0, z0 = split_position(self.magnet_origin)
+        dx = (x - x0) / self.magnet_radius
+        dy = (y - y0) / self.magnet_radius
+        dz = (z - z0) / self.magnet_radius
         pre_term = self.mu0_Ms / self.magnet_radius
 
         return pre_term * self._bzx(dx, dy, dz)
@@ -151,9 +154,10 @@ class SphereMagnet(ComponentBase):
         :rtype: np.array
         """
 
-        dx = (x - self.magnet_origin[0]) / self.magnet_radius
-        dy = (y - self.magnet_origin[1]) / self.magnet_radius
-        dz = (z - self.magnet_origin[2]) / self.magnet_radius
+        x0, y0, z0 = split_position(self.magnet_origin)
+        dx = (x - x0) / self.magnet_radius
+        dy = (y - y0) / self.magnet_radius
+        dz = (z - z0) / self.magnet_radius
         pre_term = self.mu0_Ms / (self.magnet_radius**2)
 
         return pre_term * self._bzxx(dx, dy, dz)
@@ -202,12 +206,15 @@ class RectangularMagnet(ComponentBase):
     mu0_Ms: float = field(metadata={"unit": "mT"})
 
     def __post_init__(self):
-        self._range = np.column_stack(
-            (
-                -np.array(self.magnet_length) / 2 + self.magnet_origin,
-                np.array(self.magnet_length) / 2 + self.magnet_origin,
+        # (x1, x2, y1, y2, z1, z2), each bound has the batch axis of a
+        # stack of magnet origins
+        self._range = [
+            sign * length / 2 + origin
+            for length, origin in zip(
+                self.magnet_length, split_position(self.magnet_origin)
             )
-        ).ravel()
+            for sign in (-1, 1)
+        ]
         self._pre_term = self.mu0_Ms / (4 * np.pi)
 
     def Bz_method(self, x, y, z):
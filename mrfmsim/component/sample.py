@@ -4,6 +4,7 @@
 import numpy as np
 from dataclasses import dataclass, field
 from mrfmsim.component import ComponentBase
+from mrfmsim.formula.math import as_batch
 
 spin_dict = {
     # note: not accounting for the g-factor of the electron spin;
@@ -50,3 +51,117 @@ class Sample(ComponentBase):
         self.J = self.J or spin_dict[self.spin]["J"]
         self.dB_hom = 1 / (self.Gamma * self.T2)  # mT
         self.dB_sat = 1 / (self.Gamma * np.sqrt(self.T1 * self.T2))  # mT
+
+
+@dataclass
+class MultiSample(ComponentBase):
+    r"""Sample with several spin species on the same grid.
+
+    The parameters are lists with one value per species, and the
+    ``temperature`` can be a single value shared by the species. The
+    attributes are stored with a leading species axis of the shape
+    ``(n, 1, 1, 1)`` (see ``formula.as_batch``), so that an experiment
+    executed with a ``MultiSample`` evaluates the field once and returns one
+    signal per species. The species axis is the last batch axis of the
+    results; other parameter batches need an axis of their own before it,
+    for example ``as_batch(B1_array)[:, np.newaxis]``.
+
+    :param list spin: spin type of each species
+    :param list T1: spin-lattice relaxation :math:`T_1` [s]
+    :param list T2: spin-spin relaxation :math:`T_2` [s]
+    :param temperature: the sample temperature, float or list [K]
+    :param list spin_density: the spin density :math:`\rho` of each species,
+        a float or an array that broadcasts to the grid; the arrays are
+        stacked on the species axis [1/nm^3]
+    :param list Gamma: spin gyromagnetic ratio [rad/s.mT]
+        defaults to None if all the spins are preset types, a None entry
+        uses the preset value of the species
+    :param list J: spin angular momentum [unitless]
+        defaults to None if all the spins are preset types
+    :param list dB_hom: homogeneous linewidth [mT]
+    :param list dB_sat: saturation linewidth [mT]
+    """
+
+    spin: list[str]
+    T1: list[float] = field(metadata={"unit": "s", "format": ".3e"})
+    T2: list[float] = field(metadata={"unit": "s", "format": ".3e"})
+    temperature: list[float] = field(metadata={"unit": "K"})
+    spin_density: list[float] = field(metadata={"unit": "1/nm^3"})
+    Gamma: list[float] = field(
+        default=None, metadata={"unit": "rad/(s.mT)", "format": ".3e"}
+    )
+    J: list[float] = field(default=None, metadata={"format": ".1f"})
+    dB_hom: list[float] = field(init=False, default=None, metadata={"unit": "mT"})
+    dB_sat: list[float] = field(init=False, default=None, metadata={"unit": "mT"})
+
+    def __post_init__(self):
+        n = len(self.spin)
+        Gamma = self.Gamma or [None] * n
+        J = self.J or [None] * n
+
+        def species(values):
+            values = np.broadcast_to(np.asarray(values, dtype=np.float64), (n,))
+            return as_batch(values)
+
+        self.Gamma = species(
+            [g or spin_dict[spin]["Gamma"] for g, spin in zip(Gamma, self.spin)]
+        )
+        self.J = species([j or spin_dict[spin]["J"] for j, spin in zip(J, self.spin)])
+        self.T1 = species(self.T1)
+        self.T2 = species(self.T2)
+        self.temperature = species(self.temperature)
+        self.spin_density = self._species_density(self.spin_density, n)
+        self.dB_hom = 1 / (self.Gamma * self.T2)  # mT
+        self.dB_sat = 1 / (self.Gamma * np.sqrt(self.T1 * self.T2))  # mT
+
+    @staticmethod
+    def _species_density(spin_density, n):
+        """Stack the spin density of each species on the species axis.
+
+        The scalar densities give the shape ``(n, 1, 1, 1)``, and the arrays
+        are broadcast against each other with the grid axes.
+        """
+
+        if np.isscalar(spin_density) or all(np.ndim(v) == 0 for v in spin_density):
+            values = np.asarray(spin_density, dtype=np.float64)
+            return as_batch(np.broadcast_to(values, (n,)))
+
+        if len(spin_density) != n:
+            raise ValueError(
+                f"spin_density has {len(spin_density)} entries for {n} species"
+            )
+        densities = [np.asarray(v, dtype=np.float64) for v in spin_density]
+        if any(v.ndim > 3 for v in densities):
+            raise ValueError(
+                "the spin density of each species should have at most the "
+                "three grid axes"
+            )
+        try:
+            shape = np.broadcast_shapes(*(v.shape for v in densities), (1, 1, 1))
+        except ValueError:
+            shapes = ", ".join(str(v.shape) for v in densities)
+            raise ValueError(
+                f"the spin densities of the species do not broadcast: {shapes}"
+            ) from None
+        return np.stack([np.broadcast_to(v, shape) for v in densities])
+
+    @classmethod
+    def from_samples(cls, samples):
+        """Combine single-species samples into a ``MultiSample``.
+
+        :param list samples: ``Sample`` objects, one per species
+        :rtype: MultiSample
+        """
+
+        def values(attr):
+            return [getattr(sample, attr) for sample in samples]
+
+        return cls(
+            spin=values("spin"),
+            T1=values("T1"),
+            T2=values("T2"),
+            temperature=values("temperature"),
+            spin_density=values("spin_density"),
+            Gamma=values("Gamma"),
+            J=values("J"),
+        )
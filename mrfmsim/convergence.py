@@ -0,0 +1,202 @@
+"""Refine the grid until the signal converges and extrapolate the result.
+
+The experiment is executed on the input grid and on successively refined
+grids, where each refinement halves the step of the axes with more than one
+point and keeps the grid range, so that the refined grid contains the points
+of the coarser grid. The field nodes of the grid, such as "Bz" and "Bzxx",
+are evaluated only at the new points of each level, and the coarse values
+are reused at the shared points.
+
+With the values :math:`A_h` and :math:`A_{h/2}` of two levels and the
+convergence order :math:`p`, the Richardson extrapolation is
+
+.. math::
+
+    R = A_{h/2} + \\frac{A_{h/2} - A_h}{2^p - 1}
+
+and :math:`|R - A_{h/2}|` is the estimated discretization error of the
+finest level, which is used as the error bar. Without a known order, the
+order is estimated from the last three levels as
+:math:`p = \\log_2 [(A_{h/2} - A_h) / (A_{h/4} - A_{h/2})]`, and the
+levels that oscillate or diverge are not extrapolated.
+
+The midpoint rule integrates over ``grid_length``, which shrinks by half a
+step with each refinement. The extrapolation is reliable if the signal
+vanishes at the grid edges, or with the trapezoid, Simpson, or Boole
+quadrature of ``Grid``, which integrate over the fixed grid range.
+"""
+
+from collections import namedtuple
+import numpy as np
+from mmodel.utility import graph_topological_sort
+from mrfmsim.chunk import check_grid
+from mrfmsim.component import Grid
+from mrfmsim.formula.math import GRID_NDIM
+from mrfmsim.plan import node_inputs
+from mrfmsim.resonant import GATHER_FUNCS, gathered_grid
+
+Extrapolation = namedtuple(
+    "Extrapolation", ["value", "error", "order", "grid", "values", "converged"]
+)
+Extrapolation.__doc__ = """The extrapolated result of the grid refinement.
+
+:param value: the Richardson extrapolated value
+:param error: the estimated discretization error of the finest level
+:param order: the convergence order used in the extrapolation
+:param Grid grid: the finest grid
+:param list values: the value of each level, from the coarsest
+:param bool converged: whether the error is within the tolerance
+"""
+
+
+def refine_grid(grid):
+    """Halve the step of the grid axes with more than one point.
+
+    The refined grid has the same origin and range, and contains the
+    points of the grid at the even indices.
+
+    :param Grid grid: the grid
+    :rtype: Grid
+    """
+
+    shape = np.array(grid.grid_shape)
+    refined = shape > 1
+    return Grid(
+        grid_shape=tuple(int(n) for n in np.where(refined, 2 * shape - 1, shape)),
+        grid_step=np.where(refined, np.array(grid.grid_step) / 2, grid.grid_step),
+        grid_origin=grid.grid_origin,
+        grid_quadrature=grid.grid_quadrature,
+    )
+
+
+def richardson(values, order=None):
+    """Extrapolate the values of successively halved steps.
+
+    :param list values: the values of the levels, at least two with the
+        order and three without
+    :param float order: the convergence order, estimated from the last three
+        values if None
+    :return: the extrapolated value, the error estimate, and the order;
+        the error is inf where the estimated order is not positive
+    :rtype: tuple
+    """
+
+    diff = np.subtract(values[-1], values[-2])
+    if order is None:
+        previous = np.subtract(values[-2], values[-3])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            order = np.log2(previous / diff)
+        # the identical levels are exact, and the oscillating or diverging
+        # levels are outside of the asymptotic range
+        order = np.where(diff == 0, np.inf, np.nan_to_num(order, nan=0.0))
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        correction = np.where(diff == 0, 0.0, diff / (2.0**order - 1))
+    correction = np.where(np.asarray(order) > 0, correction, 0.0)
+    error = np.where(np.asarray(order) > 0, np.abs(correction), np.inf)
+    return values[-1] + correction, error, order
+
+
+def _refined_field(node_object, kwargs, coarse, grid_shape):
+    """Evaluate the field node at the new points of the refined grid."""
+
+    batch = np.shape(coarse)[:-GRID_NDIM]
+    new = np.ones(grid_shape, dtype=bool)
+    new[::2, ::2, ::2] = False
+    index = np.flatnonzero(new)
+
+    kwargs["grid_array"] = gathered_grid(kwargs["grid_array"], index)
+    gathered = node_object.node_func(**kwargs)
+    value = np.empty(batch + grid_shape, dtype=np.result_type(coarse, gathered))
+    value[..., ::2, ::2, ::2] = coarse
+    value.reshape(batch + (-1,))[..., index] = np.reshape(gathered, batch + (-1,))
+    return value
+
+
+def _level_run(experiment, fields, **inputs):
+    """Execute the experiment and reuse the fields of the coarser level.
+
+    The ``fields`` are the field values of the coarser level by node, and
+    are replaced by the values of this level.
+    """
+
+    graph = experiment.graph
+    values = node_inputs(experiment, inputs)
+    grid_shape = tuple(inputs["grid"].grid_shape)
+    coarse_shape = tuple((n + 1) // 2 for n in grid_shape)
+
+    for name, node_attr in graph_topological_sort(graph):
+        node_object = node_attr["node_object"]
+        parameters = node_attr["signature"].parameters
+        kwargs = {key: values[key] for key in parameters}
+        coarse = fields.get(name)
+        if coarse is not None and np.shape(coarse)[-GRID_NDIM:] == coarse_shape:
+            value = _refined_field(node_object, kwargs, coarse, grid_shape)
+        else:
+            value = node_object.node_func(**kwargs)
+        if node_object.func in GATHER_FUNCS and "grid_array" in parameters:
+            fields[name] = value
+        values[node_attr["output"]] = value
+
+    result = tuple(values[name] for name in experiment.returns)
+    return result if len(result) > 1 else result[0]
+
+
+def converge_run(
+    experiment,
+    output=None,
+    rtol=1e-3,
+    atol=0.0,
+    order=None,
+    max_refinements=3,
+    **inputs,
+):
+    """Refine the grid until the extrapolated value is within the tolerance.
+
+    The refinement stops when the error estimate is within
+    ``atol + rtol * abs(value)`` for all the elements of the value, or after
+    ``max_refinements`` refinements; ``converged`` of the result is False in
+    the latter case.
+
+    :param Experiment experiment: the experiment
+    :param str output: the returned value to converge, required if the
+        experiment has more than one return
+    :param float rtol: the relative tolerance of the error
+    :param float atol: the absolute tolerance of the error
+    :param float order: the convergence order of the grid step, for example
+        2 for the midpoint and trapezoid rules, estimated from the levels if
+        None
+    :param int max_refinements: the maximum number of refinements
+    :param inputs: the experiment inputs, including the coarsest "grid"
+    :rtype: Extrapolation
+    :raises ValueError: if the grid is not a ``Grid``, or if ``output`` is
+        missing for an experiment with more than one return
+    """
+
+    check_grid(inputs["grid"], "grid convergence")
+    if len(experiment.returns) > 1 and output is None:
+        raise ValueError(
+            f"output is required for the experiment returns {experiment.returns}"
+        )
+
+    grid = inputs.pop("grid")
+    fields = {}
+    values = []
+    value, error, fitted = None, np.inf, order
+    for level in range(max_refinements + 1):
+        if level:
+            grid = refine_grid(grid)
+        result = _level_run(experiment, fields, grid=grid, **inputs)
+        if len(experiment.returns) > 1:
+            result = result[experiment.returns.index(output)]
+        values.append(result)
+
+        if len(values) < (2 if order is None else 1) + 1:
+            continue
+        value, error, fitted = richardson(values, order)
+        if np.all(error <= atol + rtol * np.abs(value)):
+            return Extrapolation(value, error, fitted, grid, values, True)
+
+    if value is None:
+        value = values[-1]
+    return Extrapolation(value, error, fitted, grid, values, False)
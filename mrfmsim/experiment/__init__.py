@@ -1,5 +1,5 @@
 from .cermitesr import CermitESRGroup
-from .ibmcyclic import IBMCyclic
+from .ibmcyclic import IBMCyclic, IBMCyclicSweep
 from .cermittd import CermitTDGroup
 from .cermitarp import CermitARPGroup
 from .cermitsinglespin import CermitSingleSpinGroup
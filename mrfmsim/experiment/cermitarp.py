@@ -7,7 +7,13 @@ node_objects = [
         "rel_dpol arp",
         formula.rel_dpol_arp,
         output="rel_dpol",
-    )
+    ),
+    Node("Bz index", formula.field_index, output="Bz_index"),
+    Node(
+        "spring constant shift sweep",
+        formula.sweep_dk_spin_arp,
+        output="dk_spin",
+    ),
 ]
 
 CermitARP_edges = [
@@ -24,6 +30,21 @@ CermitARPSmallTip_edges = [
     [["mz_eq", "Bzxx trapz", "rel_dpol arp"], "spring constant shift trapz"],
 ]
 
+CermitARPSmallTipAmplitudeSweep_edges = [
+    ["Bz", "B_tot"],
+    ["B_tot", ["mz_eq", "B_offset"]],
+    ["B_offset", "rel_dpol arp"],
+    [
+        ["mz_eq", "Bzxx trapz batch", "rel_dpol arp"],
+        "spring constant shift trapz batch",
+    ],
+]
+
+CermitARPSweep_edges = [
+    ["Bz", "Bz index"],
+    [["Bz index", "Bzxx"], "spring constant shift sweep"],
+]
+
 experiment_recipes = {
     "CermitARP": {
         "grouped_edges": CermitARP_edges,
@@ -33,6 +54,17 @@ experiment_recipes = {
         "grouped_edges": CermitARPSmallTip_edges,
         "doc": "Simulate CERMIT ARP for a small tip.",
     },
+    "CermitARPSmallTipAmplitudeSweep": {
+        "grouped_edges": CermitARPSmallTipAmplitudeSweep_edges,
+        "doc": "Simulate CERMIT ARP for a small tip over an array of cantilever "
+        "amplitudes x_0p_array, with one magnet evaluation for all amplitudes.",
+    },
+    "CermitARPSweep": {
+        "grouped_edges": CermitARPSweep_edges,
+        "param_defaults": {"rel_dpol_tol": 1e-6},
+        "doc": "Simulate CERMIT ARP for a large tip over arrays of B0 and f_rf, "
+        "evaluated only on the resonant slice of each sweep point.",
+    },
 }
 
 docstring = """\
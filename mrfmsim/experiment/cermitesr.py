@@ -5,12 +5,33 @@ from .stdelements import STANDARD_NODES, STANDARD_COMPONENTS
 
 node_objects = [
     Node("minimum absolute x offset", func=formula.min_abs_offset, output="B_offset"),
+    Node(
+        "minimum absolute x offset nested",
+        func=formula.min_abs_offset_nested,
+        output="B_offset",
+    ),
     Node("rel_dpol sat", func=formula.rel_dpol_sat_steadystate, output="rel_dpol"),
     Node(
         "rel_dpol periodic_irrad",
         func=formula.rel_dpol_periodic_irrad,
         output="rel_dpol",
     ),
+    Node("spectrum weight", formula.spectrum_weight, output="spectrum_weight"),
+    Node(
+        "spring constant shift spectrum",
+        formula.spectrum_sat_steadystate,
+        inputs=[
+            "B_tot",
+            "spectrum_weight",
+            "f_rf_array",
+            "Gamma",
+            "B1",
+            "dB_sat",
+            "dB_hom",
+            "bin_oversample",
+        ],
+        output="dk_spin",
+    ),
 ]
 
 
@@ -24,6 +45,19 @@ CermitESR_edges = [
     [["mz_eq", "Bzxx", "rel_dpol sat"], "spring constant shift"],
     ["spring constant shift", "frequency shift"],
 ]
+CermitESRMwSweep_edges = [
+    ["grid extended nested", "Bz extended"],
+    ["Bz extended", "B_tot extended"],
+    ["B_tot extended", ["B_offset extended", "B_tot sliced"]],
+    ["B_tot sliced", "mz_eq"],
+    [
+        ["B_offset extended", "x_0p window pts array"],
+        "minimum absolute x offset nested",
+    ],
+    ["minimum absolute x offset nested", "rel_dpol sat"],
+    [["mz_eq", "Bzxx", "rel_dpol sat"], "spring constant shift batch"],
+    ["spring constant shift batch", "frequency shift"],
+]
 CermitESRStationaryTip_edges = [
     ["Bz", "B_tot"],
     ["B_tot", ["mz_eq", "B_offset"]],
@@ -41,6 +75,19 @@ CermitESRSmallTip_edges = [
     [["mz_eq", "Bzxx trapz", "rel_dpol sat"], "spring constant shift trapz"],
     ["spring constant shift trapz", "frequency shift"],
 ]
+CermitESRSmallTipAmplitudeSweep_edges = [
+    ["grid extended", "Bz extended"],
+    ["Bz extended", "B_tot extended"],
+    ["B_tot extended", ["B_offset extended", "B_tot sliced"]],
+    ["B_tot sliced", "mz_eq"],
+    [["B_offset extended", "x_0p window pts"], "minimum absolute x offset"],
+    ["minimum absolute x offset", "rel_dpol sat"],
+    [
+        ["mz_eq", "Bzxx trapz batch", "rel_dpol sat"],
+        "spring constant shift trapz batch",
+    ],
+    ["spring constant shift trapz batch", "frequency shift"],
+]
 CermitESRStationaryTipPulsed_edges = [
     ["Bz", "B_tot"],
     ["B_tot", ["mz_eq", "B_offset"]],
@@ -48,12 +95,24 @@ CermitESRStationaryTipPulsed_edges = [
     [["mz_eq", "Bzxx", "rel_dpol periodic_irrad"], "spring constant shift"],
     ["spring constant shift", "frequency shift"],
 ]
+CermitESRStationaryTipSpectrum_edges = [
+    ["Bz", "B_tot"],
+    ["B_tot", "mz_eq"],
+    [["Bzxx", "mz_eq"], "spectrum weight"],
+    [["B_tot", "spectrum weight"], "spring constant shift spectrum"],
+    ["spring constant shift spectrum", "frequency shift"],
+]
 
 experiment_recipes = {
     "CermitESR": {
         "grouped_edges": CermitESR_edges,
         "doc": "CERMIT ESR experiment for a large tip.",
     },
+    "CermitESRMwSweep": {
+        "grouped_edges": CermitESRMwSweep_edges,
+        "doc": "CERMIT ESR experiment for a large tip over an array of microwave "
+        "amplitudes mw_x_0p_array, with one extended field for all amplitudes.",
+    },
     "CermitESRStationaryTip": {
         "grouped_edges": CermitESRStationaryTip_edges,
         "doc": "CERMIT ESR experiment for a stationary tip.",
@@ -62,10 +121,21 @@ experiment_recipes = {
         "grouped_edges": CermitESRSmallTip_edges,
         "doc": "CERMIT ESR experiment for a small tip.",
     },
+    "CermitESRSmallTipAmplitudeSweep": {
+        "grouped_edges": CermitESRSmallTipAmplitudeSweep_edges,
+        "doc": "CERMIT ESR experiment for a small tip over an array of cantilever "
+        "amplitudes x_0p_array, with one magnet evaluation for all amplitudes.",
+    },
     "CermitESRStationaryTipPulsed": {
         "grouped_edges": CermitESRStationaryTipPulsed_edges,
         "doc": "CERMIT ESR experiment for a stationary tip with a pulsed microwave.",
     },
+    "CermitESRStationaryTipSpectrum": {
+        "grouped_edges": CermitESRStationaryTipSpectrum_edges,
+        "param_defaults": {"bin_oversample": 4},
+        "doc": "CERMIT ESR spectrum over an evenly spaced f_rf_array for a "
+        "stationary tip, computed from a weighted field histogram.",
+    },
 }
 
 
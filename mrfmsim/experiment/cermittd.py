@@ -4,6 +4,9 @@ from .stdelements import STANDARD_NODES, STANDARD_COMPONENTS
 
 node_objects = [
     Node("rel_dpol td_sat", formula.rel_dpol_sat_td, output="rel_dpol"),
+    Node(
+        "rel_dpol td_sat nested", formula.rel_dpol_sat_td_nested, output="rel_dpol"
+    ),
     Node("rel_dpol small_steps", formula.rel_dpol_sat_td_smallsteps, output="rel_dpol"),
     Node("rel_dpol averaged", formula.rel_dpol_multipulse, output="rel_dpol_avg"),
     Node(
@@ -13,6 +16,13 @@ node_objects = [
         output="dk_spin",
         doc="Calculate dk_spin account for the negative sign in the approximation.",
     ),
+    Node(
+        "spring constant shift td batch",
+        formula.neg_sum_of_product,
+        inputs=["rel_dpol_avg", "Bzxx", "mz_eq", "spin_density", "grid_voxel"],
+        output="dk_spin",
+        doc="Calculate dk_spin for each window of the rel_dpol_avg batch.",
+    ),
     Node(
         "spring constant shift trapz td",
         formula.sum_of_product,
@@ -32,6 +42,17 @@ CermitTD_edges = [
     ["spring constant shift td", "frequency shift"],
 ]
 
+CermitTDMwSweep_edges = [
+    ["grid extended nested", "Bz extended"],
+    ["Bz extended", "B_tot extended"],
+    ["B_tot extended", ["B_tot sliced", "B_offset extended"]],
+    ["B_tot sliced", "mz_eq"],
+    [["B_offset extended", "Bzx", "x_0p window pts array"], "rel_dpol td_sat nested"],
+    ["rel_dpol td_sat nested", "rel_dpol averaged"],
+    [["mz_eq", "Bzxx", "rel_dpol averaged"], "spring constant shift td batch"],
+    ["spring constant shift td batch", "frequency shift"],
+]
+
 CermitTDSmallTip_edges = [
     ["grid extended", ["Bz extended", "Bzx extended"]],
     ["Bz extended", "B_tot extended"],
@@ -48,6 +69,12 @@ experiment_recipes = {
         "grouped_edges": CermitTD_edges,
         "doc": "Time-dependent CERMIT experiment for a large tip.",
     },
+    "CermitTDMwSweep": {
+        "grouped_edges": CermitTDMwSweep_edges,
+        "doc": "Time-dependent CERMIT experiment for a large tip over an array of "
+        "microwave amplitudes mw_x_0p_array, with one extended field for all "
+        "amplitudes.",
+    },
     "CermitTDSmallTip": {
         "grouped_edges": CermitTDSmallTip_edges,
         "doc": "Time-dependent CERMIT experiment for a small tip.",
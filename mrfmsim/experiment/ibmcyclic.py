@@ -69,3 +69,47 @@ IBMCyclic = Experiment(
     doc=docstring,
     components=components,
 )
+
+
+# The sweep experiment evaluates the signals over arrays of B0 and f_rf
+# on the resonant slice of each point, using the sorted tip field.
+
+sweep_node_objects = [
+    Node(
+        "Bz", formula.field_func, inputs=["Bz_method", "grid_array", "h"], output="Bz"
+    ),
+    Node("Bz index", formula.field_index, output="Bz_index"),
+    Node(
+        "Bzx",
+        formula.field_func,
+        inputs=["Bzx_method", "grid_array", "h"],
+        output="Bzx",
+    ),
+    Node("force signal sweep", formula.sweep_dF_spin_ibm_cyclic, output="dF_spin"),
+    Node(
+        "force variance signal sweep",
+        formula.sweep_dF2_spin_ibm_cyclic,
+        output="dF2_spin",
+    ),
+]
+
+sweep_grouped_edges = [
+    ["Bz", "Bz index"],
+    [["Bz index", "Bzx"], ["force signal sweep", "force variance signal sweep"]],
+]
+
+sweep_docstring = """\
+Simulate an IBM-style cyclic-inversion experiment over arrays of B0 and f_rf.
+
+The signals are evaluated only on the resonant slice of each sweep point."""
+
+IBMCyclicSweep_graph = Graph(name="ibm_cyclic_sweep_graph")
+IBMCyclicSweep_graph.add_grouped_edges_from(sweep_grouped_edges)
+IBMCyclicSweep_graph.add_node_objects_from(sweep_node_objects)
+
+IBMCyclicSweep = Experiment(
+    "IBMCyclicSweep",
+    IBMCyclicSweep_graph,
+    doc=sweep_docstring,
+    components=components,
+)
@@ -15,6 +15,7 @@ This behavior is allowed in the individual w
 
 from mrfmsim.node import Node
 from mrfmsim import formula
+import numpy as np
 import operator
 
 
@@ -23,6 +24,18 @@ def extend_grid_by_length_x(extend_grid_by_length, mw_x_0p):
     return extend_grid_by_length([mw_x_0p, 0, 0])
 
 
+def extend_grid_by_length_x_max(extend_grid_by_length, mw_x_0p_array):
+    """Extend the grid in x by the largest of the given lengths."""
+    return extend_grid_by_length([np.max(mw_x_0p_array), 0, 0])
+
+
+def convert_grid_pts_array(mw_x_0p_array, grid_step):
+    """Convert each distance to ext points."""
+    return np.array(
+        [formula.convert_grid_pts(d, grid_step) for d in np.ravel(mw_x_0p_array)]
+    )
+
+
 STANDARD_NODES = (
     # standard and extended field calculation
     Node(
@@ -30,6 +43,11 @@ STANDARD_NODES = (
         extend_grid_by_length_x,
         output="ext_grid",
     ),
+    Node(
+        "grid extended nested",
+        extend_grid_by_length_x_max,
+        output="ext_grid",
+    ),
     Node(
         "Bz",
         formula.field_func,
@@ -61,6 +79,19 @@ STANDARD_NODES = (
         output="Bzxx",
     ),
     Node("Bzxx trapz", formula.xtrapz_field_gradient, output="Bzxx_trapz"),
+    Node(
+        "Bzxx trapz batch",
+        formula.xtrapz_field_gradient_batch,
+        inputs=[
+            "Bzx_method",
+            "grid_array",
+            "h",
+            "trapz_pts",
+            "x_0p_array",
+            "grid_point_set",
+        ],
+        output="Bzxx_trapz_batch",
+    ),
     Node(
         "B_tot",
         operator.add,
@@ -95,6 +126,11 @@ STANDARD_NODES = (
         inputs=["mw_x_0p", "grid_step"],
         output="ext_pts",
     ),
+    Node(
+        "x_0p window pts array",
+        func=convert_grid_pts_array,
+        output="ext_pts_array",
+    ),
     # signal
     Node("mz_eq", func=formula.mz_eq, output="mz_eq"),
     Node(
@@ -110,6 +146,26 @@ STANDARD_NODES = (
         inputs=["Bzxx_trapz", "rel_dpol", "mz_eq", "spin_density", "grid_voxel"],
         output="dk_spin",
     ),
+    Node(
+        "spring constant shift trapz batch",
+        formula.sum_of_product,
+        inputs=[
+            "Bzxx_trapz_batch",
+            "rel_dpol",
+            "mz_eq",
+            "spin_density",
+            "grid_voxel",
+        ],
+        output="dk_spin",
+        doc="Calculate dk_spin for each cantilever amplitude.",
+    ),
+    Node(
+        "spring constant shift batch",
+        formula.neg_sum_of_product,
+        inputs=["rel_dpol", "Bzxx", "mz_eq", "spin_density", "grid_voxel"],
+        output="dk_spin",
+        doc="Calculate dk_spin for each window of the rel_dpol batch.",
+    ),
     Node(
         "frequency shift",
         operator.mul,
@@ -136,6 +192,7 @@ STANDARD_COMPONENTS = {
         "grid_voxel",
         "grid_shape",
         "grid_step",
+        "grid_point_set",
         "extend_grid_by_length",
     ],
     "cantilever": ["k2f_modulated"],
@@ -3,3 +3,5 @@ from .magnetization import *
 from .field import *
 from .math import *
 from .misc import *
+from .spectrum import *
+from .sweep import *
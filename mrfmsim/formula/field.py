@@ -1,12 +1,10 @@
 """Calculations related to the magnetic field."""
 
 import numpy as np
-import numba as nb
-from .math import as_strided_x
-from operator import sub
+from .math import as_strided_x, elementwise, x_axis, slice_x, split_position
 
 
-@nb.jit(nopython=True, parallel=True)
+@elementwise
 def B_offset(B_tot, f_rf, Gamma):
     """Calculate the resonance offset."""
     return B_tot - 2 * np.pi * f_rf / Gamma
@@ -55,15 +53,57 @@ def min_abs_offset(ext_B_offset, ext_pts):
     :param int ext_pts: number of grid points used to determine the minimum offset
     """
     window = 2 * ext_pts + 1
-    b_offset_strided = as_strided_x(ext_B_offset, window)
-    b_offset_abs_strided = as_strided_x(abs(ext_B_offset), window)
+    axis = x_axis(ext_B_offset)
+    b_offset_strided = as_strided_x(ext_B_offset, window, axis)
+    b_offset_abs_strided = as_strided_x(abs(ext_B_offset), window, axis)
 
-    return b_offset_abs_strided.min(axis=1) * np.logical_or(
-        np.all(b_offset_strided > 0, axis=1),
-        np.all(b_offset_strided < 0, axis=1),
+    return b_offset_abs_strided.min(axis=axis + 1) * np.logical_or(
+        np.all(b_offset_strided > 0, axis=axis + 1),
+        np.all(b_offset_strided < 0, axis=axis + 1),
     )
 
 
+def min_abs_offset_nested(ext_B_offset, ext_pts_array):
+    """Minimum absolute offset for an array of cantilever windows.
+
+    The ``ext_B_offset`` is the offset on the grid extended by the largest
+    of ``ext_pts_array``. The windows of all the amplitudes are centered on
+    the same grid points, so the window minimum and the sign of the offset
+    are updated incrementally as the window grows by one point on each
+    side, and recorded when the window reaches each of ``ext_pts_array``.
+    The result for each window equals ``min_abs_offset`` on the extended
+    grid of that window.
+
+    :param float ext_B_offset: resonance offset of extended grid [mT]
+    :param ndarray ext_pts_array: the number of points (one side) of the
+        cantilever window for each amplitude
+    :return: the offsets with the shape ``(len(ext_pts_array),) + grid_shape``
+    """
+
+    ext_pts_array = np.atleast_1d(ext_pts_array).astype(int)
+    ext_max = ext_pts_array.max()
+    ext_B_offset = np.asarray(ext_B_offset, dtype=np.float64)
+    n_x = ext_B_offset.shape[x_axis(ext_B_offset)] - 2 * ext_max
+
+    center = slice_x(ext_B_offset, ext_max, ext_max + n_x)
+    window_min = np.abs(center)
+    all_positive = center > 0
+    all_negative = center < 0
+
+    result = np.empty((ext_pts_array.size,) + center.shape)
+    ext_pts = 0
+    for i in np.argsort(ext_pts_array, kind="stable"):
+        while ext_pts < ext_pts_array[i]:
+            ext_pts += 1
+            for start in (ext_max - ext_pts, ext_max + ext_pts):
+                edge = slice_x(ext_B_offset, start, start + n_x)
+                np.minimum(window_min, np.abs(edge), out=window_min)
+                all_positive &= edge > 0
+                all_negative &= edge < 0
+        result[i] = window_min * np.logical_or(all_positive, all_negative)
+    return result
+
+
 def xtrapz_fxdtheta(method, ogrid, n_pts, xrange, x_0p):
     r"""Calculate the integral of a function over a range of theta.
 
@@ -75,30 +115,27 @@ def xtrapz_fxdtheta(method, ogrid, n_pts, xrange, x_0p):
     """
 
     theta = np.linspace(xrange[0], xrange[1], n_pts)
-    grid_shape = tuple(np.prod(list(map(np.shape, ogrid)), axis=0))
-    grid_shape_x = grid_shape[0]
-    grid_dim = len(grid_shape)
-
-    # calculate the new grid
-    new_ogrid_shape = np.ones(grid_dim)
-    new_ogrid_shape[0] = n_pts * grid_shape_x
-    new_ogrid_shape = new_ogrid_shape.astype(int)
+    grid_shape = np.broadcast_shapes(*map(np.shape, ogrid))
+    grid_dim = len(ogrid)
+    # the leading batch axes of a stack of tip-sample separations
+    axis = len(grid_shape) - grid_dim
 
     # expand the dimension to (pts, 1, 1, 1)
     # expand the x grid dimension to (1, x_shape, 1, 1)
     # The result of addition is (pts, x_shape, 1, 1)
     # the final (x, y, z) is (pts * x_shape, 1, 1)
-    grid_x = np.expand_dims(ogrid[0], axis=0)
+    grid_x = np.expand_dims(ogrid[0], axis=axis)
     dx = np.expand_dims(x_0p * np.cos(theta), axis=list(range(1, grid_dim + 1)))
-    new_ogrid = [(grid_x - dx).reshape(new_ogrid_shape)] + list(ogrid[1:])
+    new_x = grid_x - dx
+    new_x = new_x.reshape(new_x.shape[:axis] + (-1,) + new_x.shape[axis + 2 :])
 
     # calculate the integral
     # new grid shape is (trapz_pts, x_shape, y_shape, z_shape)
     # dx has the shape of (trapz_pts, 1, 1, 1)
     # The multiplication is also an optimization here
-    new_grid_shape = (n_pts,) + grid_shape
-    integrand = method(*new_ogrid).reshape(new_grid_shape) * dx
-    return np.trapz(integrand, x=theta, axis=0)
+    new_grid_shape = grid_shape[:axis] + (n_pts,) + grid_shape[axis:]
+    integrand = method(new_x, *ogrid[1:]).reshape(new_grid_shape) * dx
+    return np.trapz(integrand, x=theta, axis=axis)
 
 
 def xtrapz_field_gradient(Bzx_method, grid_array, h, trapz_pts, x_0p):
@@ -117,14 +154,139 @@ def xtrapz_field_gradient(Bzx_method, grid_array, h, trapz_pts, x_0p):
         In this particular implementation, the number is divided by 2 for
         [:math:`-\pi/2`, 0 ] integration.
     """
-    grid = list(map(sub, grid_array, h))
+    grid = _shift_grid(grid_array, h)
     n_pts = int(trapz_pts / 2)
     integral = 2 * xtrapz_fxdtheta(Bzx_method, grid, n_pts, [-np.pi, 0], x_0p)
     return integral / x_0p**2 / np.pi
 
 
+# the fine x line of xtrapz_field_gradient_batch has this many points per
+# grid step, and the shifted grids are interpolated with cubic polynomials
+LINE_REFINE = 8
+
+
+def _cubic_weights(t):
+    """Lagrange weights of the points -1, 0, 1, 2 at the fraction t."""
+
+    return (
+        -t * (t - 1) * (t - 2) / 6,
+        (t + 1) * (t - 1) * (t - 2) / 2,
+        -(t + 1) * t * (t - 2) / 2,
+        (t + 1) * t * (t - 1) / 6,
+    )
+
+
+def xtrapz_field_gradient_batch(
+    Bzx_method, grid_array, h, trapz_pts, x_0p_array, grid_point_set=False
+):
+    r"""Calculate the CERMIT trapezoidal integral for an array of amplitudes.
+
+    The magnet method is evaluated once on a fine uniform x line, with
+    ``LINE_REFINE`` points per grid step, that covers the grid shifted by
+    the largest amplitude. A grid shifted by :math:`x_{0p} \cos\theta` has
+    the same fractional offset on the line at all its x points, so the
+    shifted field is the cubic interpolation of four strided slices of the
+    line, and the integrand of each amplitude is accumulated one
+    :math:`\theta` at a time with the memory of the grid. The result
+    differs from ``xtrapz_field_gradient`` by the interpolation error,
+    which is of the fourth order in the line step.
+
+    The fine line requires an open mesh-grid with a uniform x axis of more
+    than one point; for a point set, marked by ``grid_point_set``, or a
+    non-uniform x axis, each amplitude is evaluated with
+    ``xtrapz_field_gradient``.
+
+    The amplitude axes lead the result. With the parameter batches, such as
+    the species of a ``MultiSample``, use ``x_0p_array[:, np.newaxis]`` so
+    that the amplitude axis comes before the parameter batch axis.
+
+    :param list grid_array: ogrid generated by a numpy ogrid, or the
+        coordinates of a point set
+    :param list h: tip-sample separation, or a stack of separations with
+        the shape ``(n, 3)``
+    :param int trapz_pts: points to integrate across :math:`\pi`
+    :param ndarray x_0p_array: the cantilever zero-to-peak amplitudes [nm]
+    :param bool grid_point_set: whether the grid array is a point set
+    :return: the gradients with the shape ``x_0p_array.shape + grid_shape``,
+        or ``x_0p_array.shape + (n,) + grid_shape`` for a stack of
+        separations [mT/nm^2]
+    """
+
+    amplitude_shape = np.shape(x_0p_array)
+    x_0p_array = np.ravel(np.asarray(x_0p_array, dtype=np.float64))
+    if np.ndim(h) > 1:
+        # the fine x line differs for each separation
+        gradients = [
+            xtrapz_field_gradient_batch(
+                Bzx_method, grid_array, h_i, trapz_pts, x_0p_array, grid_point_set
+            )
+            for h_i in h
+        ]
+        gradient = np.stack(gradients, axis=1)
+        return gradient.reshape(amplitude_shape + gradient.shape[1:])
+
+    grid = _shift_grid(grid_array, h)
+    x = np.ravel(grid[0])
+    nx = x.size
+    step = (x[-1] - x[0]) / (nx - 1) if nx > 1 else np.nan
+    uniform = nx > 1 and np.allclose(np.diff(x), step, rtol=1e-9, atol=0)
+    if grid_point_set or not uniform:
+        gradients = [
+            xtrapz_field_gradient(Bzx_method, grid_array, h, trapz_pts, x_0p)
+            for x_0p in x_0p_array
+        ]
+        gradient = np.stack(gradients)
+        return gradient.reshape(amplitude_shape + gradient.shape[1:])
+
+    n_pts = int(trapz_pts / 2)
+    theta = np.linspace(-np.pi, 0, n_pts)
+    trapz_weights = np.full(n_pts, np.pi / (n_pts - 1))
+    trapz_weights[[0, -1]] /= 2
+    cos_theta = np.cos(theta)
+
+    # the line starts two line steps before the grid shifted by the largest
+    # amplitude, for the cubic stencil
+    line_step = step / LINE_REFINE
+    x_max = np.max(np.abs(x_0p_array))
+    n_line = int(np.ceil(((nx - 1) * step + 2 * x_max) / line_step)) + 5
+    line = x[0] - x_max + (np.arange(n_line) - 2) * line_step
+    field = Bzx_method(line.reshape((-1,) + (1,) * (len(grid) - 1)), *grid[1:])
+    field = np.moveaxis(field, -len(grid), 0)
+
+    grid_shape = field.shape[1:-2] + (nx,) + field.shape[-2:]
+    gradient = np.zeros((x_0p_array.size,) + grid_shape)
+    for i, x_0p in enumerate(x_0p_array):
+        integral = np.zeros((nx,) + field.shape[1:])
+        term = np.empty_like(integral)
+        for weight, cos in zip(trapz_weights, cos_theta):
+            dx = x_0p * cos
+            if dx == 0:
+                continue
+            # the field at x - dx, at the line index (x_max - dx) / line_step + 2
+            index = (x_max - dx) / line_step + 2
+            j = int(np.floor(index))
+            for k, coef in enumerate(_cubic_weights(index - j)):
+                stop = j + k - 1 + (nx - 1) * LINE_REFINE + 1
+                np.multiply(
+                    field[j + k - 1 : stop : LINE_REFINE], weight * dx * coef, out=term
+                )
+                integral += term
+        gradient[i] = np.moveaxis(integral, 0, -3) * (2 / np.pi / x_0p**2)
+    return gradient.reshape(amplitude_shape + grid_shape)
+
+
+def _shift_grid(grid_array, h):
+    """Shift the grid by the tip-sample separation, or a stack of them."""
+    return [grid - offset for grid, offset in zip(grid_array, split_position(h))]
+
+
 def field_func(method, grid_array, h):
-    """Calculate the field value at the given height and grid points."""
+    """Calculate the field value at the given height and grid points.
+
+    The tip-sample separation ``h`` can be a stack of separations with the
+    shape ``(n, 3)``, for example an approach curve. The field of all the
+    separations is evaluated in one call, and the result has a leading
+    batch axis of size ``n``.
+    """
 
-    grid = list(map(sub, grid_array, h))
-    return method(*grid)
+    return method(*_shift_grid(grid_array, h))
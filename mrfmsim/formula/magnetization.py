@@ -1,11 +1,11 @@
-import numba as nb
 import numpy as np
+from .math import elementwise
 
 HBAR = 1.054571628e-7  # aN nm s - reduced Planck constant
 KB = 1.3806504e4  # aN nm K^{-1} - Boltzmann constant
 
 
-@nb.jit(nopython=True, parallel=True)
+@elementwise
 def mz_eq(B_tot, Gamma, J, temperature):
     r"""Magnetization per spin at the thermal equilibrium using the Brillouin function.
 
@@ -66,13 +66,61 @@ def mz_eq(B_tot, Gamma, J, temperature):
     .. math::
         {\cal M}_{z}^{\text{eq}}
         \approx \dfrac{\hbar^2 \gamma^2 \: J (J + 1)}{3 \: k_b T} B_0
+
+    The closed form cancels catastrophically for small :math:`x`, which is
+    the usual case for nuclear spins at high temperature. The polarization
+    is therefore evaluated per voxel as the Taylor series
+
+    .. math::
+        p_{\text{eq}} = \dfrac{(a^2 - b^2) x}{3} - \dfrac{(a^4 - b^4) x^3}{45}
+            + \dfrac{2 (a^6 - b^6) x^5}{945} - \dfrac{(a^8 - b^8) x^7}{4725}
+
+    for :math:`|a x| < 0.02`, as the closed form for moderate :math:`x`,
+    and as the saturated value :math:`\mathrm{sign}(x)` for
+    :math:`|b x| > 20`, where both hyperbolic cotangents equal one in
+    double precision. With :math:`\coth z = 1 + 2 / (e^{2z} - 1)` and
+    :math:`a = (2 J + 1) b`, the closed form for a half-integer or integer
+    :math:`J` is
+
+    .. math::
+        p_{\text{eq}} = \mathrm{sign}(x) \left(1 - \dfrac{2 b \sum_{k=1}^{2J}
+            (e^{2 k b |x|} - 1)}{e^{2 a |x|} - 1}\right),
+
+    where the terms :math:`e^{2 k b |x|} - 1` follow from a single ``expm1``
+    per voxel by a recurrence without cancellation.
     """
 
     mu_z = HBAR * Gamma * J  # aN nm s * rad/s mT = aN nm/mT
     x = (mu_z * B_tot) / (KB * temperature)  # unitless
-    a = (2.0 * J + 1.0) / (2.0 * J)  # unitless
-    b = 1.0 / (2.0 * J)  # unitless
-    pol_eq = a / np.tanh(a * x) - b / np.tanh(b * x)
+    n = 2.0 * J + 1.0  # number of states
+    b = 0.5 / J  # unitless
+    a = n * b  # unitless
+
+    if abs(a * x) < 0.02:
+        a2, b2, x2 = a * a, b * b, x * x
+        c1 = (a2 - b2) / 3.0
+        c3 = (a2 * a2 - b2 * b2) / 45.0
+        c5 = 2.0 * (a2 * a2 * a2 - b2 * b2 * b2) / 945.0
+        c7 = (a2 * a2 * a2 * a2 - b2 * b2 * b2 * b2) / 4725.0
+        pol_eq = x * (c1 - x2 * (c3 - x2 * (c5 - x2 * c7)))
+    elif abs(b * x) > 20.0:
+        pol_eq = np.sign(x)
+    else:
+        # the polarization is odd in x
+        em_b = np.expm1(2.0 * abs(b * x))
+        if n == np.floor(n):
+            # em_a = exp(2 n b |x|) - 1 by the recurrence of exp(2 k b |x|) - 1,
+            # and sum_em the sum of the terms for k < n
+            growth = 1.0 + em_b
+            em_a, sum_em = em_b, 0.0
+            for _ in range(int(n) - 1):
+                sum_em += em_a
+                em_a = em_a * growth + em_b
+            pol_eq = 1.0 - 2.0 * b * sum_em / em_a
+        else:
+            em_a = np.expm1(2.0 * abs(a * x))
+            pol_eq = a * (1.0 + 2.0 / em_a) - b * (1.0 + 2.0 / em_b)
+        pol_eq = np.sign(x) * pol_eq
     return mu_z * pol_eq  # [aN.nm/mT]
 
 
@@ -1,7 +1,95 @@
-"""Mathematical operations for the MRFM simulation."""
+"""Mathematical operations for the MRFM simulation.
 
+The grid arrays have three spatial axes (x, y, z). A parameter batch adds
+leading axes before them, so the x axis of an array with more than three
+dimensions is the third axis from the end.
+"""
+
+import functools
+import inspect
+import numba as nb
 import numpy as np
 
+GRID_NDIM = 3
+
+
+def as_batch(values):
+    """Reshape a 1D array of parameter values into a leading batch axis.
+
+    The result has the shape ``(n, 1, 1, 1)`` and broadcasts against the
+    grid arrays. For example, ``B1=as_batch(np.linspace(0.1, 1, 64))``
+    evaluates the experiment for 64 values of ``B1`` in one call, and the
+    sums of products return an array of 64 values.
+
+    :param ndarray values: the parameter values
+    :return: the values with a leading batch axis
+    :rtype: ndarray
+    """
+
+    return np.reshape(values, (-1,) + (1,) * GRID_NDIM)
+
+
+def split_position(position):
+    """Split a position, or a stack of positions, into the three coordinates.
+
+    A single position :math:`(x, y, z)` gives three floats. A stack of
+    positions with the shape ``(n, 3)``, for example the tip-sample
+    separations of an approach curve or a set of magnet origins, gives
+    three arrays with a leading batch axis of the shape ``(n, 1, 1, 1)``,
+    so that the grid shifted by each position is evaluated in one call.
+
+    :param position: the position (x, y, z), or a stack of positions [nm]
+    :return: the x, y, and z coordinates
+    :rtype: tuple
+    """
+
+    if np.ndim(position) < 2:
+        return tuple(position)
+    position = np.asarray(position, dtype=np.float64)
+    return tuple(as_batch(position[:, i]) for i in range(position.shape[1]))
+
+
+class SeparableWeights(list):
+    """The voxel weights as a list of broadcastable array factors.
+
+    The product of the factors is the weight of each voxel, for example the
+    per-axis quadrature weights of ``Grid``. The sums of products multiply
+    the factors in separately, without a full-grid weight array.
+    """
+
+
+def is_separable(value):
+    """Whether the value is the separable weights."""
+
+    return isinstance(value, SeparableWeights)
+
+
+def weight_factors(args):
+    """Replace the separable weights in the arguments with their factors."""
+
+    return [f for arg in args for f in (arg if is_separable(arg) else [arg])]
+
+
+def expand_weights(weights):
+    """Multiply out separable voxel weights into one broadcastable array.
+
+    Other values are returned unchanged.
+    """
+
+    if is_separable(weights):
+        return functools.reduce(np.multiply, weights)
+    return weights
+
+
+def x_axis(array):
+    """Return the index of the x axis, after the leading batch axes."""
+    return max(np.ndim(array) - GRID_NDIM, 0)
+
+
+def slice_x(array, start, stop):
+    """Slice an array along the x axis, the result is a view."""
+    return array[(slice(None),) * x_axis(array) + (slice(start, stop),)]
+
 
 def slice_matrix(matrix, shape):
     """Slice numpy matrix.
@@ -13,10 +101,13 @@ def slice_matrix(matrix, shape):
     :param ndarray matrix: a numpy array.
     :param tuple shape: sliced shape, has the same dimension as the matrix.
         The shape along the sliced axis should be the same oddity as the matrix.
+        If the shape has fewer dimensions, it applies to the trailing axes,
+        and the leading (batch) axes are kept.
     """
 
     oshape = np.array(matrix.shape)
     shape = np.array(shape)
+    shape = np.concatenate([oshape[: oshape.size - shape.size], shape])
 
     index_i = ((oshape - shape) / 2).astype(int)
     index_f = index_i + shape
@@ -28,7 +119,7 @@ def slice_matrix(matrix, shape):
     return matrix[tuple(slice_index)]
 
 
-def as_strided_x(dataset, window):
+def as_strided_x(dataset, window, axis=0):
     """Function for adjusting the stride size in the x direction.
 
     The operation is very fast and does not require extra memory because it
@@ -50,13 +141,96 @@ def as_strided_x(dataset, window):
     :param array dataset: the dataset target to determine max and min
                         (or other running operations)
     :param int window: the size of a sliding window for the dataset
+    :param int axis: the axis of the window, the window axis is inserted
+        after it
     :return: strided dataset
     :rtype: ndarray
     """
 
-    new = (dataset.shape[0] - window + 1, window) + dataset.shape[1:]
-    strides = (dataset.strides[0],) + dataset.strides
+    shape, strides = dataset.shape, dataset.strides
+    new = shape[:axis] + (shape[axis] - window + 1, window) + shape[axis + 1 :]
+    strides = strides[: axis + 1] + strides[axis:]
 
     return np.lib.stride_tricks.as_strided(
         dataset, shape=new, strides=strides, writeable=False
     )
+
+
+def elementwise(func):
+    """Compile a per-voxel function into a parallel ufunc.
+
+    The arguments broadcast against each other as float64 arrays, so that
+    parameters with leading batch axes are evaluated together with the
+    grid in a single parallel launch. The returned function keeps the
+    signature and the docstring of ``func``, and the compiled per-voxel
+    function is its ``scalar_kernel`` attribute.
+    """
+
+    signature = inspect.signature(func)
+    scalar_kernel = nb.jit(nopython=True)(func)
+    ufunc = nb.vectorize(
+        [nb.float64(*(nb.float64,) * len(signature.parameters))],
+        nopython=True,
+        target="parallel",
+        cache=True,
+    )(scalar_kernel)
+
+    @functools.wraps(func)
+    def kernel(*args, **kwargs):
+        return ufunc(*signature.bind(*args, **kwargs).args)
+
+    kernel.scalar_kernel = scalar_kernel
+    return kernel
+
+
+def batch_loop(*names):
+    """Loop a function over the leading batch axes of the named arguments.
+
+    The decorator is for the functions whose results have axes of their
+    own, such as the spectra and the sweeps, and that do not broadcast
+    batch axes. The named arguments that are arrays with more than the
+    three grid axes are split along their leading batch axes, which
+    broadcast against each other, and the function is called for each
+    batch member; a member with a single element, such as the value of a
+    parameter batch, is passed as a scalar. The batch axes follow the axes
+    of the result, so that the species axis of a ``MultiSample`` is the
+    last axis.
+
+    :param str names: the names of the arguments that can have batch axes
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            batched = {
+                name: arguments[name]
+                for name in names
+                if isinstance(arguments.get(name), np.ndarray)
+                and arguments[name].ndim > GRID_NDIM
+            }
+            if not batched:
+                return func(**arguments)
+
+            shape = np.broadcast_shapes(
+                *(value.shape[:-GRID_NDIM] for value in batched.values())
+            )
+            batched = {
+                name: np.broadcast_to(value, shape + value.shape[-GRID_NDIM:])
+                for name, value in batched.items()
+            }
+            results = []
+            for index in np.ndindex(shape):
+                member = {}
+                for name, value in batched.items():
+                    value = value[index]
+                    member[name] = value.item() if value.size == 1 else value
+                results.append(np.asarray(func(**{**arguments, **member})))
+            result = np.stack(results, axis=-1)
+            return result.reshape(results[0].shape + shape)
+
+        return wrapper
+
+    return decorator
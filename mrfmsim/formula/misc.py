@@ -1,7 +1,9 @@
 import math
 import numpy as np
+import numba as nb
 import scipy.special
-from functools import reduce
+from functools import lru_cache
+from .math import weight_factors
 
 HBAR = 1.054571628e-7  # aN nm s - reduced Planck constant
 
@@ -139,10 +141,15 @@ def singlespin_analytical(
 def sum_of_product(*args):
     """Calculate the sum of the product input values.
 
-    The args can be a list of values since NumPy multiple can calculate
-    the value.
+    The args can be any mix of scalars and broadcastable arrays. The scalars
+    are combined into one factor, and the arrays are multiplied and summed
+    voxel by voxel in a single parallel pass, without allocating the
+    intermediate products. Only the three grid axes are summed; the leading
+    axes of a parameter batch are kept in the result. The separable
+    weights, such as the per-axis quadrature weights of ``Grid``, are
+    multiplied in as their separate factors.
     """
-    return np.sum(reduce(np.multiply, args))
+    return _fused_sum_of_product(args)
 
 
 def neg_sum_of_product(*args):
@@ -153,4 +160,92 @@ def neg_sum_of_product(*args):
     the experiments. The approximation of the signal results in a negative
     sign at the front.
     """
-    return -np.sum(reduce(np.multiply, args))
+    return -_fused_sum_of_product(args)
+
+
+def _fused_sum_of_product(args):
+    """Sum the product of scalars and broadcastable arrays without temporaries.
+
+    The arrays are broadcast to a common shape as zero-copy views and padded
+    to three dimensions. For arrays with more than three dimensions, the
+    leading axes are batch axes, and each batch member is summed over the
+    three grid axes.
+    """
+
+    factor = 1.0
+    arrays = []
+    args = weight_factors(args)
+    for arg in args:
+        if np.ndim(arg) == 0:
+            factor = factor * arg
+        else:
+            arrays.append(np.asarray(arg, dtype=np.float64))
+
+    if not arrays:
+        return factor
+
+    shape = np.broadcast_shapes(*(array.shape for array in arrays))
+    arrays = [np.broadcast_to(array, shape) for array in arrays]
+    if len(shape) < 3:
+        arrays = [array[(np.newaxis,) * (3 - len(shape))] for array in arrays]
+
+    kernel = _product_sum_kernel(len(arrays))
+    total = np.empty(shape[:-3])
+    for index in np.ndindex(shape[:-3]):
+        total[index] = kernel(*(array[index] for array in arrays))
+    return factor * total[()]
+
+
+_BLOCK = 256  # number of z elements summed by one parallel task
+
+
+@nb.jit(nopython=True)
+def _kahan_sum(values):
+    """Compensated sum of a one-dimensional array."""
+
+    total = 0.0
+    comp = 0.0
+    for value in values:
+        y = value - comp
+        t = total + y
+        comp = (t - total) - y
+        total = t
+    return total
+
+
+@lru_cache(maxsize=None)
+def _product_sum_kernel(n_arrays):
+    """Build the parallel product-sum kernel for a number of 3D arrays.
+
+    Numba cannot iterate over a tuple of arrays with different layouts
+    in a parallel loop, so the kernel is generated for the given number of
+    arrays and numba specializes it on the array layouts. Each task sums a
+    block of z elements with a compensated accumulator, and the partial
+    sums are combined the same way.
+    """
+
+    names = [f"a{i}" for i in range(n_arrays)]
+    product = " * ".join(f"{name}[i, j, k]" for name in names)
+    source = f"""
+def product_sum({", ".join(names)}):
+    n0, n1, n2 = a0.shape
+    n_kb = (n2 + _BLOCK - 1) // _BLOCK
+    partial = np.empty(n0 * n1 * n_kb)
+    for index in nb.prange(n0 * n1 * n_kb):
+        ij = index // n_kb
+        k0 = (index % n_kb) * _BLOCK
+        i = ij // n1
+        j = ij % n1
+        total = 0.0
+        comp = 0.0
+        for k in range(k0, min(k0 + _BLOCK, n2)):
+            y = {product} - comp
+            t = total + y
+            comp = (t - total) - y
+            total = t
+        partial[index] = total
+    return _kahan_sum(partial)
+"""
+    namespace = {"np": np, "nb": nb, "_BLOCK": _BLOCK, "_kahan_sum": _kahan_sum}
+    exec(source, namespace)
+    return nb.jit(nopython=True, parallel=True)(namespace["product_sum"])
@@ -6,14 +6,14 @@
 
 import numba
 import numpy as np
-from .math import as_strided_x
-from .field import B_offset
+from .math import GRID_NDIM, elementwise, x_axis, slice_x
 
 HBAR = 1.054571628e-7  # aN nm s - reduced Planck constant
 KB = 1.3806504e4  # aN nm K^{-1} - Boltzmann constant
+_FLOAT_MAX = np.finfo(np.float64).max
 
 
-@numba.jit(nopython=True, parallel=True)
+@elementwise
 def rel_dpol_sat_steadystate(B_offset, B1, dB_sat, dB_hom):
     r"""Relative change in polarization for steady-state.
 
@@ -55,7 +55,7 @@ def rel_dpol_sat_steadystate(B_offset, B1, dB_sat, dB_hom):
     return -1 * s2_term / (1 + B_offset**2 / dB_hom**2 + s2_term)
 
 
-@numba.jit(nopython=True, parallel=True)
+@elementwise
 def rel_dpol_ibm_cyclic(B_offset, df_fm, Gamma):
     r"""Relative change in polarization for IBM adiabatic rapid passage.
 
@@ -94,7 +94,7 @@ def rel_dpol_ibm_cyclic(B_offset, df_fm, Gamma):
     return (np.abs(B_offset) < b_crit) * pol_arp
 
 
-@numba.jit(nopython=True, parallel=True)
+@elementwise
 def rel_dpol_arp(B_offset, B1, df_fm, Gamma):
     r"""Relative change in polarization for adiabatic rapid passage.
 
@@ -129,7 +129,7 @@ def rel_dpol_arp(B_offset, B1, df_fm, Gamma):
     return om_i * om_f / np.sqrt((om_i * om_i + 1.0) * (om_f * om_f + 1.0)) - 1.0
 
 
-@numba.jit(nopython=True, parallel=True)
+@elementwise
 def rel_dpol_periodic_irrad(B_offset, B1, dB_sat, dB_hom, T1, t_on, t_off):
     r"""Relative change in polarization for intermittent irradiation.
 
@@ -172,7 +172,7 @@ def rel_dpol_periodic_irrad(B_offset, B1, dB_sat, dB_hom, T1, t_on, t_off):
     )
 
 
-@numba.jit(nopython=True, parallel=True)
+@elementwise
 def rel_dpol_nut(B_offset, B1, Gamma, t_p):
     r"""Relative change in polarization under the evolution of irradiation.
 
@@ -214,18 +214,65 @@ def rel_dpol_nut(B_offset, B1, Gamma, t_p):
     return rel_dpol
 
 
-@numba.jit(nopython=True, parallel=True)
 def rel_dpol_nut_multi_freq_pulse(B_tot, B1, f_rf_array, Gamma, t_p):
     """Nutation experiments where different frequencies are applied in steps.
 
-    The polarization is aggregated as a product.
+    The polarization is aggregated as a product. The frequency loop runs
+    inside a parallel loop over the voxels, so the product is accumulated
+    per voxel and only the output array is allocated. The batch members of
+    ``B1``, ``Gamma``, and ``t_p``, for example the species of a
+    ``MultiSample``, are looped over; the leading axes of ``f_rf_array``
+    before the frequency axis are batch axes as well.
     """
-    pol = np.ones(B_tot.shape)
-    for f_rf in f_rf_array:
-        b_offset = B_offset(B_tot, f_rf, Gamma)
-        pol *= rel_dpol_nut(b_offset, B1, Gamma, t_p) + 1
 
-    return pol - 1
+    B_tot = np.asarray(B_tot, dtype=np.float64)
+    f_rf_array = np.atleast_1d(np.asarray(f_rf_array, dtype=np.float64))
+    # the leading axes of f_rf_array are batch axes, as for (n, 1, 1, 1)
+    f_rf_shape = f_rf_array.shape[:-1] + (1,) * GRID_NDIM
+    shape = np.broadcast_shapes(
+        B_tot.shape, np.shape(B1), np.shape(Gamma), np.shape(t_p), f_rf_shape
+    )
+    batch_shape = shape[: max(len(shape) - GRID_NDIM, 0)]
+    grid_shape = shape[len(batch_shape) :]
+
+    # each member of the parameter batch is one parallel launch
+    B_tot = np.broadcast_to(B_tot, shape)
+    B1, Gamma, t_p = (
+        np.broadcast_to(value, batch_shape + (1,) * len(grid_shape))
+        for value in (B1, Gamma, t_p)
+    )
+    f_rf_array = np.broadcast_to(
+        f_rf_array.reshape(f_rf_array.shape[:-1] + (1,) * len(grid_shape) + (-1,)),
+        batch_shape + (1,) * len(grid_shape) + f_rf_array.shape[-1:],
+    )
+    rel_dpol = np.empty(shape)
+    for index in np.ndindex(batch_shape):
+        rel_dpol[index] = _rel_dpol_nut_multi_freq(
+            np.ravel(B_tot[index]),
+            B1[index].item(),
+            np.ravel(f_rf_array[index]),
+            Gamma[index].item(),
+            t_p[index].item(),
+        ).reshape(grid_shape)
+    return rel_dpol
+
+
+@numba.jit(nopython=True, parallel=True)
+def _rel_dpol_nut_multi_freq(B_tot, B1, f_rf_array, Gamma, t_p):
+    """Voxel-parallel kernel of ``rel_dpol_nut_multi_freq_pulse``."""
+
+    theta = B1 * Gamma * t_p
+    B_res = 2 * np.pi * f_rf_array / Gamma
+    rel_dpol = np.empty(B_tot.size)
+
+    for i in numba.prange(B_tot.size):
+        pol = 1.0
+        for B in B_res:
+            omega_term = ((B_tot[i] - B) / B1) ** 2 + 1
+            pol *= np.cos(theta * np.sqrt(omega_term)) / omega_term
+        rel_dpol[i] = pol - 1
+
+    return rel_dpol
 
 
 def rel_dpol_sat_td(Bzx, B1, ext_B_offset, ext_pts, Gamma, T2, tip_v):
@@ -238,16 +285,72 @@ def rel_dpol_sat_td(Bzx, B1, ext_B_offset, ext_pts, Gamma, T2, tip_v):
     an ValueError is raised.
     """
     # ignore division error the Exp takes care of the inf, and nan
-    np.seterr(divide="ignore", invalid="ignore")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        omega_offset_atan = np.arctan(ext_B_offset * Gamma * T2)
+
+        atan_omega_i = slice_x(omega_offset_atan, None, -ext_pts * 2)
+        atan_omega_f = slice_x(omega_offset_atan, ext_pts * 2, None)
+
+        return _rel_dpol_sat_td_window(
+            Bzx, B1, atan_omega_i, atan_omega_f, Gamma, tip_v
+        )
+
+
+def rel_dpol_sat_td_nested(Bzx, B1, ext_B_offset, ext_pts_array, Gamma, T2, tip_v):
+    """Time-dependent saturation for an array of cantilever windows.
+
+    The ``ext_B_offset`` is the offset on the grid extended by the largest
+    of ``ext_pts_array``. The arctangent is evaluated once on it, and the
+    start and end of each smaller window are sliced from it as views, the
+    same way ``slice_matrix`` slices the extended grid of a smaller amplitude.
+    The result for each window follows ``rel_dpol_sat_td``.
+
+    :param ndarray ext_pts_array: the number of points (one side) of the
+        cantilever window for each amplitude
+    :return: the relative change in polarization with the shape
+        ``(len(ext_pts_array),) + grid_shape``
+    """
+
+    ext_pts_array = np.atleast_1d(ext_pts_array).astype(int)
+    ext_max = ext_pts_array.max()
+    ext_B_offset = np.asarray(ext_B_offset, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        omega_offset_atan = np.arctan(ext_B_offset * Gamma * T2)
+        n_x = omega_offset_atan.shape[x_axis(omega_offset_atan)] - 2 * ext_max
+
+        rel_dpol = []
+        for ext_pts in ext_pts_array:
+            start, end = ext_max - ext_pts, ext_max + ext_pts
+            atan_omega_i = slice_x(omega_offset_atan, start, start + n_x)
+            atan_omega_f = slice_x(omega_offset_atan, end, end + n_x)
+            rel_dpol.append(
+                _rel_dpol_sat_td_window(
+                    Bzx, B1, atan_omega_i, atan_omega_f, Gamma, tip_v
+                )
+            )
+    return np.stack(rel_dpol)
 
-    omega_offset_atan = np.arctan(ext_B_offset * Gamma * T2)
 
-    atan_omega_i = omega_offset_atan[: -ext_pts * 2]
-    atan_omega_f = omega_offset_atan[ext_pts * 2 :]
+def _rel_dpol_sat_td_window(Bzx, B1, atan_omega_i, atan_omega_f, Gamma, tip_v):
+    """Time-dependent saturation from the arctangents at the window ends."""
 
     div = np.divide(atan_omega_f - atan_omega_i, Bzx)
 
-    # adjust the nan values to the average of the surrounding values in x direction
+    # the nan values are adjusted for each member of a batch separately
+    axis = x_axis(div)
+    for index in np.ndindex(div.shape[:axis]):
+        _adjust_nan_x(div[index])
+
+    rt = Gamma * B1**2 * np.abs(div) / tip_v
+    dpol = np.exp(-rt)
+
+    return dpol - 1
+
+
+def _adjust_nan_x(div):
+    """Adjust the nan values in place to the average of the neighbors in x."""
+
     for idx in np.where(np.isnan(div))[0]:
 
         if idx == 0 or idx == len(div) - 1:
@@ -263,30 +366,133 @@ def rel_dpol_sat_td(Bzx, B1, ext_B_offset, ext_pts, Gamma, T2, tip_v):
             )
         div[idx] = value
 
-    rt = Gamma * B1**2 * np.abs(div) / tip_v
-    dpol = np.exp(-rt)
 
-    return dpol - 1
+def rel_dpol_sat_td_smallsteps(B1, ext_Bzx, ext_B_offset, ext_pts, Gamma, T2, tip_v):
+    r"""Small step approximation of the time-dependent relative change in polarization.
+
+    The per-step increments :math:`|\Delta \arctan(\gamma T_2 \Delta B_\text{offset})
+    / \bar{B}_{zx}|` of each (y, z) column are summed over the cantilever windows
+    with a sliding sum, which adds the step entering the window and removes the
+    step leaving it, so the cost is linear in the extended grid size. The sliding
+    sum is compensated (Neumaier) and re-summed from scratch at the start of every
+    window length, so that the rounding error does not accumulate along x. The
+    arctangent, the exponential, and the output are computed in the numba kernel
+    with one output allocation; they round slightly differently from the numpy
+    functions of ``rel_dpol_sat_td``. As with ``np.nan_to_num``, steps with an
+    undefined increment (0/0) contribute nothing, and steps with an infinite
+    increment count as the largest float, which saturates the windows that
+    contain them.
+    """
 
+    ext_B_offset = np.asarray(ext_B_offset, dtype=np.float64)
+    ext_Bzx = np.asarray(ext_Bzx, dtype=np.float64)
+    atan_scale = np.asarray(Gamma * T2, dtype=np.float64)
+    rate = np.asarray(Gamma * B1**2 / tip_v, dtype=np.float64)
+    ext_shape = np.broadcast_shapes(
+        ext_B_offset.shape, ext_Bzx.shape, atan_scale.shape, rate.shape
+    )
 
-def rel_dpol_sat_td_smallsteps(B1, ext_Bzx, ext_B_offset, ext_pts, Gamma, T2, tip_v):
-    """Small step approximation of the time-dependent relative change in polarization."""
-    # ignore division error
-    np.seterr(divide="ignore", invalid="ignore")
-    omega_offset_atan = np.arctan(ext_B_offset * Gamma * T2)
+    # the batch axes are moved behind the x axis and become extra columns;
+    # the parameters are constant along x and take one value per column
+    axis = max(len(ext_shape) - GRID_NDIM, 0)
+    column_shape = ext_shape[:axis] + (1,) + ext_shape[axis + 1 :]
+
+    def columns(array, shape):
+        array = np.moveaxis(np.broadcast_to(array, shape), axis, 0)
+        return np.ascontiguousarray(array.reshape(shape[axis], -1))
+
+    dpol = _sat_td_smallsteps_columns(
+        columns(ext_Bzx, ext_shape),
+        columns(ext_B_offset, ext_shape),
+        columns(atan_scale, column_shape)[0],
+        columns(rate, column_shape)[0],
+        ext_pts * 2,
+    )
+    out_shape = (ext_shape[axis] - ext_pts * 2,) + ext_shape[:axis]
+    out_shape += ext_shape[axis + 1 :]
+    return np.moveaxis(dpol.reshape(out_shape), 0, axis)
 
-    # Using strides is faster than convolution on large datasets
-    offset_atan_diff = np.diff(omega_offset_atan, axis=0)
-    Bzx_rmean = as_strided_x(ext_Bzx, 2).mean(axis=1)
 
-    f_array = np.nan_to_num(np.abs((offset_atan_diff) / Bzx_rmean))
-    f_array_sum = as_strided_x(f_array, ext_pts * 2).sum(axis=1)
+@numba.jit(nopython=True, inline="always")
+def _neumaier_add(total, compensation, value):
+    """Add the value to the compensated sum."""
 
-    rt = Gamma * B1**2 * f_array_sum / tip_v
+    t = total + value
+    if abs(total) >= abs(value):
+        compensation += (total - t) + value
+    else:
+        compensation += (value - t) + total
+    return t, compensation
 
-    dpol = np.exp(-rt)
 
-    return dpol - 1
+@numba.jit(nopython=True, parallel=True, error_model="numpy")
+def _sat_td_smallsteps_columns(ext_Bzx, ext_B_offset, atan_scale, rate, window):
+    """Sliding window kernel of ``rel_dpol_sat_td_smallsteps``.
+
+    The inputs are reshaped to (x, columns), and the parameters have one
+    value per column. The columns are processed in contiguous blocks so that
+    the inner loop reads consecutive memory; each block keeps the steps of
+    its columns. The infinite steps are counted separately from the finite
+    sum.
+    """
+
+    n_ext, n_col = ext_B_offset.shape
+    n_out = n_ext - window
+    dpol = np.empty((n_out, n_col))
+    block = 64
+    n_block = (n_col + block - 1) // block
+
+    for b in numba.prange(n_block):
+        j0 = b * block
+        j1 = min(j0 + block, n_col)
+        steps = np.empty((max(n_ext - 1, 0), j1 - j0))
+        atan_prev = np.empty(j1 - j0)
+        for j in range(j0, j1):
+            atan_prev[j - j0] = np.arctan(ext_B_offset[0, j] * atan_scale[j])
+
+        for i in range(n_ext - 1):
+            for j in range(j0, j1):
+                c = j - j0
+                atan_next = np.arctan(ext_B_offset[i + 1, j] * atan_scale[j])
+                Bzx_mean = (ext_Bzx[i, j] + ext_Bzx[i + 1, j]) / 2
+                step = np.abs((atan_next - atan_prev[c]) / Bzx_mean)
+                atan_prev[c] = atan_next
+                steps[i, c] = 0.0 if np.isnan(step) else step
+
+        for j in range(j0, j1):
+            c = j - j0
+            total, compensation, n_inf = 0.0, 0.0, 0
+            for i in range(n_out):
+                if window == 0 or i % window == 0:
+                    # re-sum the window to drop the accumulated rounding
+                    total, compensation, n_inf = 0.0, 0.0, 0
+                    for k in range(i, i + window):
+                        if np.isinf(steps[k, c]):
+                            n_inf += 1
+                        else:
+                            total, compensation = _neumaier_add(
+                                total, compensation, steps[k, c]
+                            )
+                else:
+                    entering, leaving = steps[i + window - 1, c], steps[i - 1, c]
+                    if np.isinf(entering):
+                        n_inf += 1
+                    else:
+                        total, compensation = _neumaier_add(
+                            total, compensation, entering
+                        )
+                    if np.isinf(leaving):
+                        n_inf -= 1
+                    else:
+                        total, compensation = _neumaier_add(
+                            total, compensation, -leaving
+                        )
+                f_sum = total + compensation
+                if n_inf > 0:
+                    f_sum += n_inf * _FLOAT_MAX
+                dpol[i, j] = np.exp(-rate[j] * f_sum) - 1
+
+    return dpol
 
 
 def rel_dpol_multipulse(rel_dpol, T1, dt_pulse):
@@ -0,0 +1,144 @@
+r"""Spectra over a frequency sweep from a weighted field histogram.
+
+For a stationary tip, the signal at each frequency is a sum over the voxels
+of a per-voxel weight times a lineshape of the resonance offset,
+
+.. math::
+    S(f_\mathrm{rf}) = \sum_j w_j \,
+        L(B_\mathrm{tot}(\vec{r}_j) - 2 \pi f_\mathrm{rf} / \gamma).
+
+Evaluating it for each frequency costs :math:`O(N F)` for :math:`N` voxels
+and :math:`F` frequencies. Here the weights are binned once into a fine
+histogram of :math:`B_\mathrm{tot}`, and the whole spectrum is a single 1D
+correlation of the histogram with the lineshape, computed by FFT when that
+is faster. The cost is :math:`O(N + F \log F)`.
+"""
+
+import numpy as np
+import numba as nb
+import scipy.signal
+from .math import batch_loop, expand_weights
+from .polarization import rel_dpol_sat_steadystate
+
+
+def spectrum_weight(Bzxx, mz_eq, spin_density, grid_voxel):
+    """Per-voxel weight of the spring constant shift spectrum.
+
+    The weight is the factor of the steady-state spring constant shift
+    that does not depend on the radio frequency, with the negative sign
+    of the approximation. The spectrum is the sum of the weight times
+    the relative change in polarization over the voxels.
+
+    :param ndarray Bzxx: second derivative of the tip field in x [mT/nm^2]
+    :param ndarray mz_eq: equilibrium magnetization per spin [aN.nm/mT]
+    :param float spin_density: the spin density [1/nm^3]
+    :param grid_voxel: the voxel volume, or the separable quadrature
+        weights of the grid [nm^3]
+    :return: the per-voxel weight
+    :rtype: ndarray
+    """
+
+    return -Bzxx * mz_eq * spin_density * expand_weights(grid_voxel)
+
+
+@batch_loop("B_tot", "weight", "Gamma", "B1", "dB_sat", "dB_hom")
+def spectrum_sat_steadystate(
+    B_tot, weight, f_rf_array, Gamma, B1, dB_sat, dB_hom, bin_oversample
+):
+    r"""Spectrum of the steady-state saturation signal over a frequency sweep.
+
+    The result is the sum over voxels of ``weight * rel_dpol_sat_steadystate``
+    for each frequency in ``f_rf_array``, which should be evenly spaced.
+
+    The weights are distributed linearly between the two nearest histogram
+    bins, with ``bin_oversample`` bins per frequency step. The binning
+    error is second order in the bin width; it is negligible when the bin
+    width :math:`2 \pi \Delta f_\mathrm{rf} / (\gamma \cdot
+    \mathrm{bin\_oversample})` is small compared with the homogeneous
+    linewidth. The spectrum is computed for each member of the leading
+    batch axes of the arguments, which follow the frequency axis in the
+    result.
+
+    :param ndarray B_tot: total magnetic field [mT]
+    :param ndarray weight: per-voxel weight, broadcastable to B_tot
+    :param ndarray f_rf_array: evenly spaced radio frequencies [Hz]
+    :param float Gamma: the gyromagnetic ratio [rad/s.mT]
+    :param float B1: the amplitude of the applied transverse field [mT]
+    :param float dB_sat: the saturation linewidth [mT]
+    :param float dB_hom: the homogeneous linewidth [mT]
+    :param int bin_oversample: number of histogram bins per frequency step
+    :return: spectrum with the same length as f_rf_array, followed by the
+        batch axes
+    :rtype: ndarray
+    """
+
+    def lineshape(B_offset):
+        return rel_dpol_sat_steadystate(B_offset, B1, dB_sat, dB_hom)
+
+    B_res = 2 * np.pi * np.asarray(f_rf_array, dtype=np.float64) / Gamma
+    return histogram_spectrum(B_tot, weight, B_res, lineshape, bin_oversample)
+
+
+def histogram_spectrum(B_tot, weight, B_res, lineshape, bin_oversample):
+    """Calculate the spectrum of a lineshape from a weighted field histogram.
+
+    The bin centers are aligned with the resonance fields so that the
+    spectrum is read off the correlation of the histogram with the sampled
+    lineshape at every ``bin_oversample``-th point.
+
+    :param ndarray B_tot: total magnetic field [mT]
+    :param ndarray weight: per-voxel weight, broadcastable to B_tot
+    :param ndarray B_res: evenly spaced resonance fields [mT]
+    :param callable lineshape: vectorized function of the resonance offset
+    :param int bin_oversample: number of histogram bins per resonance field step
+    :return: spectrum with the same length as B_res
+    :rtype: ndarray
+    """
+
+    B_tot, weight = np.broadcast_arrays(
+        np.asarray(B_tot, dtype=np.float64), np.asarray(weight, dtype=np.float64)
+    )
+    B_res = np.asarray(B_res, dtype=np.float64)
+    n_res = B_res.size
+
+    if n_res == 1:
+        return np.array([np.sum(weight * lineshape(B_tot - B_res[0]))])
+
+    step = (B_res[-1] - B_res[0]) / (n_res - 1)
+    if step == 0 or not np.allclose(np.diff(B_res), step, rtol=1e-6, atol=0):
+        raise ValueError("the frequencies should be evenly spaced")
+    if step < 0:
+        return histogram_spectrum(
+            B_tot, weight, B_res[::-1], lineshape, bin_oversample
+        )[::-1]
+
+    bin_width = step / bin_oversample
+    # shift the first bin to the left of the smallest field by whole bins,
+    # with one bin of margin on both sides for rounding
+    shift = int(np.ceil((B_res[0] - B_tot.min()) / bin_width)) + 1
+    B_start = B_res[0] - shift * bin_width
+    n_bins = int(np.floor((B_tot.max() - B_start) / bin_width)) + 3
+
+    hist = _linear_histogram(B_tot.ravel(), weight.ravel(), B_start, bin_width, n_bins)
+
+    # the sampled lineshape covers all offsets between the bins and B_res
+    n_min = -shift - (n_res - 1) * bin_oversample
+    n_kernel = n_bins + (n_res - 1) * bin_oversample
+    kernel = lineshape((n_min + np.arange(n_kernel)) * bin_width)
+
+    correlation = scipy.signal.correlate(kernel, hist, mode="valid", method="auto")
+    return correlation[::bin_oversample][::-1]
+
+
+@nb.jit(nopython=True)
+def _linear_histogram(values, weight, start, bin_width, n_bins):
+    """Histogram with each weight split linearly between the two nearest bins."""
+
+    hist = np.zeros(n_bins)
+    for i in range(values.size):
+        position = (values[i] - start) / bin_width
+        index = int(np.floor(position))
+        frac = position - index
+        hist[index] += weight[i] * (1.0 - frac)
+        hist[index + 1] += weight[i] * frac
+    return hist
@@ -0,0 +1,255 @@
+r"""Sweeps over resonance conditions evaluated on the resonant slice only.
+
+For a sweep of :math:`B_0` or :math:`f_\mathrm{rf}`, the tip field does not
+change, and for a given point of the sweep only the voxels in a thin slice
+
+.. math::
+    |B_z(\vec{r}) + B_0 - 2 \pi f_\mathrm{rf} / \gamma| < \Delta B_\mathrm{band}
+
+contribute to the signal. The voxel indices are sorted by :math:`B_z` once,
+and the slice of each sweep point is located with a binary search. The
+polarization, the equilibrium magnetization, and the sum are evaluated on
+the voxels of the slice, so the cost of each point is proportional to the
+slice volume instead of the grid volume.
+
+The IBM cyclic lineshape is exactly zero outside
+:math:`|\Delta B_\mathrm{offset}| < \pi \Delta f_\mathrm{FM} / \gamma`, and
+the sweep is exact. The ARP lineshape decays as
+:math:`(B_1 / \Delta B)^2` outside the swept window, where :math:`\Delta B`
+is the distance to the window edge, and the band is widened until the
+neglected relative change in polarization is smaller than ``rel_dpol_tol``.
+
+The parameters with leading batch axes, such as the species of a
+``MultiSample``, are evaluated one batch member at a time, and the batch
+axes follow the axes of the sweep in the result.
+"""
+
+from collections import namedtuple
+import numpy as np
+from .field import B_offset
+from .magnetization import mz_eq, mz2_eq
+from .math import GRID_NDIM, batch_loop, expand_weights
+from .misc import sum_of_product
+from .polarization import rel_dpol_ibm_cyclic, rel_dpol_arp
+
+FieldIndex = namedtuple("FieldIndex", ["order", "field", "shape"])
+FieldIndex.__doc__ = """Voxel indices sorted by the field.
+
+:param ndarray order: flat voxel indices in ascending order of the field
+:param ndarray field: the flattened field in ascending order
+:param tuple shape: the shape of the grid
+"""
+
+
+def field_index(Bz):
+    """Sort the voxels by the tip field.
+
+    The order of :math:`B_z` is also the order of :math:`B_\\mathrm{tot}`
+    for any :math:`B_0`, so the index is computed once per field evaluation.
+
+    :param ndarray Bz: the :math:`z` component of the tip field [mT]
+    :return: field index
+    :rtype: FieldIndex
+    :raises ValueError: if the field has batch axes, for example for a
+        stack of tip-sample separations
+    """
+
+    Bz = np.asarray(Bz, dtype=np.float64)
+    if Bz.ndim > GRID_NDIM:
+        raise ValueError("the field index does not support batch axes")
+    field = Bz.ravel()
+    order = np.argsort(field, kind="stable")
+    return FieldIndex(order, field[order], Bz.shape)
+
+
+def resonant_slice(Bz_index, B0, B_res, half_width):
+    """Return the positions in the sorted index of a resonant slice.
+
+    The slice includes every voxel with
+    ``|Bz + B0 - B_res| <= half_width``. The band is widened by a few
+    rounding errors of the field, so that no voxel is lost to rounding.
+
+    :param FieldIndex Bz_index: the sorted tip field
+    :param float B0: the external field [mT]
+    :param float B_res: the resonance field :math:`2 \\pi f_\\mathrm{rf}/\\gamma` [mT]
+    :param float half_width: the half-width of the band [mT]
+    :return: the start and stop positions of the slice in ``Bz_index``
+    :rtype: tuple(int, int)
+    """
+
+    field = Bz_index.field
+    center = B_res - B0
+    margin = 8 * np.finfo(np.float64).eps * (abs(B_res) + abs(B0) + half_width)
+    start = np.searchsorted(field, center - half_width - margin, side="left")
+    stop = np.searchsorted(field, center + half_width + margin, side="right")
+    return int(start), int(stop)
+
+
+def _flat(array, shape):
+    """Flatten a grid array, scalars are passed through."""
+
+    if np.ndim(array) == 0:
+        return array
+    return np.broadcast_to(np.asarray(array, dtype=np.float64), shape).ravel()
+
+
+def _sweep(Bz_index, B0, f_rf, Gamma, half_width, slice_sum):
+    """Evaluate slice_sum(ids, B_tot, B_res) on the slice of each sweep point.
+
+    :return: result with the broadcast shape of B0 and f_rf
+    """
+
+    B0, f_rf = np.broadcast_arrays(
+        np.asarray(B0, dtype=np.float64), np.asarray(f_rf, dtype=np.float64)
+    )
+    B_res = 2 * np.pi * f_rf / Gamma
+    result = np.zeros(B0.shape)
+    for index in np.ndindex(B0.shape):
+        start, stop = resonant_slice(Bz_index, B0[index], B_res[index], half_width)
+        if start < stop:
+            ids = Bz_index.order[start:stop]
+            B_tot = Bz_index.field[start:stop] + B0[index]
+            result[index] = slice_sum(ids, B_tot, f_rf[index])
+    return result[()]
+
+
+def _take(array, ids):
+    """Gather the voxels of a flattened array, scalars are passed through."""
+    return array if np.ndim(array) == 0 else array[ids]
+
+
+@batch_loop("Bzx", "df_fm", "Gamma", "J", "temperature", "spin_density")
+def sweep_dF_spin_ibm_cyclic(
+    Bz_index, Bzx, B0, f_rf, df_fm, Gamma, J, temperature, spin_density, grid_voxel
+):
+    """IBM cyclic force signal over a sweep of B0 and f_rf.
+
+    The result equals the ``dF_spin`` of ``IBMCyclic`` for each pair of
+    ``B0`` and ``f_rf`` after broadcasting.
+
+    :param FieldIndex Bz_index: the sorted tip field
+    :param ndarray Bzx: the field gradient on the grid [mT/nm]
+    :param B0: the external field, float or array [mT]
+    :param f_rf: the radio frequency, float or array [Hz]
+    :return: force signal with the broadcast shape of B0 and f_rf [aN]
+    """
+
+    Bzx = _flat(Bzx, Bz_index.shape)
+    spin_density = _flat(spin_density, Bz_index.shape)
+    grid_voxel = _flat(expand_weights(grid_voxel), Bz_index.shape)
+
+    def slice_sum(ids, B_tot, f_rf):
+        rel_dpol = rel_dpol_ibm_cyclic(B_offset(B_tot, f_rf, Gamma), df_fm, Gamma)
+        return sum_of_product(
+            _take(Bzx, ids),
+            rel_dpol,
+            mz_eq(B_tot, Gamma, J, temperature),
+            _take(spin_density, ids),
+            _take(grid_voxel, ids),
+        )
+
+    return _sweep(Bz_index, B0, f_rf, Gamma, np.pi * df_fm / Gamma, slice_sum)
+
+
+@batch_loop("Bzx", "df_fm", "Gamma", "J", "spin_density")
+def sweep_dF2_spin_ibm_cyclic(
+    Bz_index, Bzx, B0, f_rf, df_fm, Gamma, J, spin_density, grid_voxel
+):
+    """IBM cyclic force variance signal over a sweep of B0 and f_rf.
+
+    The result equals the ``dF2_spin`` of ``IBMCyclic`` for each pair of
+    ``B0`` and ``f_rf`` after broadcasting.
+
+    :param FieldIndex Bz_index: the sorted tip field
+    :param ndarray Bzx: the field gradient on the grid [mT/nm]
+    :param B0: the external field, float or array [mT]
+    :param f_rf: the radio frequency, float or array [Hz]
+    :return: force variance signal with the broadcast shape of B0 and f_rf [aN^2]
+    """
+
+    Bzx = _flat(Bzx, Bz_index.shape)
+    spin_density = _flat(spin_density, Bz_index.shape)
+    grid_voxel = _flat(expand_weights(grid_voxel), Bz_index.shape)
+    mz2 = mz2_eq(Gamma, J)
+
+    def slice_sum(ids, B_tot, f_rf):
+        rel_dpol = rel_dpol_ibm_cyclic(B_offset(B_tot, f_rf, Gamma), df_fm, Gamma)
+        Bzx_slice = _take(Bzx, ids)
+        return sum_of_product(
+            Bzx_slice * Bzx_slice,
+            rel_dpol,
+            mz2,
+            _take(spin_density, ids),
+            _take(grid_voxel, ids),
+        )
+
+    return _sweep(Bz_index, B0, f_rf, Gamma, np.pi * df_fm / Gamma, slice_sum)
+
+
+def arp_half_width(B1, df_fm, Gamma, rel_dpol_tol):
+    r"""Half-width of the band outside of which the ARP change is negligible.
+
+    For a resonance offset at a distance :math:`\Delta B` outside the swept
+    window :math:`\pm \pi \Delta f_\mathrm{FM} / \gamma`, the relative
+    change in polarization is bounded by :math:`(B_1 / \Delta B)^2`.
+
+    :param float B1: the amplitude of the applied transverse field [mT]
+    :param float df_fm: the peak-to-peak frequency modulation [Hz]
+    :param float Gamma: the gyromagnetic ratio [rad/s.mT]
+    :param float rel_dpol_tol: the largest neglected relative change in
+        polarization
+    :return: band half-width [mT]
+    :rtype: float
+    """
+
+    return np.pi * df_fm / Gamma + B1 / np.sqrt(rel_dpol_tol)
+
+
+@batch_loop("Bzxx", "B1", "df_fm", "Gamma", "J", "temperature", "spin_density")
+def sweep_dk_spin_arp(
+    Bz_index,
+    Bzxx,
+    B0,
+    f_rf,
+    B1,
+    df_fm,
+    Gamma,
+    J,
+    temperature,
+    spin_density,
+    grid_voxel,
+    rel_dpol_tol,
+):
+    """CERMIT ARP spring constant shift over a sweep of B0 and f_rf.
+
+    The result equals the ``dk_spin`` of ``CermitARP`` for each pair of
+    ``B0`` and ``f_rf`` after broadcasting, up to the neglected voxels
+    outside the band given by ``arp_half_width``. The neglected
+    contribution is smaller than ``rel_dpol_tol`` times the sum of the
+    absolute values of the per-voxel weights outside the band.
+
+    :param FieldIndex Bz_index: the sorted tip field
+    :param ndarray Bzxx: the second field derivative on the grid [mT/nm^2]
+    :param B0: the external field, float or array [mT]
+    :param f_rf: the radio frequency, float or array [Hz]
+    :param float rel_dpol_tol: the largest neglected relative change in
+        polarization
+    :return: spring constant shift with the broadcast shape of B0 and f_rf [aN/nm]
+    """
+
+    Bzxx = _flat(Bzxx, Bz_index.shape)
+    spin_density = _flat(spin_density, Bz_index.shape)
+    grid_voxel = _flat(expand_weights(grid_voxel), Bz_index.shape)
+    half_width = arp_half_width(B1, df_fm, Gamma, rel_dpol_tol)
+
+    def slice_sum(ids, B_tot, f_rf):
+        rel_dpol = rel_dpol_arp(B_offset(B_tot, f_rf, Gamma), B1, df_fm, Gamma)
+        return -sum_of_product(
+            _take(Bzxx, ids),
+            rel_dpol,
+            mz_eq(B_tot, Gamma, J, temperature),
+            _take(spin_density, ids),
+            _take(grid_voxel, ids),
+        )
+
+    return _sweep(Bz_index, B0, f_rf, Gamma, half_width, slice_sum)
@@ -0,0 +1,305 @@
+"""Fuse element-wise node chains into a single numba kernel.
+
+After the field nodes, the experiment graphs are chains of element-wise
+nodes (``B_tot``, ``B_offset``, ``rel_dpol``, ``mz_eq``) that end in a
+sum of products. Executed node by node, each of them allocates a full-grid
+array and launches its own parallel region. The fusion replaces such a chain
+with one node that streams every voxel from the field arrays to the reduced
+scalar, without allocating the intermediate arrays.
+
+Only nodes built from the known element-wise ``formula`` kernels and
+``operator`` functions are fused, and only when their outputs are not used
+outside the chain or returned by the experiment. Nodes with modifiers are
+left untouched.
+"""
+
+import operator
+from functools import lru_cache
+from inspect import Parameter, Signature
+import networkx as nx
+import numba as nb
+import numpy as np
+from mrfmsim import formula
+from mrfmsim.formula.misc import _BLOCK, _kahan_sum
+from mrfmsim.node import Node
+
+
+ELEMENTWISE_FUNCS = (
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.truediv,
+    operator.neg,
+    formula.B_offset,
+    formula.mz_eq,
+    formula.rel_dpol_sat_steadystate,
+    formula.rel_dpol_ibm_cyclic,
+    formula.rel_dpol_arp,
+    formula.rel_dpol_periodic_irrad,
+    formula.rel_dpol_nut,
+)
+
+REDUCTION_SIGNS = {formula.sum_of_product: 1, formula.neg_sum_of_product: -1}
+
+
+def reduction_node(graph, output, reductions):
+    """Return the sum-of-product node with the given output.
+
+    :param graph: the experiment graph
+    :param str output: the output of the node
+    :param reductions: the sum-of-product functions, for example the keys
+        of ``REDUCTION_SIGNS``
+    :raises ValueError: if the output is not computed by a sum of products
+    """
+
+    for node, node_object in graph.nodes(data="node_object"):
+        if node_object.output == output and node_object.func in reductions:
+            return node
+    raise ValueError(f"{output!r} is not the output of a sum of products node")
+
+
+@lru_cache(maxsize=None)
+def scalar_kernel(func):
+    """Return the version of an element-wise function called per voxel.
+
+    The ``formula`` kernels compiled with ``elementwise`` carry their
+    per-voxel function, and other numba-compiled kernels are recompiled
+    without the parallel option, which has no effect on scalar inputs. The
+    operator functions are supported by numba directly.
+    """
+
+    if hasattr(func, "scalar_kernel"):
+        return func.scalar_kernel
+    if isinstance(func, nb.core.registry.CPUDispatcher):
+        return nb.jit(nopython=True)(func.py_func)
+    return func
+
+
+def _is_fusible(node_object, funcs):
+    """Check if the node function is in the funcs and has no modifiers."""
+    return node_object.func in funcs and not node_object.modifiers
+
+
+def fusible_regions(graph, returns):
+    """Find the element-wise node chains that end in a reduction node.
+
+    Starting from each reduction node, the region grows to the parent nodes
+    that are element-wise and whose outputs are consumed only within the
+    region. Regions with a single node are skipped because the reduction
+    node is already a single pass.
+
+    :param graph graph: experiment graph
+    :param list returns: experiment returns, returned outputs are not fused
+    :return: list of node lists in topological order
+    :rtype: list[list[str]]
+    """
+
+    regions = []
+    for node in nx.topological_sort(graph):
+        if not _is_fusible(graph.nodes[node]["node_object"], REDUCTION_SIGNS):
+            continue
+
+        region = {node}
+        grown = True
+        while grown:
+            grown = False
+            for parent in {p for n in region for p in graph.predecessors(n)}:
+                node_object = graph.nodes[parent]["node_object"]
+                if (
+                    parent not in region
+                    and _is_fusible(node_object, ELEMENTWISE_FUNCS)
+                    and set(graph.successors(parent)) <= region
+                    and node_object.output not in returns
+                ):
+                    region.add(parent)
+                    grown = True
+
+        if len(region) > 1:
+            regions.append([n for n in nx.topological_sort(graph) if n in region])
+
+    return regions
+
+
+class FusedKernel:
+    """Callable that evaluates an element-wise chain and its reduction.
+
+    The kernel is generated the first time the callable is executed with a
+    given pattern of scalar and array inputs. Inputs that are not numeric
+    (for example objects passed through the chain) fall back to executing
+    the original functions one by one.
+
+    :param list steps: element-wise steps in execution order, in the format
+        of [(output, func, input_names), ...]
+    :param func reduction: the reduction function
+    :param list reduction_inputs: input names of the reduction
+    """
+
+    def __init__(self, steps, reduction, reduction_inputs):
+        self.steps = steps
+        self.reduction = reduction
+        self.reduction_inputs = reduction_inputs
+        self.sign = REDUCTION_SIGNS[reduction]
+
+        produced = {output for output, _, _ in steps}
+        params = []
+        for _, _, inputs in steps + [(None, None, reduction_inputs)]:
+            for name in inputs:
+                if name not in produced and name not in params:
+                    params.append(name)
+        self.params = params
+
+        self.__signature__ = Signature(
+            [Parameter(name, Parameter.POSITIONAL_OR_KEYWORD) for name in params]
+        )
+        self.__name__ = "fused_" + reduction.__name__
+        self.__doc__ = "Fused kernel of " + ", ".join(
+            [func.__name__ for _, func, _ in steps] + [reduction.__name__]
+        ) + "."
+        self._kernels = {}
+
+    def __deepcopy__(self, memo):
+        """The callable is not modified after creation, graph copies share it."""
+        return self
+
+    def __call__(self, *args):
+        # the separable weights are passed to the kernel as their factors,
+        # which are multiplied per voxel
+        counts = tuple(len(arg) if formula.is_separable(arg) else 0 for arg in args)
+        factors = formula.weight_factors(args)
+        if not all(np.asarray(arg).dtype.kind in "biuf" for arg in factors):
+            return self.evaluate(*(formula.expand_weights(arg) for arg in args))
+
+        is_scalar = tuple(np.ndim(arg) == 0 for arg in factors)
+        if all(is_scalar):
+            return self.evaluate(*args)
+
+        shape = np.broadcast_shapes(*(np.shape(arg) for arg in factors))
+        values = []
+        for arg, scalar in zip(factors, is_scalar):
+            if scalar:
+                values.append(arg)
+            else:
+                array = np.broadcast_to(np.asarray(arg, dtype=np.float64), shape)
+                values.append(array[(np.newaxis,) * (3 - len(shape))])
+
+        key = (is_scalar, counts)
+        if key not in self._kernels:
+            self._kernels[key] = self._kernel(is_scalar, counts)
+        kernel = self._kernels[key]
+        # the axes before the three grid axes are batch axes
+        total = np.empty(shape[:-3])
+        for index in np.ndindex(shape[:-3]):
+            total[index] = kernel(
+                *(v if s else v[index] for v, s in zip(values, is_scalar))
+            )
+        return self.sign * total[()]
+
+    def evaluate(self, *args):
+        """Evaluate the original functions one by one."""
+
+        data = dict(zip(self.params, args))
+        for output, func, inputs in self.steps:
+            data[output] = func(*(data[name] for name in inputs))
+        return self.reduction(*(data[name] for name in self.reduction_inputs))
+
+    def _kernel(self, is_scalar, counts):
+        """Generate the numba kernel for a pattern of scalar inputs.
+
+        Array inputs are read per voxel, scalar inputs are passed through.
+        The inputs with a nonzero count are separable weights, passed as
+        that many factors. Each parallel task sums a block of z elements
+        with a compensated accumulator, as in ``formula.sum_of_product``.
+        """
+
+        slots = []
+        for i, (param, count) in enumerate(zip(self.params, counts)):
+            names = [f"x{i}_{m}" for m in range(count)] if count else [f"x{i}"]
+            slots.extend((param, name) for name in names)
+        first_array = slots[is_scalar.index(False)][1]
+        namespace = {"np": np, "nb": nb, "_BLOCK": _BLOCK, "_kahan_sum": _kahan_sum}
+
+        body = []
+        factors = {param: [] for param in self.params}
+        for (param, name), scalar in zip(slots, is_scalar):
+            if not scalar:
+                body.append(f"{name}_v = {name}[i, j, k]")
+            factors[param].append(name if scalar else name + "_v")
+        values = {
+            param: f"({' * '.join(names)})" if count else names[0]
+            for (param, names), count in zip(factors.items(), counts)
+        }
+        for n, (output, func, inputs) in enumerate(self.steps):
+            namespace[f"f{n}"] = scalar_kernel(func)
+            values[output] = f"v{n}"
+            args = ", ".join(values[name] for name in inputs)
+            body.append(f"v{n} = f{n}({args})")
+        product = " * ".join(values[name] for name in self.reduction_inputs)
+        body.append(f"y = {product} - comp")
+
+        indent = "\n" + " " * 12
+        source = f"""
+def fused({", ".join(name for _, name in slots)}):
+    n0, n1, n2 = {first_array}.shape
+    n_kb = (n2 + _BLOCK - 1) // _BLOCK
+    partial = np.empty(n0 * n1 * n_kb)
+    for index in nb.prange(n0 * n1 * n_kb):
+        ij = index // n_kb
+        k0 = (index % n_kb) * _BLOCK
+        i = ij // n1
+        j = ij % n1
+        total = 0.0
+        comp = 0.0
+        for k in range(k0, min(k0 + _BLOCK, n2)):
+            {indent.join(body)}
+            t = total + y
+            comp = (t - total) - y
+            total = t
+        partial[index] = total
+    return _kahan_sum(partial)
+"""
+        exec(source, namespace)
+        return nb.jit(nopython=True, parallel=True)(namespace["fused"])
+
+
+def fuse_region(graph, region):
+    """Replace a fusible region of the graph with a single node.
+
+    The new node keeps the name, output, and unit of the reduction node.
+
+    :param graph graph: experiment graph
+    :param list region: region nodes in topological order, the last node
+        is the reduction node
+    :return: new graph
+    """
+
+    steps = []
+    for node in region[:-1]:
+        node_object = graph.nodes[node]["node_object"]
+        inputs = list(graph.nodes[node]["signature"].parameters)
+        steps.append((node_object.output, node_object.func, inputs))
+
+    reduction = region[-1]
+    reduction_object = graph.nodes[reduction]["node_object"]
+    reduction_inputs = list(graph.nodes[reduction]["signature"].parameters)
+
+    fused_node = Node(
+        reduction,
+        FusedKernel(steps, reduction_object.func, reduction_inputs),
+        output=reduction_object.output,
+        output_unit=getattr(reduction_object, "output_unit", None),
+        doc=f"Fused kernel of nodes: {', '.join(map(repr, region))}.",
+    )
+    return graph.replace_subgraph(graph.subgraph(region), fused_node)
+
+
+def fuse_elementwise(graph, returns):
+    """Fuse all element-wise chains of the graph that end in a reduction.
+
+    :param graph graph: experiment graph
+    :param list returns: experiment returns
+    :return: new graph
+    """
+
+    for region in fusible_regions(graph, returns):
+        graph = fuse_region(graph, region)
+    return graph
@@ -0,0 +1,157 @@
+r"""Linear forward operator of the spin density for a tip scan.
+
+If the polarization does not depend on the spin density, the signal at the
+tip position :math:`\vec{h}` is linear in the spin density,
+
+.. math::
+    s(\vec{h}) = \sum_j K(\vec{r}_j - \vec{h}) \, \rho(\vec{r}_j),
+
+with the point-spread kernel :math:`K` given by the other factors of the
+signal sum, for example
+:math:`-B_{zxx} \, \Delta\rho_\mathrm{rel} \, M_z^\mathrm{eq} \, \Delta V`
+for the CERMIT spring constant shift. For tip positions on a grid with the
+same step as the sample grid, the image is a correlation of the spin
+density with the kernel. The kernel is evaluated once on the grid padded
+by the scan extent, and the forward and adjoint operators are computed by
+FFT.
+"""
+
+import numpy as np
+import networkx as nx
+import scipy.fft
+from scipy.sparse.linalg import LinearOperator
+from mrfmsim import formula
+from mrfmsim.chunk import check_grid
+from mrfmsim.component import Grid
+from mrfmsim.fusion import REDUCTION_SIGNS, reduction_node
+
+
+class ConvolutionOperator(LinearOperator):
+    """Forward operator from the spin density to the scan image.
+
+    The operator maps the flattened spin density of shape ``grid_shape``
+    to the flattened image of shape ``image_shape``. The image point
+    ``n`` is the signal at the tip position ``h0 + n * grid_step``.
+
+    :param ndarray kernel: the kernel on the padded grid, with the shape
+        ``grid_shape + scan_shape - 1``; the kernel value at index ``q`` is
+        for the voxel offset ``(q - scan_shape + 1) * grid_step`` from the
+        first tip position
+    :param tuple grid_shape: the shape of the spin density
+    :param tuple image_shape: the shape of the image, with two or three axes
+    """
+
+    def __init__(self, kernel, grid_shape, image_shape):
+        self.grid_shape = tuple(grid_shape)
+        self.image_shape = tuple(image_shape)
+        self.scan_shape = self.image_shape + (1,) * (3 - len(self.image_shape))
+        self.fft_shape = kernel.shape
+
+        # the flipped kernel turns the correlation into a convolution
+        self.kernel_fft = scipy.fft.rfftn(kernel[::-1, ::-1, ::-1], self.fft_shape)
+        self._image_slice = tuple(
+            slice(g - 1, g - 1 + s) for g, s in zip(self.grid_shape, self.scan_shape)
+        )
+
+        super().__init__(
+            np.float64, (np.prod(self.image_shape), np.prod(self.grid_shape))
+        )
+
+    def _matvec(self, x):
+        density = np.reshape(x, self.grid_shape)
+        full = scipy.fft.irfftn(
+            scipy.fft.rfftn(density, self.fft_shape) * self.kernel_fft,
+            self.fft_shape,
+        )
+        return full[self._image_slice].ravel()
+
+    def _rmatvec(self, x):
+        image = np.reshape(x, self.scan_shape)
+        full = scipy.fft.irfftn(
+            scipy.fft.rfftn(image, self.fft_shape) * np.conj(self.kernel_fft),
+            self.fft_shape,
+        )
+        shift = tuple(g - 1 for g in self.grid_shape)
+        full = np.roll(full, shift, axis=(0, 1, 2))
+        return full[tuple(slice(0, g) for g in self.grid_shape)].ravel()
+
+
+def padded_grid(grid, scan_shape):
+    """Return the grid padded by the scan extent in the negative directions.
+
+    The padded grid has the shape ``grid_shape + scan_shape - 1`` and the
+    same last point as the grid.
+
+    :param Grid grid: the sample grid
+    :param tuple scan_shape: number of tip positions along x, y, z
+    :rtype: Grid
+    :raises ValueError: if the grid is not a ``Grid``
+    """
+
+    check_grid(grid, "grid padding")
+    pad = np.array(scan_shape) - 1
+    return Grid(
+        grid_shape=tuple(int(n) for n in np.array(grid.grid_shape) + pad),
+        grid_step=grid.grid_step,
+        grid_origin=np.array(grid.grid_origin) - pad * np.array(grid.grid_step) / 2,
+    )
+
+
+def convolution_operator(experiment, output, scan_shape, **inputs):
+    """Build the forward operator of an experiment output for a tip scan.
+
+    The ancestors of the sum-of-product node that computes ``output`` are
+    executed once, on the grid padded by the scan extent with the tip at
+    the first scan position ``inputs["h"]``. The kernel is the product of
+    the inputs of the sum except ``spin_density``.
+
+    :param Experiment experiment: the experiment
+    :param str output: the output of a sum-of-product node, for example
+        "dk_spin" or "dF_spin"
+    :param tuple scan_shape: number of tip positions along x, y (and z),
+        with the step of the grid
+    :param inputs: the experiment inputs, including "grid" and "h"; the
+        inputs that the kernel does not depend on are ignored
+    :rtype: ConvolutionOperator
+    :raises ValueError: if the grid is not a ``Grid``
+    """
+
+    check_grid(inputs["grid"], "linear operator")
+    graph = experiment.graph
+    node = reduction_node(graph, output, REDUCTION_SIGNS)
+    sign = REDUCTION_SIGNS[graph.nodes[node]["node_object"].func]
+    factors = [
+        name
+        for name in graph.nodes[node]["signature"].parameters
+        if name != "spin_density"
+    ]
+
+    kernel_graph = graph.subgraph(nx.ancestors(graph, node))
+    outputs = {obj.output for _, obj in kernel_graph.nodes(data="node_object")}
+    produced = [name for name in factors if name in outputs]
+    kernel_experiment = experiment.edit(graph=kernel_graph, returns=produced)
+
+    grid = inputs["grid"]
+    scan_shape_3d = tuple(scan_shape) + (1,) * (3 - len(scan_shape))
+    params = kernel_experiment.signature.parameters
+    kernel_inputs = {key: value for key, value in inputs.items() if key in params}
+    kernel_inputs["grid"] = padded_grid(grid, scan_shape_3d)
+    values = kernel_experiment(**kernel_inputs)
+    values = dict(zip(produced, values if len(produced) > 1 else [values]))
+
+    # the factors that are not node outputs are experiment inputs
+    # or component attributes, for example grid_voxel
+    for name in factors:
+        if name not in values:
+            values[name] = inputs.get(name)
+            for component, attributes in experiment.param_replacements.items():
+                if name in attributes:
+                    values[name] = getattr(inputs[component], name)
+
+    if np.ndim(formula.expand_weights(values.get("grid_voxel", 1.0))):
+        raise ValueError("the linear operator requires a uniform voxel volume")
+
+    kernel = np.full(kernel_inputs["grid"].grid_shape, float(sign))
+    for name in factors:
+        kernel = kernel * values[name]
+    return ConvolutionOperator(kernel, grid.grid_shape, tuple(scan_shape))
@@ -5,6 +5,15 @@ The class inherits from ``mmodel.Model`` class to add certain functionality and
 
 import mmodel
 from mrfmsim.modifier import replace_component
+from mrfmsim.fusion import fuse_elementwise
+from mrfmsim.sampling import adaptive_sample, spectrum_features
+from mrfmsim.scan import scan_graph, scan_offsets
+from mrfmsim.imaging import convolution_operator
+from mrfmsim.chunk import check_grid, chunked_run
+from mrfmsim.plan import plan, plan_block_shape
+from mrfmsim.resonant import resonant_run
+from mrfmsim.convergence import converge_run
+from mrfmsim.component import Grid, MultiSample
 import networkx as nx
 from mmodel.metadata import (
     MetaDataFormatter,
@@ -17,6 +26,7 @@ from mmodel.metadata import (
     wrapper80,
 )
 import copy
+import numpy as np
 
 
 experimentformatter = MetaDataFormatter(
@@ -116,5 +126,268 @@ class Experiment(mmodel.Model):
         """
         return copy.deepcopy(self._param_replacements)
 
+    def compile(self):
+        """Fuse the element-wise node chains into single numba kernels.
+
+        The chains of element-wise nodes that end in a sum of products, for
+        example ``B_offset``, ``rel_dpol``, ``mz_eq`` and the spring constant
+        shift, are replaced by one node that streams each voxel from the
+        field arrays to the reduced value. The intermediate full-grid arrays
+        are not allocated. A new experiment is returned, with the same
+        signature, returns, components, and modifiers.
+        """
+
+        graph = fuse_elementwise(self.graph, self.returns)
+        return self.edit(graph=graph, returns=self.returns)
+
+    def adaptive_sweep(
+        self,
+        param,
+        bounds,
+        output=None,
+        tol=1e-3,
+        n_initial=17,
+        max_points=500,
+        **inputs,
+    ):
+        """Sweep a parameter adaptively and estimate the signal features.
+
+        The experiment is executed with ``param`` set to the sampled values
+        and the other ``inputs`` fixed. The samples are refined where the
+        signal bends until its linear interpolation is within ``tol`` times
+        the signal range. See ``sampling.adaptive_sample``.
+
+        :param str param: name of the swept parameter, for example "f_rf"
+        :param tuple bounds: the lower and upper bounds of the sweep
+        :param str output: the returned value to sample, required if the
+            experiment has more than one return
+        :param float tol: interpolation error relative to the signal range
+        :param int n_initial: number of initial evenly spaced points
+        :param int max_points: maximum number of experiment executions
+        :return: sample positions, sample values, and the estimated features
+        :rtype: tuple(ndarray, ndarray, SpectrumFeatures)
+        """
+
+        if len(self.returns) > 1 and output is None:
+            raise ValueError(
+                f"output is required for the experiment returns {self.returns}"
+            )
+
+        def func(value):
+            result = self(**{param: value}, **inputs)
+            if len(self.returns) > 1:
+                return result[self.returns.index(output)]
+            return result
+
+        x, y = adaptive_sample(func, bounds, tol, n_initial, max_points)
+        return x, y, spectrum_features(x, y, tol)
+
+    def scan(self, h_array, executor=None, **inputs):
+        """Execute the experiment for a list of tip positions.
+
+        The positions should differ by whole grid steps. The field nodes
+        that use ``formula.field_func`` are evaluated once on the grid
+        padded by the scan extent, and each scan point uses a sliced view
+        of the padded field. See the ``scan`` module.
+
+        The scan points can be executed in parallel with an executor, for
+        example ``concurrent.futures.ThreadPoolExecutor``. The numba
+        kernels are parallel as well, and the threading layer should
+        support concurrent launches (tbb or omp).
+
+        :param ndarray h_array: tip positions, shape (n, 3) [nm]
+        :param executor: an executor with a ``map`` method, defaults to
+            serial execution
+        :param inputs: the other inputs of the experiment, including "grid"
+        :return: list of the experiment results for each position
+        :rtype: list
+        :raises ValueError: if the grid is not a ``Grid``
+        """
+
+        check_grid(inputs["grid"], "scan")
+        h_array = np.atleast_2d(np.asarray(h_array, dtype=np.float64))
+        offsets = scan_offsets(h_array, inputs["grid"].grid_step)
+        graph = scan_graph(self.graph, h_array[0], inputs["grid"].grid_step, offsets)
+        experiment = self.edit(graph=graph, returns=self.returns)
+
+        def run(h):
+            return experiment(h=h, **inputs)
+
+        if executor is None:
+            return list(map(run, h_array))
+        return list(executor.map(run, h_array))
+
+    def linear_operator(self, output, scan_shape, **inputs):
+        """Build the FFT forward operator from the spin density to a scan image.
+
+        The point-spread kernel is computed once from the node outputs that
+        feed the sum of products of ``output``, for a regular tip scan with
+        the grid step starting at ``inputs["h"]``. The polarization should
+        not depend on the spin density. See the ``imaging`` module.
+
+        :param str output: the output of a sum-of-product node, for example
+            "dk_spin" or "dF_spin"
+        :param tuple scan_shape: number of tip positions along x, y (and z)
+        :param inputs: the experiment inputs, including "grid" and "h"
+        :rtype: imaging.ConvolutionOperator
+        :raises ValueError: if the grid is not a ``Grid``
+        """
+
+        return convolution_operator(self, output, scan_shape, **inputs)
+
+    def chunked(self, max_bytes=None, block_shape=None, occupancy=None, **inputs):
+        """Execute the experiment on blocks of the grid and sum the results.
+
+        The grid is split into blocks along y and z with the full x axis, so
+        that the windowed nodes of the cantilever motion are unchanged. The
+        block size is chosen from the peak memory budget ``max_bytes``,
+        measured on small probe blocks. The returns should be sums over the
+        voxels. A spin density array that broadcasts to the grid, which can
+        be an ``np.memmap``, is read block by block, and the blocks without
+        spins are skipped. See the ``chunk`` module.
+
+        :param int max_bytes: the peak memory budget of a block [bytes]
+        :param tuple block_shape: the number of y and z points of the
+            blocks, used instead of the budget
+        :param ndarray occupancy: the precomputed block occupancy index of
+            the spin density, see ``chunk.block_occupancy``
+        :param inputs: the experiment inputs, including "grid"
+        :return: the summed results
+        """
+
+        return chunked_run(self, max_bytes, block_shape, occupancy, **inputs)
+
+    def plan(self, max_bytes=None, **inputs):
+        """Plan the memory of an execution without running the kernels.
+
+        The output shape, dtype, and memory of each node, and the peak
+        memory of the execution order are derived from the inputs. See the
+        ``plan`` module.
+
+        :param int max_bytes: the peak memory budget [bytes]
+        :param inputs: the experiment inputs
+        :rtype: plan.MemoryPlan
+        :raises MemoryError: if the planned peak memory exceeds
+            ``max_bytes``, the message suggests a block shape for
+            ``Experiment.chunked`` if the grid is a ``Grid`` and a block
+            fits in the budget
+        """
+
+        memory_plan = plan(self, **inputs)
+        if max_bytes is not None and memory_plan.peak > max_bytes:
+            message = (
+                f"the planned peak memory of {memory_plan.peak} bytes exceeds "
+                f"the budget of {max_bytes} bytes"
+            )
+            if isinstance(inputs.get("grid"), Grid):
+                block_shape = plan_block_shape(self, max_bytes, **inputs)
+                if block_shape is not None:
+                    message += (
+                        f", use chunked(block_shape={block_shape}) to execute "
+                        "the grid in blocks"
+                    )
+            raise MemoryError(message)
+        return memory_plan
+
+    def resonant(
+        self, output, tol, mask_factor="rel_dpol", error_samples=1024, seed=0, **inputs
+    ):
+        """Execute the experiment with the signal sum on the resonant voxels.
+
+        The voxels with ``abs(rel_dpol) > tol`` are selected after the
+        polarization is computed. The field nodes that only feed the sum of
+        ``output`` are evaluated at the selected voxels, and the sum runs
+        over them. The contribution of the dropped voxels is estimated from
+        a random sample of ``error_samples`` voxels, with the standard error
+        of the estimate. The estimate is stochastic, not a bound: the
+        estimate plus or minus two standard errors is an approximate 95%
+        confidence interval. See the ``resonant`` module.
+
+        :param str output: the output of a sum-of-product node, for example
+            "dk_spin"
+        :param float tol: the tolerance of ``abs(rel_dpol)``
+        :param str mask_factor: the factor of the sum that selects the voxels
+        :param int error_samples: number of dropped voxels in the estimate
+        :param int seed: the seed of the dropped voxel sample
+        :param inputs: the experiment inputs, including "grid"
+        :return: the experiment results, the estimated contribution of the
+            dropped voxels to ``output``, and its standard error
+        :rtype: tuple
+        """
+
+        return resonant_run(
+            self, output, tol, mask_factor, error_samples, seed, **inputs
+        )
+
+    def converge(
+        self, output=None, rtol=1e-3, atol=0.0, order=None, max_refinements=3, **inputs
+    ):
+        """Refine the grid until the signal converges and extrapolate it.
+
+        The experiment is executed on the input grid and on the grids with
+        the step halved, and the values of the levels are extrapolated to
+        the zero step. The field nodes reuse the values of the coarser level
+        at the shared points. See the ``convergence`` module.
+
+        :param str output: the returned value to converge, required if the
+            experiment has more than one return
+        :param float rtol: the relative tolerance of the error
+        :param float atol: the absolute tolerance of the error
+        :param float order: the convergence order of the grid step,
+            estimated from the levels if None
+        :param int max_refinements: the maximum number of refinements
+        :param inputs: the experiment inputs, including the coarsest "grid"
+        :return: the extrapolated value, the error estimate, the order, the
+            finest grid, the values of the levels, and whether the error is
+            within the tolerance
+        :rtype: Extrapolation
+        """
+
+        return converge_run(
+            self, output, rtol, atol, order, max_refinements, **inputs
+        )
+
+    def by_species(self, **inputs):
+        """Execute the experiment for a ``MultiSample`` and sum the species.
+
+        The nodes that do not depend on the sample, such as the field and
+        its gradients, are executed once for all the species. The species
+        axis is the last axis of the results (see
+        ``component.MultiSample``), which holds for the results that are
+        sums over the grid, and for the spectra and the sweeps, whose
+        batch axes follow the frequency or the sweep axes. The amplitude
+        sweeps need ``x_0p_array[:, np.newaxis]`` so that the amplitude axis
+        comes before the species axis. The single spin experiments, whose
+        results are not sums over the grid, are not supported.
+
+        :param inputs: the experiment inputs, with a ``MultiSample`` as the
+            sample
+        :return: the per-species results and the results summed over the
+            species, as tuples if the experiment has more than one return
+        :rtype: tuple
+        :raises ValueError: if no input is a ``MultiSample``, or if the last
+            axis of a result is not the species axis
+        """
+
+        species = [
+            len(value.spin)
+            for value in inputs.values()
+            if isinstance(value, MultiSample)
+        ]
+        if not species:
+            raise ValueError("by_species requires a MultiSample input")
+
+        result = self(**inputs)
+        results = result if len(self.returns) > 1 else (result,)
+        for name, value in zip(self.returns, results):
+            if np.shape(value)[-1:] != (species[0],):
+                raise ValueError(
+                    f"the last axis of {name!r} with the shape {np.shape(value)} "
+                    f"is not the axis of the {species[0]} species"
+                )
+        if len(self.returns) > 1:
+            return result, tuple(np.sum(value, axis=-1) for value in result)
+        return result, np.sum(result, axis=-1)
+
     def __str__(self):
         return experimentformatter(self)
@@ -0,0 +1,411 @@
+"""Plan the memory of an experiment execution without running the kernels.
+
+The graph is walked in the execution order of the handler. The output shape
+and dtype of each node are derived from the shapes of its inputs, starting
+from the grid, the extension parameters, and the batch axes of the inputs.
+The nodes that only depend on small inputs, such as the extended grid
+arrays and the number of extension points, are executed, because their
+results determine the shapes downstream. The arrays of the grid size are
+never allocated.
+
+The shape rules are defined for the formula functions in ``SHAPE_RULES``.
+A node function without a rule is treated as element-wise: the output has
+the broadcast shape of the array inputs. Each rule also estimates the
+temporary arrays allocated inside the function (the workspace), and an
+intermediate value is released when the last node that uses it has been
+executed, as in ``mmodel.MemHandler``. The memory of the inputs is not
+included.
+"""
+
+import math
+import numpy as np
+from mmodel.utility import graph_topological_sort
+from mrfmsim import formula
+from mrfmsim.formula.math import GRID_NDIM, split_position, weight_factors
+from mrfmsim.fusion import FusedKernel
+from mrfmsim.chunk import block_inputs, check_grid
+
+FLOAT = np.dtype(np.float64)
+
+
+class ArraySpec:
+    """Shape and dtype of an array that is not allocated.
+
+    :param tuple shape: the array shape
+    :param dtype: the array dtype
+    :param ArraySpec base: the array that a view refers to, the view
+        itself does not hold memory
+    """
+
+    def __init__(self, shape, dtype=FLOAT, base=None):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.base = base
+
+    @property
+    def size(self):
+        return math.prod(self.shape)
+
+    @property
+    def nbytes(self):
+        return 0 if self.base is not None else self.size * self.dtype.itemsize
+
+    def __repr__(self):
+        return f"ArraySpec(shape={self.shape}, dtype={self.dtype})"
+
+
+def _shape(value):
+    return value.shape if isinstance(value, ArraySpec) else np.shape(value)
+
+
+def _broadcast(*values):
+    return np.broadcast_shapes(*map(_shape, values))
+
+
+def _nbytes(value):
+    """Memory held by a value, views and scalars hold none."""
+
+    if isinstance(value, ArraySpec):
+        return value.nbytes
+    if isinstance(value, np.ndarray):
+        return value.nbytes if value.base is None else 0
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def _shrink_x(shape, ext_pts):
+    """Remove the extension points from the x axis of a shape."""
+
+    shape = list(shape)
+    shape[max(len(shape) - GRID_NDIM, 0)] -= 2 * int(ext_pts)
+    return tuple(shape)
+
+
+def _field_shape(method, grid_array, h):
+    """Grid shape with the batch axes of the separations and magnet origins."""
+
+    shapes = [np.shape(g) for g in grid_array]
+    shapes += [np.shape(c) for c in split_position(h)]
+    origin = getattr(getattr(method, "__self__", None), "magnet_origin", None)
+    if origin is not None:
+        shapes += [np.shape(c) for c in split_position(origin)]
+    return np.broadcast_shapes(*shapes)
+
+
+def field_rule(method, grid_array, h):
+    # the magnet kernel result is scaled by the prefactor
+    out = ArraySpec(_field_shape(method, grid_array, h))
+    return out, out.nbytes
+
+
+def xtrapz_rule(Bzx_method, grid_array, h, trapz_pts, x_0p):
+    # the integrand, and the sum and product of the trapezoidal rule,
+    # for all theta
+    out = ArraySpec(_field_shape(Bzx_method, grid_array, h))
+    return out, 3 * int(trapz_pts / 2) * out.nbytes
+
+
+def xtrapz_batch_rule(
+    Bzx_method, grid_array, h, trapz_pts, x_0p_array, grid_point_set=False
+):
+    shape = _field_shape(Bzx_method, grid_array, h)
+    out, grid = ArraySpec(np.shape(x_0p_array) + shape), ArraySpec(shape)
+    x = np.ravel(grid_array[0])
+    if grid_point_set or x.size < 2:
+        # each amplitude is evaluated with xtrapz_field_gradient
+        return out, xtrapz_rule(Bzx_method, grid_array, h, trapz_pts, 1.0)[1]
+    # the field on the fine x line, which covers the grid shifted by the
+    # largest amplitude, and the integral and the term of one amplitude
+    step = np.ptp(x) / (x.size - 1)
+    extent = x.size - 1 + 2 * np.max(np.abs(x_0p_array)) / step
+    n_line = formula.LINE_REFINE * extent + 5
+    return out, int(n_line * grid.nbytes / x.size) + 2 * grid.nbytes
+
+
+def min_abs_offset_rule(ext_B_offset, ext_pts):
+    # the absolute values of the extended offsets, the window comparisons,
+    # and the window minimum
+    ext = ArraySpec(_shape(ext_B_offset))
+    out = ArraySpec(_shrink_x(ext.shape, ext_pts))
+    window = 2 * int(ext_pts) + 1
+    return out, ext.nbytes + out.size * window + out.nbytes
+
+
+def min_abs_offset_nested_rule(ext_B_offset, ext_pts_array):
+    center = ArraySpec(_shrink_x(_shape(ext_B_offset), np.max(ext_pts_array)))
+    out = ArraySpec((np.size(ext_pts_array),) + center.shape)
+    return out, 3 * center.nbytes
+
+
+def rel_dpol_sat_td_rule(Bzx, B1, ext_B_offset, ext_pts, Gamma, T2, tip_v):
+    # the arctangent of the extended offsets and the window terms
+    ext = ArraySpec(_broadcast(ext_B_offset, B1, Gamma, T2))
+    center = ArraySpec(_shrink_x(ext.shape, ext_pts))
+    out = ArraySpec(_broadcast(Bzx, B1, Gamma, tip_v, center))
+    return out, ext.nbytes + 3 * out.nbytes
+
+
+def rel_dpol_sat_td_nested_rule(Bzx, B1, ext_B_offset, ext_pts_array, *args):
+    # the arctangent is computed once on the largest extended grid
+    ext = ArraySpec(_broadcast(ext_B_offset, B1))
+    center = ArraySpec(_shrink_x(ext.shape, np.max(ext_pts_array)))
+    grid = ArraySpec(_broadcast(Bzx, B1, center))
+    out = ArraySpec((np.size(ext_pts_array),) + grid.shape)
+    return out, ext.nbytes + 3 * grid.nbytes
+
+
+def rel_dpol_sat_td_smallsteps_rule(B1, ext_Bzx, ext_B_offset, ext_pts, *args):
+    # the field and the offsets with the x axis moved to the front, and the
+    # window steps of one block of columns
+    ext = ArraySpec(_broadcast(ext_Bzx, ext_B_offset, B1, *args))
+    return ArraySpec(_shrink_x(ext.shape, ext_pts)), 2 * ext.nbytes
+
+
+def slice_matrix_rule(matrix, shape):
+    matrix_shape = _shape(matrix)
+    batch = matrix_shape[: len(matrix_shape) - len(shape)]
+    base = matrix if isinstance(matrix, ArraySpec) else None
+    return ArraySpec(batch + tuple(shape), base=base), 0
+
+
+def reduction_rule(*args):
+    args = weight_factors(args)
+    return ArraySpec(_broadcast(*args)[:-GRID_NDIM]), 0
+
+
+def field_index_rule(Bz):
+    # the sorted order (intp) and the sorted field (float64) of each voxel
+    index = np.dtype([("order", np.intp), ("field", np.float64)])
+    return ArraySpec((math.prod(_shape(Bz)),), index), ArraySpec(_shape(Bz)).nbytes
+
+
+def sweep_rule(Bz_index, field, B0, f_rf, *args):
+    return ArraySpec(_broadcast(B0, f_rf)), 0
+
+
+def spectrum_rule(B_tot, weight, f_rf_array, *args):
+    # the lineshape, the weights, and the histogram positions of the voxels
+    voxels = ArraySpec(_broadcast(B_tot, weight))
+    return ArraySpec(np.shape(f_rf_array)), 3 * voxels.nbytes
+
+
+SHAPE_RULES = {
+    formula.field_func: field_rule,
+    formula.xtrapz_field_gradient: xtrapz_rule,
+    formula.xtrapz_field_gradient_batch: xtrapz_batch_rule,
+    formula.min_abs_offset: min_abs_offset_rule,
+    formula.min_abs_offset_nested: min_abs_offset_nested_rule,
+    formula.rel_dpol_sat_td: rel_dpol_sat_td_rule,
+    formula.rel_dpol_sat_td_nested: rel_dpol_sat_td_nested_rule,
+    formula.rel_dpol_sat_td_smallsteps: rel_dpol_sat_td_smallsteps_rule,
+    formula.slice_matrix: slice_matrix_rule,
+    formula.sum_of_product: reduction_rule,
+    formula.neg_sum_of_product: reduction_rule,
+    formula.field_index: field_index_rule,
+    formula.sweep_dF_spin_ibm_cyclic: sweep_rule,
+    formula.sweep_dF2_spin_ibm_cyclic: sweep_rule,
+    formula.sweep_dk_spin_arp: sweep_rule,
+    formula.spectrum_sat_steadystate: spectrum_rule,
+}
+
+
+def node_rule(func):
+    """Return the shape rule of a node function, None for the default."""
+
+    if isinstance(func, FusedKernel):
+        return reduction_rule
+    return SHAPE_RULES.get(func)
+
+
+class NodePlan:
+    """Planned output and memory of a node.
+
+    :ivar str node: the node name
+    :ivar str output: the output name
+    :ivar value: the ``ArraySpec`` of the output, or the value of an
+        executed node
+    :ivar int nbytes: memory of the output [bytes]
+    :ivar int workspace: estimated temporary memory of the node [bytes]
+    :ivar int peak: memory held while the node executes, including the
+        live intermediate values [bytes]
+    """
+
+    def __init__(self, node, output, value, nbytes, workspace, peak):
+        self.node = node
+        self.output = output
+        self.value = value
+        self.nbytes = nbytes
+        self.workspace = workspace
+        self.peak = peak
+
+    @property
+    def shape(self):
+        """Shape of the output, None for an output that is not an array."""
+        if isinstance(self.value, (ArraySpec, np.ndarray)):
+            return self.value.shape
+        return () if np.isscalar(self.value) else None
+
+    @property
+    def dtype(self):
+        if isinstance(self.value, ArraySpec):
+            return self.value.dtype
+        return getattr(self.value, "dtype", None)
+
+
+def _format_bytes(nbytes):
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if nbytes < 1024 or unit == "GiB":
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{nbytes} B"
+        nbytes /= 1024
+
+
+class MemoryPlan:
+    """Memory plan of an experiment execution.
+
+    :ivar list nodes: ``NodePlan`` of each node in execution order
+    :ivar int peak: the peak memory of the intermediate values [bytes]
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.peak = max((node.peak for node in nodes), default=0)
+
+    def __str__(self):
+        width = max([len(node.node) for node in self.nodes] + [4])
+        lines = [
+            f"{'node':<{width}}  {'shape':<22} {'output':>10} {'workspace':>10}"
+            f" {'peak':>10}"
+        ]
+        for node in self.nodes:
+            lines.append(
+                f"{node.node:<{width}}  {str(node.shape):<22}"
+                f" {_format_bytes(node.nbytes):>10}"
+                f" {_format_bytes(node.workspace):>10}"
+                f" {_format_bytes(node.peak):>10}"
+            )
+        lines.append(f"peak memory: {_format_bytes(self.peak)}")
+        return "\n".join(lines)
+
+
+def node_inputs(experiment, inputs):
+    """Experiment inputs with the defaults and the component attributes."""
+
+    bound = experiment.signature.bind(**inputs)
+    bound.apply_defaults()
+    values = dict(bound.arguments)
+    replacements = getattr(experiment, "_param_replacements", {})
+    for component, attributes in replacements.items():
+        if component in values:
+            obj = values.pop(component)
+            for attribute in attributes:
+                values[attribute] = getattr(obj, attribute)
+    return values
+
+
+def plan(experiment, **inputs):
+    """Plan the memory of an experiment execution.
+
+    :param Experiment experiment: the experiment
+    :param inputs: the experiment inputs
+    :rtype: MemoryPlan
+    """
+
+    graph = experiment.graph
+    values = node_inputs(experiment, inputs)
+    order = list(graph_topological_sort(graph))
+
+    # the number of nodes that use each intermediate value
+    counter = {}
+    for _, node_attr in order:
+        for name in node_attr["signature"].parameters:
+            counter[name] = counter.get(name, 0) + 1
+
+    live = {}
+    nodes = []
+    for node, node_attr in order:
+        kwargs = {key: values[key] for key in node_attr["signature"].parameters}
+        node_object = node_attr["node_object"]
+        rule = node_rule(node_object.func)
+        arrays = [
+            v for v in kwargs.values() if isinstance(v, (ArraySpec, np.ndarray))
+        ]
+        if rule is not None:
+            # the node inputs map to the function parameters in order
+            value, workspace = rule(*kwargs.values())
+        elif any(isinstance(v, ArraySpec) for v in arrays):
+            value, workspace = ArraySpec(_broadcast(*arrays)), 0
+        else:
+            value, workspace = node_object.node_func(**kwargs), 0
+
+        nbytes = _nbytes(value)
+        held = sum(_nbytes(v) for v in live.values())
+        output = node_attr["output"]
+        nodes.append(
+            NodePlan(node, output, value, nbytes, workspace, held + workspace + nbytes)
+        )
+
+        values[output] = value
+        live[output] = value
+        for name in kwargs:
+            counter[name] -= 1
+        _release(live, counter, experiment.returns)
+    return MemoryPlan(nodes)
+
+
+def _release(live, counter, returns):
+    """Release the values that are not used anymore.
+
+    A view keeps its base alive until the view is released.
+    """
+
+    released = True
+    while released:
+        bases = {id(v.base) for v in live.values() if getattr(v, "base", None)}
+        unused = [
+            name
+            for name, value in live.items()
+            if counter.get(name, 0) == 0
+            and name not in returns
+            and id(value) not in bases
+        ]
+        for name in unused:
+            del live[name]
+        released = bool(unused)
+
+
+def plan_block_shape(experiment, max_bytes, **inputs):
+    """Find the largest block of (y, z) columns with a planned peak in budget.
+
+    :param Experiment experiment: the experiment
+    :param int max_bytes: the peak memory budget of a block [bytes]
+    :param inputs: the experiment inputs, including "grid"
+    :return: the number of y and z points of the blocks, None if a single
+        column exceeds the budget
+    :rtype: tuple(int, int)
+    :raises ValueError: if the grid is not a ``Grid``
+    """
+
+    check_grid(inputs["grid"], "block planning")
+    grid = inputs.pop("grid")
+    _, ny, nz = grid.grid_shape
+
+    def block_shape(columns):
+        bz = min(nz, columns)
+        return min(ny, columns // bz), bz
+
+    def fits(columns):
+        by, bz = block_shape(columns)
+        block = block_inputs(grid, slice(0, by), slice(0, bz), **inputs)
+        return plan(experiment, **block).peak <= max_bytes
+
+    if not fits(1):
+        return None
+    low, high = 1, ny * nz
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return block_shape(low)
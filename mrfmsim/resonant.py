@@ -0,0 +1,218 @@
+"""Evaluate the signal sum only on the resonant voxels.
+
+Only the voxels near the resonant slice, where the relative polarization
+change is not negligible, contribute to the signal sum. After the
+polarization is known, the voxels with ``abs(rel_dpol) > tol`` are
+selected, and the field gradient nodes that feed the sum, for example
+"Bzxx" and "Bzxx trapz", are evaluated only at the gathered coordinates of
+the selected voxels. The sum of products runs over the selected voxels.
+
+The gathered coordinates have the shape ``(1, m, 1)``, so that the magnet
+methods and the trapezoidal integral, which shifts the x coordinate,
+evaluate each voxel at its own (x, y, z) position.
+
+The contribution of the dropped voxels is estimated from a random sample of
+them, which is split into ``ERROR_GROUPS`` groups. The standard error of the
+estimate is the spread of the group estimates, with the finite population
+correction. The estimate is stochastic and not a bound: the interval of two
+standard errors around it covers the contribution with about 95%
+confidence, if the sample is large enough for the group estimates to be
+near normal. The sample of the voxels with a rare large contribution, such
+as a narrow resonant shell just below ``tol``, can miss them. If the sample
+holds all the dropped voxels, the estimate is exact and the standard error
+is zero.
+"""
+
+import numpy as np
+import networkx as nx
+from mmodel.utility import graph_topological_sort
+from mrfmsim import formula
+from mrfmsim.formula.math import GRID_NDIM, SeparableWeights, is_separable
+from mrfmsim.fusion import reduction_node
+from mrfmsim.plan import node_inputs
+
+REDUCTIONS = [formula.sum_of_product, formula.neg_sum_of_product]
+GATHER_FUNCS = [formula.field_func, formula.xtrapz_field_gradient]
+# the number of groups of the dropped voxel sample for the standard error
+ERROR_GROUPS = 16
+
+
+def gathered_grid(grid_array, index):
+    """Return the coordinates of the voxels with the flat grid index.
+
+    :param list grid_array: the open mesh-grid
+    :param ndarray index: flat indices of the voxels
+    :return: the x, y, z coordinates, each with the shape ``(1, m, 1)``
+    :rtype: list
+    """
+
+    grid_shape = tuple(np.size(a) for a in grid_array)
+    indices = np.unravel_index(index, grid_shape)
+    return [np.ravel(a)[i].reshape(1, -1, 1) for a, i in zip(grid_array, indices)]
+
+
+def gather(value, index, grid_shape):
+    """Gather the voxels of a value with the grid axes.
+
+    The three grid axes are replaced by the gathered axes ``(1, m, 1)``,
+    and the leading batch axes are kept. The values without the grid
+    axes, such as scalars and the ``(n, 1, 1, 1)`` batches, are returned
+    unchanged, and the separable weights are gathered per factor.
+    """
+
+    if is_separable(value):
+        return SeparableWeights(gather(v, index, grid_shape) for v in value)
+    shape = np.shape(value)
+    if len(shape) < GRID_NDIM or shape[-GRID_NDIM:] == (1,) * GRID_NDIM:
+        return value
+    indices = np.unravel_index(index, grid_shape)
+    # the broadcast axes of the value are indexed at 0
+    indices = tuple(i if n > 1 else 0 for i, n in zip(indices, shape[-GRID_NDIM:]))
+    gathered = np.asarray(value)[(Ellipsis,) + indices]
+    return gathered.reshape(shape[:-GRID_NDIM] + (1, -1, 1))
+
+
+def resonant_mask(rel_dpol, tol):
+    """Select the voxels where the polarization change exceeds the tolerance.
+
+    A voxel is selected if ``abs(rel_dpol) > tol`` for any member of the
+    batch axes.
+
+    :param ndarray rel_dpol: the relative polarization change
+    :param float tol: the tolerance
+    :return: the boolean mask with the grid shape
+    :rtype: ndarray
+    """
+
+    mask = np.abs(rel_dpol) > tol
+    return mask.reshape((-1,) + mask.shape[-GRID_NDIM:]).any(axis=0)
+
+
+def gathered_nodes(graph, node, mask_node):
+    """The field nodes that only feed the sum and do not affect the mask."""
+
+    mask_ancestors = nx.ancestors(graph, mask_node) | {mask_node}
+    return [
+        field_node
+        for field_node in graph.predecessors(node)
+        if graph.nodes[field_node]["node_object"].func in GATHER_FUNCS
+        and "grid_array" in graph.nodes[field_node]["signature"].parameters
+        and field_node not in mask_ancestors
+        and list(graph.successors(field_node)) == [node]
+    ]
+
+
+def resonant_run(
+    experiment,
+    output,
+    tol,
+    mask_factor="rel_dpol",
+    error_samples=1024,
+    seed=0,
+    **inputs,
+):
+    """Execute the experiment with the sum of ``output`` on the resonant voxels.
+
+    :param Experiment experiment: the experiment
+    :param str output: the output of a sum-of-product node, for example
+        "dk_spin"
+    :param float tol: the tolerance of ``abs(rel_dpol)`` for a voxel to be
+        included
+    :param str mask_factor: the factor of the sum that selects the voxels
+    :param int error_samples: number of dropped voxels used to estimate
+        their contribution
+    :param int seed: the seed of the dropped voxel sample
+    :param inputs: the experiment inputs, including "grid"
+    :return: the experiment results, the estimated contribution of the
+        dropped voxels to ``output``, and the standard error of the estimate
+    :rtype: tuple
+    :raises ValueError: if ``mask_factor`` is not a factor of the sum, or
+        is not the output of a node
+    """
+
+    graph = experiment.graph
+    node = reduction_node(graph, output, REDUCTIONS)
+    factors = list(graph.nodes[node]["signature"].parameters)
+    if mask_factor not in factors:
+        raise ValueError(f"{mask_factor!r} is not a factor of {output!r}")
+    mask_node = next(
+        (
+            n
+            for n in graph.predecessors(node)
+            if graph.nodes[n]["node_object"].output == mask_factor
+        ),
+        None,
+    )
+    if mask_node is None:
+        raise ValueError(
+            f"{mask_factor!r} is not the output of a node, and cannot select "
+            "the voxels"
+        )
+    deferred = gathered_nodes(graph, node, mask_node)
+
+    values = node_inputs(experiment, inputs)
+    for name, node_attr in graph_topological_sort(graph):
+        if name in deferred:
+            continue
+        node_object = node_attr["node_object"]
+        if name == node:
+            value, estimate, stderr = _resonant_sum(
+                graph, node, deferred, values, tol, mask_factor, error_samples, seed
+            )
+        else:
+            kwargs = {key: values[key] for key in node_attr["signature"].parameters}
+            value = node_object.node_func(**kwargs)
+        values[node_attr["output"]] = value
+
+    result = tuple(values[name] for name in experiment.returns)
+    return (result if len(result) > 1 else result[0]), estimate, stderr
+
+
+def _resonant_sum(graph, node, deferred, values, tol, mask_factor, samples, seed):
+    """The selected voxel sum, and the dropped voxel estimate and its error."""
+
+    grid_shape = np.shape(values[mask_factor])[-GRID_NDIM:]
+    mask = resonant_mask(values[mask_factor], tol).ravel()
+
+    fields = {graph.nodes[n]["output"]: graph.nodes[n] for n in deferred}
+    node_attr = graph.nodes[node]
+
+    def partial_sum(index):
+        coordinates = gathered_grid(values["grid_array"], index)
+        kwargs = {}
+        for key in node_attr["signature"].parameters:
+            if key in fields:
+                field_attr = fields[key]
+                field_kwargs = {
+                    k: values[k] for k in field_attr["signature"].parameters
+                }
+                field_kwargs["grid_array"] = coordinates
+                kwargs[key] = field_attr["node_object"].node_func(**field_kwargs)
+            else:
+                kwargs[key] = gather(values[key], index, grid_shape)
+        return node_attr["node_object"].node_func(**kwargs)
+
+    kept, dropped = np.flatnonzero(mask), np.flatnonzero(~mask)
+    if dropped.size > samples:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(dropped, size=samples, replace=False)
+        groups = np.array_split(sample, min(ERROR_GROUPS, samples))
+        sums = np.stack([partial_sum(np.sort(group)) for group in groups])
+        sizes = np.array([group.size for group in groups])
+        estimate = np.sum(sums, axis=0) * (dropped.size / samples)
+        # the spread of the group estimates, scaled to the whole sample; a
+        # single group has no spread
+        means = sums / sizes.reshape((-1,) + (1,) * (sums.ndim - 1))
+        variance = np.var(means, axis=0, ddof=1) if len(groups) > 1 else np.inf
+        correction = 1 - samples / dropped.size
+        stderr = dropped.size * np.sqrt(variance / len(groups) * correction)
+    elif dropped.size:
+        estimate = partial_sum(dropped)
+        stderr = 0 * estimate
+    else:
+        estimate = None
+
+    value = partial_sum(kept) if kept.size else 0 * estimate
+    if estimate is None:
+        estimate = stderr = 0 * value
+    return value, estimate, stderr
@@ -0,0 +1,168 @@
+"""Adaptive sampling of a signal over a swept parameter.
+
+Sweeps of ``f_rf`` or ``B0`` are mostly used to locate the peaks, widths,
+and zero crossings of the signal, which are narrow compared with the swept
+range. Instead of evaluating the experiment on a fine uniform grid, the
+sampler starts from a coarse grid and bisects only the intervals where the
+signal bends, until the linear interpolation between the samples is within
+the tolerance.
+
+The curvature of each interval is estimated from the second divided
+differences of the neighboring samples. The error of the linear
+interpolation over an interval of width :math:`h` with second derivative
+:math:`f''` is :math:`|f''| h^2 / 8`. Features narrower than the initial
+spacing can be missed, so the initial grid should resolve the narrowest
+expected feature at least once.
+"""
+
+from collections import namedtuple
+import numpy as np
+
+SpectrumFeatures = namedtuple(
+    "SpectrumFeatures", ["peaks", "peak_values", "widths", "zero_crossings"]
+)
+SpectrumFeatures.__doc__ = """Features of a sampled signal.
+
+:param ndarray peaks: positions of the local extrema
+:param ndarray peak_values: signal values at the local extrema
+:param ndarray widths: full widths at half of the peak values, nan if the
+    half value is not reached within the sampled range
+:param ndarray zero_crossings: positions where the signal changes sign
+"""
+
+
+def _interval_loss(x, y):
+    """Estimate the linear interpolation error of each interval."""
+
+    slope = np.diff(y) / np.diff(x)
+    curvature = np.abs(2 * np.diff(slope) / (x[2:] - x[:-2]))
+    # each interval takes the larger curvature of its two neighboring triples
+    interval_curvature = np.zeros(x.size - 1)
+    interval_curvature[:-1] = curvature
+    interval_curvature[1:] = np.maximum(interval_curvature[1:], curvature)
+    return interval_curvature * np.diff(x) ** 2 / 8
+
+
+def adaptive_sample(
+    func, bounds, tol=1e-3, n_initial=17, max_points=500, min_step=None
+):
+    """Sample a scalar function over a range by adaptive bisection.
+
+    The function is first evaluated on ``n_initial`` evenly spaced points.
+    In each round, the intervals with an estimated interpolation error
+    larger than ``tol`` times the range of the sampled values are bisected,
+    the worst intervals first. The sampling stops when no interval exceeds
+    the tolerance, or when ``max_points`` evaluations are reached.
+
+    :param callable func: function of a single float that returns a float
+    :param tuple bounds: the lower and upper bounds of the range
+    :param float tol: interpolation error relative to the range of the signal
+    :param int n_initial: number of initial evenly spaced points, at least 3
+    :param int max_points: maximum number of function evaluations
+    :param float min_step: intervals narrower than twice the step are not
+        bisected, defaults to 1e-9 times the range
+    :return: sorted sample positions and values
+    :rtype: tuple(ndarray, ndarray)
+    """
+
+    if n_initial < 3:
+        raise ValueError("n_initial should be at least 3")
+    if min_step is None:
+        min_step = abs(bounds[1] - bounds[0]) * 1e-9
+
+    x = np.linspace(bounds[0], bounds[1], n_initial)
+    y = np.array([func(value) for value in x], dtype=np.float64)
+
+    while x.size < max_points:
+        scale = np.ptp(y)
+        if scale == 0:
+            break
+        loss = _interval_loss(x, y)
+        loss[np.diff(x) < 2 * min_step] = 0
+        refine = np.flatnonzero(loss > tol * scale)
+        if refine.size == 0:
+            break
+        refine = refine[np.argsort(loss[refine])[::-1]][: max_points - x.size]
+
+        new_x = (x[refine] + x[refine + 1]) / 2
+        new_y = np.array([func(value) for value in new_x], dtype=np.float64)
+        order = np.argsort(np.concatenate([x, new_x]), kind="stable")
+        x = np.concatenate([x, new_x])[order]
+        y = np.concatenate([y, new_y])[order]
+
+    return x, y
+
+
+def _crossing(x0, x1, y0, y1, level):
+    """Linear interpolation of the position where the signal reaches level."""
+    return x0 + (level - y0) * (x1 - x0) / (y1 - y0)
+
+
+def _vertex(x, y):
+    """Vertex of the parabola through three points."""
+
+    (x0, x1, x2), (y0, y1, y2) = x, y
+    d01 = (y1 - y0) / (x1 - x0)
+    d12 = (y2 - y1) / (x2 - x1)
+    a = (d12 - d01) / (x2 - x0)
+    if a == 0:
+        return x1, y1
+    b = d01 - a * (x0 + x1)
+    vertex = -b / (2 * a)
+    return vertex, y0 + d01 * (vertex - x0) + a * (vertex - x0) * (vertex - x1)
+
+
+def spectrum_features(x, y, tol=1e-3):
+    """Estimate the peaks, widths, and zero crossings of a sampled signal.
+
+    The peaks are the interior local extrema, refined with a parabola
+    through the extremum and its neighbors. Extrema smaller than ``tol``
+    times the range of the signal are ignored. The widths are the full
+    widths at half of the peak value, with the signal going to zero away
+    from the resonance.
+
+    :param ndarray x: sorted sample positions
+    :param ndarray y: sample values
+    :param float tol: threshold of the extrema relative to the range of y
+    :rtype: SpectrumFeatures
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    threshold = tol * np.ptp(y)
+
+    peaks, peak_values, widths = [], [], []
+    for i in range(1, x.size - 1):
+        is_max = y[i] >= y[i - 1] and y[i] > y[i + 1]
+        is_min = y[i] <= y[i - 1] and y[i] < y[i + 1]
+        if not (is_max or is_min) or abs(y[i]) <= threshold:
+            continue
+        position, value = _vertex(x[i - 1 : i + 2], y[i - 1 : i + 2])
+        peaks.append(position)
+        peak_values.append(value)
+
+        # walk outwards until the signal falls below half of the peak value
+        half = value / 2
+        beyond = np.abs(y) < abs(half)
+        left = np.flatnonzero(beyond[:i])
+        right = np.flatnonzero(beyond[i + 1 :]) + i + 1
+        if left.size and right.size:
+            j, k = left[-1], right[0]
+            widths.append(
+                _crossing(x[k - 1], x[k], y[k - 1], y[k], half)
+                - _crossing(x[j], x[j + 1], y[j], y[j + 1], half)
+            )
+        else:
+            widths.append(np.nan)
+
+    sign_change = np.flatnonzero(np.sign(y[:-1]) * np.sign(y[1:]) < 0)
+    zero_crossings = [
+        _crossing(x[i], x[i + 1], y[i], y[i + 1], 0.0) for i in sign_change
+    ]
+
+    return SpectrumFeatures(
+        np.array(peaks),
+        np.array(peak_values),
+        np.array(widths),
+        np.array(zero_crossings),
+    )
@@ -0,0 +1,122 @@
+"""Scan the tip over lateral positions with a single field evaluation.
+
+For a tip position :math:`h`, the field nodes evaluate the magnet field at
+the grid points shifted by :math:`-h`. If the scan positions differ by whole
+grid steps, the shifted grids of all the scan points are windows of one
+grid padded by the scan extent. The field is evaluated once on the padded
+grid, and each scan point receives a sliced view of it, without copying.
+
+Only the nodes that use ``formula.field_func`` are replaced. The other
+nodes, and the nodes with modifiers, are executed for each scan point.
+"""
+
+import threading
+from inspect import Parameter, Signature
+import numpy as np
+from mrfmsim import formula
+from mrfmsim.node import Node
+
+
+def scan_offsets(h_array, grid_step, atol=1e-6):
+    """Convert the scan positions to whole grid steps from the first position.
+
+    :param ndarray h_array: scan positions, shape (n, 3) [nm]
+    :param list grid_step: grid step size [nm]
+    :param float atol: tolerance of the alignment in units of grid step
+    :return: integer offsets, shape (n, 3)
+    :rtype: ndarray
+    :raises ValueError: if the positions are not aligned to the grid step
+    """
+
+    h_array = np.atleast_2d(np.asarray(h_array, dtype=np.float64))
+    steps = (h_array - h_array[0]) / np.asarray(grid_step, dtype=np.float64)
+    offsets = np.rint(steps)
+    if not np.allclose(steps, offsets, rtol=0, atol=atol):
+        raise ValueError("the scan positions should be aligned to the grid step")
+    return offsets.astype(int)
+
+
+class ScanField:
+    """Field function that evaluates the field once for all scan points.
+
+    The padded field is computed for the first call with a given method and
+    grid, and cached. Later calls return the window of the scan point ``h``.
+    The cache is shared by the scan points that run in parallel threads.
+
+    :param ndarray h0: the first scan position [nm]
+    :param list grid_step: grid step size [nm]
+    :param ndarray offsets: integer offsets of the scan positions
+    """
+
+    __signature__ = Signature(
+        [
+            Parameter(name, Parameter.POSITIONAL_OR_KEYWORD)
+            for name in ["method", "grid_array", "h"]
+        ]
+    )
+    __name__ = "scan_field_func"
+    __doc__ = "Calculate the field from a window of the padded scan field."
+
+    def __init__(self, h0, grid_step, offsets):
+        self.h0 = np.asarray(h0, dtype=np.float64)
+        self.grid_step = np.asarray(grid_step, dtype=np.float64)
+        self.offset_min = offsets.min(axis=0)
+        self.offset_max = offsets.max(axis=0)
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        """Graph copies share the field cache."""
+        return self
+
+    def padded_field(self, method, grid_array):
+        """Evaluate the field on the grid padded by the scan extent."""
+
+        key = (method,) + tuple((a.ravel()[0], a.shape) for a in grid_array)
+        with self._lock:
+            if key not in self._fields:
+                pad = self.offset_max - self.offset_min
+                padded_grid = []
+                for axis, a in enumerate(grid_array):
+                    shape = np.ones(len(grid_array), dtype=int)
+                    shape[axis] = a.size + pad[axis]
+                    index = np.arange(shape[axis]) - self.offset_max[axis]
+                    coordinate = a.ravel()[0] + index * self.grid_step[axis]
+                    padded_grid.append(coordinate.reshape(shape))
+                self._fields[key] = formula.field_func(method, padded_grid, self.h0)
+            return self._fields[key]
+
+    def __call__(self, method, grid_array, h):
+        padded = self.padded_field(method, grid_array)
+        offsets = scan_offsets([self.h0, h], self.grid_step)[1]
+        start = self.offset_max - offsets
+        return padded[tuple(slice(i, i + a.size) for i, a in zip(start, grid_array))]
+
+
+def scan_graph(graph, h0, grid_step, offsets):
+    """Replace the field_func nodes of the graph with ScanField nodes.
+
+    :param graph graph: experiment graph
+    :param ndarray h0: the first scan position [nm]
+    :param list grid_step: grid step size [nm]
+    :param ndarray offsets: integer offsets of the scan positions
+    :return: new graph
+    """
+
+    field_nodes = [
+        node
+        for node, node_object in graph.nodes(data="node_object")
+        if node_object.func is formula.field_func and not node_object.modifiers
+    ]
+    for node in field_nodes:
+        node_object = graph.nodes[node]["node_object"]
+        scan_node = Node(
+            node,
+            ScanField(h0, grid_step, offsets),
+            inputs=list(graph.nodes[node]["signature"].parameters),
+            output=node_object.output,
+            output_unit=getattr(node_object, "output_unit", None),
+            doc=node_object.doc,
+        )
+        graph = graph.replace_subgraph(graph.subgraph([node]), scan_node)
+    return graph
@@ -0,0 +1,71 @@
+from mrfmsim.bounding import bounding_grid, coarse_grid
+from mrfmsim.experiment import CermitESRGroup
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def magnet():
+    """Return the sphere magnet."""
+    return SphereMagnet(magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0])
+
+
+@pytest.fixture
+def sample():
+    """Return the electron sample."""
+    return Sample(
+        spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+    )
+
+
+def test_coarse_grid():
+    """Test the coarse grid spans the grid range."""
+
+    grid = Grid(grid_shape=[101, 5, 1], grid_step=[2, 10, 8], grid_origin=[0, 5, 3])
+    coarse = coarse_grid(grid, (11, 11, 11))
+    assert coarse.grid_shape == (11, 5, 1)
+    assert np.allclose(coarse.grid_extents, grid.grid_extents)
+
+
+def test_bounding_grid(magnet, sample):
+    """Test the bounded grid against the search grid for CermitESR."""
+
+    grid = Grid(
+        grid_shape=[81, 161, 41], grid_step=[8, 10, 8], grid_origin=[0, -800, 0]
+    )
+    args = (magnet, [0, 50, 0], 700, 17.7e9, sample.Gamma, 0.5)
+    bounded, distance = bounding_grid(grid, *args, x_0p=80, margin=20)
+
+    assert np.prod(bounded.grid_shape) * 3 < np.prod(grid.grid_shape)
+    assert np.all(distance[1] >= 20)
+    # the bounded grid points are the search grid points
+    offset = (bounded.grid_extents - grid.grid_extents) / np.c_[grid.grid_step]
+    assert np.allclose(offset, np.round(offset))
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        "f_rf": 17.7e9,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "mw_x_0p": 80,
+        "sample": sample,
+    }
+    assert np.isclose(
+        CermitESR(grid=bounded, **inputs), CermitESR(grid=grid, **inputs), rtol=1e-4
+    )
+
+    new, new_distance = bounding_grid(grid, *args, x_0p=80, grid_step=[4, 4, 4])
+    assert np.array_equal(new.grid_step, [4, 4, 4])
+    assert np.all(new_distance[1] >= 0)
+
+
+def test_bounding_grid_no_resonance(magnet, sample):
+    """Test the bounding raises an error if the grid is not resonant."""
+
+    grid = Grid(grid_shape=[11, 11, 11], grid_step=[8, 10, 8], grid_origin=[0, 0, 0])
+    with pytest.raises(ValueError, match="the sensitive region is not in the grid"):
+        bounding_grid(grid, magnet, [0, 50, 0], 700, 10e9, sample.Gamma, 0.5)
@@ -0,0 +1,230 @@
+from mrfmsim.chunk import (
+    grid_blocks,
+    peak_bytes,
+    budget_block_shape,
+    block_occupancy,
+)
+from mrfmsim.experiment import CermitESRGroup, IBMCyclic
+from mrfmsim.plan import plan_block_shape
+from mrfmsim.component import (
+    SphereMagnet,
+    Grid,
+    RectilinearGrid,
+    AdaptiveGrid,
+    PointGrid,
+    Sample,
+    Cantilever,
+)
+import numpy as np
+import pytest
+import dataclasses
+
+
+@pytest.fixture
+def grid():
+    """Return the grid object."""
+    return Grid(grid_shape=[41, 23, 17], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+
+
+@pytest.fixture
+def inputs(grid):
+    """Return the CermitESR inputs."""
+    return {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "sample": Sample(
+            spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+        ),
+    }
+
+
+def test_grid_blocks(grid):
+    """Test the blocks keep the x axis and cover the grid points once."""
+
+    blocks = grid_blocks(grid, (10, 5))
+    assert len(blocks) == 3 * 4
+    assert all(block.grid_shape[0] == 41 for block in blocks)
+    assert sum(np.prod(block.grid_shape) for block in blocks) == np.prod(
+        grid.grid_shape
+    )
+
+    y = np.concatenate([block.grid_array[1].ravel() for block in blocks[::4]])
+    z = np.concatenate([block.grid_array[2].ravel() for block in blocks[:4]])
+    assert np.allclose(y, grid.grid_array[1].ravel(), rtol=0, atol=1e-9)
+    assert np.allclose(z, grid.grid_array[2].ravel(), rtol=0, atol=1e-9)
+    assert np.array_equal(blocks[0].grid_array[0], grid.grid_array[0])
+
+
+def test_chunked_cermitesr(inputs):
+    """Test the chunked CermitESR with the extended grid against the full grid."""
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+
+    df_spin = CermitESR(**inputs)
+    assert np.isclose(CermitESR.chunked(block_shape=(4, 7), **inputs), df_spin)
+
+    max_bytes = peak_bytes(CermitESR, **inputs) // 4
+    block_shape = budget_block_shape(CermitESR, max_bytes, **inputs)
+    assert np.prod(block_shape) < 23 * 17
+
+    grid = inputs.pop("grid")
+    block = grid_blocks(grid, block_shape)[0]
+    assert peak_bytes(CermitESR, grid=block, **inputs) <= max_bytes
+    assert np.isclose(CermitESR.chunked(max_bytes, grid=grid, **inputs), df_spin)
+
+    with pytest.raises(ValueError, match="smaller than one grid column"):
+        CermitESR.chunked(max_bytes=1000, grid=grid, **inputs)
+
+
+def test_chunked_multiple_returns(inputs):
+    """Test the chunked IBMCyclic sums each of the returns."""
+
+    inputs = {key: inputs[key] for key in ["B0", "h", "magnet", "sample"]}
+    inputs["grid"] = Grid(
+        grid_shape=[41, 23, 17], grid_step=[8, 10, 8], grid_origin=[40, -50, 0]
+    )
+    inputs["f_rf"] = 16.1e9
+    inputs["df_fm"] = 1e9
+
+    result = IBMCyclic.chunked(block_shape=(5, 5), **inputs)
+    expected = IBMCyclic(**inputs)
+    assert len(result) == 2
+    assert np.all(np.array(expected) != 0)
+    assert np.allclose(result, expected, rtol=1e-10)
+
+
+def test_chunked_quadrature(inputs):
+    """Test the chunked execution requires the midpoint quadrature."""
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    inputs["grid"] = Grid(
+        grid_shape=[41, 23, 17],
+        grid_step=[8, 10, 8],
+        grid_origin=[0, -50, 0],
+        grid_quadrature="simpson",
+    )
+    with pytest.raises(ValueError, match="requires the midpoint quadrature"):
+        CermitESR.chunked(block_shape=(4, 7), **inputs)
+
+
+def test_chunked_grid_type(inputs, grid):
+    """Test the chunked execution and the block planning require a Grid."""
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    points = np.stack(
+        [np.broadcast_to(a, grid.grid_shape).ravel() for a in grid.grid_array],
+        axis=1,
+    )
+    grids = [
+        RectilinearGrid(*[np.ravel(a) for a in grid.grid_array]),
+        AdaptiveGrid(grid_points=points, grid_volumes=np.full(len(points), 640.0)),
+        PointGrid(grid_points=points),
+    ]
+    for other in grids:
+        inputs["grid"] = other
+        name = type(other).__name__
+        with pytest.raises(ValueError, match=f"requires a Grid, not {name}"):
+            CermitESR.chunked(block_shape=(4, 7), **inputs)
+        with pytest.raises(ValueError, match=f"requires a Grid, not {name}"):
+            plan_block_shape(CermitESR, 2**20, **inputs)
+
+
+@pytest.fixture
+def layer_density(grid, tmp_path):
+    """Return a memory-mapped spin density with a layer in the middle of y."""
+
+    path = tmp_path / "density.npy"
+    shape = tuple(grid.grid_shape)
+    density = np.lib.format.open_memmap(path, mode="w+", dtype="f8", shape=shape)
+    density[:] = 0
+    density[:, 8:13, 2:15] = 0.0241
+    density.flush()
+    return np.load(path, mmap_mode="r")
+
+
+def test_block_occupancy(layer_density):
+    """Test the occupancy index marks the blocks that overlap the layer."""
+
+    occupancy = block_occupancy(layer_density, (5, 4))
+    assert occupancy.shape == (5, 5)
+    expected = np.zeros((5, 5), dtype=bool)
+    expected[1:3, :4] = True
+    assert np.array_equal(occupancy, expected)
+
+
+def test_chunked_density(inputs, layer_density):
+    """Test the chunked CermitESR with a memory-mapped density.
+
+    The empty blocks are skipped, and the result equals the execution with
+    the density in memory.
+    """
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    sample = inputs.pop("sample")
+    expected = CermitESR(
+        sample=dataclasses.replace(sample, spin_density=np.array(layer_density)),
+        **inputs,
+    )
+
+    sample = dataclasses.replace(sample, spin_density=layer_density)
+    result = CermitESR.chunked(block_shape=(5, 4), sample=sample, **inputs)
+    assert result == pytest.approx(expected, rel=1e-10)
+
+    occupancy = block_occupancy(layer_density, (5, 4))
+    occupancy[1, 0] = False
+    result = CermitESR.chunked(
+        block_shape=(5, 4), occupancy=occupancy, sample=sample, **inputs
+    )
+    assert result != pytest.approx(expected, rel=1e-3)
+
+    max_bytes = peak_bytes(CermitESR, sample=sample, **inputs) // 4
+    result = CermitESR.chunked(max_bytes, sample=sample, **inputs)
+    assert result == pytest.approx(expected, rel=1e-10)
+
+    with pytest.raises(ValueError, match="the occupancy of 4 blocks"):
+        CermitESR.chunked(
+            block_shape=(5, 4), occupancy=np.ones(4), sample=sample, **inputs
+        )
+
+
+def test_chunked_broadcast_density(inputs):
+    """Test the chunked execution with a (1, ny, nz) density.
+
+    The density is sliced along y and z only, the occupancy is computed
+    from the density broadcast to the grid, and the results equal the
+    execution on the full grid.
+    """
+
+    density = np.zeros((1, 23, 17))
+    density[:, 8:13, 2:15] = 0.0241
+    sample = dataclasses.replace(inputs.pop("sample"), spin_density=density)
+
+    occupancy = block_occupancy(density, (5, 4), (41, 23, 17))
+    expected = np.zeros((5, 5), dtype=bool)
+    expected[1:3, :4] = True
+    assert np.array_equal(occupancy, expected)
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    result = CermitESR.chunked(block_shape=(5, 4), sample=sample, **inputs)
+    assert result != 0
+    assert result == pytest.approx(CermitESR(sample=sample, **inputs), rel=1e-10)
+
+    ibm_inputs = {key: inputs[key] for key in ["B0", "h", "magnet"]}
+    ibm_inputs["grid"] = Grid(
+        grid_shape=[41, 11, 9], grid_step=[8, 10, 8], grid_origin=[40, -50, 0]
+    )
+    ibm_inputs["sample"] = dataclasses.replace(
+        sample, spin_density=np.random.rand(1, 11, 9)
+    )
+    ibm_inputs["f_rf"] = 16.1e9
+    ibm_inputs["df_fm"] = 1e9
+    result = IBMCyclic.chunked(block_shape=(4, 4), **ibm_inputs)
+    assert np.allclose(result, IBMCyclic(**ibm_inputs), rtol=1e-10)
@@ -138,3 +138,29 @@ class TestCylinderMagnet:
         """
         Bzx = self.magnet.Bzx_method(0, 10, 0)
         assert np.allclose(Bzx, 0, atol=1e-10)
+
+    def test_origin_batch(self):
+        """Test a stack of magnet origins against a loop over the origins."""
+
+        origins = np.array([[0, 0, 0], [0.5, -1, 2], [0.2, 0, 8]])
+        batch_magnet = CylinderMagnetApprox(
+            magnet_radius=0.5, magnet_length=10, magnet_origin=origins, mu0_Ms=1
+        )
+        grid = np.ogrid[-1:1:2j, -1:1:5j, 15:18:4j]
+
+        for method in ["Bz_method", "Bzx_method", "Bzxx_method"]:
+            expected = [
+                getattr(
+                    CylinderMagnetApprox(
+                        magnet_radius=0.5,
+                        magnet_length=10,
+                        magnet_origin=list(origin),
+                        mu0_Ms=1,
+                    ),
+                    method,
+                )(*grid)
+                for origin in origins
+            ]
+            result = getattr(batch_magnet, method)(*grid)
+            assert result.shape == (3, 2, 5, 4)
+            assert np.array_equal(result, expected)
@@ -5,7 +5,15 @@
 
 import numpy as np
 import pytest
-from mrfmsim.component import Grid
+from mrfmsim.component import (
+    Grid,
+    RectilinearGrid,
+    AdaptiveGrid,
+    PointGrid,
+    SphereMagnet,
+)
+from mrfmsim.component.grid import quadrature_weights
+from mrfmsim.formula import sum_of_product, SeparableWeights
 from textwrap import dedent
 
 
@@ -27,6 +35,7 @@ class TestGrid:
           grid_shape = (11, 5, 9)
           grid_step = [1.1, 0.4, 1.1] nm
           grid_origin = [1.0, 1.0, 1.0] nm
+          grid_quadrature = 'midpoint'
           grid_voxel = 0.484 nm^3
           grid_range = [11.0, 1.6, 8.8] nm
           grid_length = [12.1, 2.0, 9.9] nm"""
@@ -109,3 +118,229 @@ class TestGrid:
         )
         assert np.array_equal(ext_grid_array[1], grid.grid_array[1])
         assert np.array_equal(ext_grid_array[2], grid.grid_array[2])
+
+
+    def test_quadrature_weights(self):
+        """Test the composite quadrature weights and the number of points."""
+
+        assert np.array_equal(quadrature_weights(4, "midpoint"), [1, 1, 1, 1])
+        assert np.array_equal(quadrature_weights(4, "trapezoid"), [0.5, 1, 1, 0.5])
+        assert np.allclose(
+            quadrature_weights(5, "simpson"), np.array([1, 4, 2, 4, 1]) / 3
+        )
+        assert np.allclose(
+            quadrature_weights(9, "boole"),
+            np.array([7, 32, 12, 32, 14, 32, 12, 32, 7]) * 2 / 45,
+        )
+        assert np.array_equal(quadrature_weights(1, "boole"), [1])
+
+        with pytest.raises(ValueError, match="odd number of points"):
+            quadrature_weights(4, "simpson")
+        with pytest.raises(ValueError, match="4k \\+ 1 points"):
+            quadrature_weights(7, "boole")
+        with pytest.raises(ValueError, match="unknown quadrature rule 'gauss'"):
+            Grid(
+                grid_shape=(3, 3, 3),
+                grid_step=[1, 1, 1],
+                grid_origin=[0, 0, 0],
+                grid_quadrature="gauss",
+            )
+
+    def test_grid_quadrature(self):
+        """Test the per-axis weights integrate the polynomials over the range.
+
+        The Boole rule is exact for the fifth order, and the Simpson rule for
+        the third order polynomials along each axis.
+        """
+
+        kwargs = {"grid_step": [0.5, 0.25, 2.0], "grid_origin": [1.0, 0.0, 3.0]}
+        grid = Grid(grid_shape=(9, 5, 1), grid_quadrature="boole", **kwargs)
+        x, y, z = grid.grid_array
+        assert isinstance(grid.grid_voxel, SeparableWeights)
+        assert [w.shape for w in grid.grid_voxel] == [(9, 1, 1), (1, 5, 1), (1, 1, 1)]
+
+        # x from -1 to 3, y from -0.5 to 0.5, and the single z point
+        expected = (3**6 - 1) / 6 * (0.5**5 * 2 / 5) * 2.0
+        integrand = x**5 * y**4 * np.ones_like(z)
+        assert np.isclose(sum_of_product(integrand, grid.grid_voxel), expected)
+
+        grid = Grid(grid_shape=(9, 5, 1), grid_quadrature="simpson", **kwargs)
+        expected = (3**4 - 1) / 4 * (0.5**3 * 2 / 3) * 2.0
+        assert np.isclose(sum_of_product(x**3, y**2, grid.grid_voxel), expected)
+
+        grid = Grid(grid_shape=(9, 5, 1), grid_quadrature="trapezoid", **kwargs)
+        assert np.isclose(sum_of_product(x, grid.grid_voxel), 4 * 1 * 2.0)
+
+    def test_grid_quadrature_str(self):
+        """Test the grid str prints the per-axis weights."""
+
+        grid = Grid(
+            grid_shape=(5, 3, 1),
+            grid_step=[1.0, 2.0, 3.0],
+            grid_origin=[0, 0, 0],
+            grid_quadrature="simpson",
+        )
+        assert (
+            "grid_voxel = [[0.333, 1.333, 0.667, 1.333, 0.333], "
+            "[0.667, 2.667, 0.667], 3.000] nm^3"
+        ) in str(grid)
+
+
+class TestRectilinearGrid:
+    @pytest.fixture
+    def grid(self):
+        """Grid with a uniform x axis and a non-uniform z axis."""
+        return RectilinearGrid(
+            grid_x=[-1.0, 0.0, 1.0, 2.0],
+            grid_y=[0.0, 0.5],
+            grid_z=[-7.0, -3.0, -1.0, 0.0],
+        )
+
+    def test_uniform(self):
+        """Test the uniform axes match the rectangular grid."""
+
+        grid = Grid(
+            grid_shape=(11, 5, 9), grid_step=[1.1, 0.4, 1.1], grid_origin=[1, 1, 1]
+        )
+        rectilinear = RectilinearGrid(*[np.ravel(a) for a in grid.grid_array])
+
+        assert rectilinear.grid_shape == grid.grid_shape
+        assert np.allclose(rectilinear.grid_step, grid.grid_step)
+        assert np.isclose(rectilinear.grid_voxel, grid.grid_voxel)
+        assert np.allclose(rectilinear.grid_extents, grid.grid_extents)
+        half_step = np.array(grid.grid_step) / 2
+        assert np.allclose(
+            rectilinear.grid_bounds, grid.grid_extents + np.c_[-half_step, half_step]
+        )
+        for a, b in zip(
+            rectilinear.extend_grid_by_length([2.3, 0, 0]),
+            grid.extend_grid_by_length([2.3, 0, 0]),
+        ):
+            assert np.allclose(a, b)
+
+    def test_grid_voxel(self, grid):
+        """Test the voxel volumes vary along the non-uniform axis."""
+
+        assert np.array_equal(grid.grid_step[:2], [1.0, 0.5])
+        assert np.isnan(grid.grid_step[2])
+        assert np.allclose(grid.grid_voxel, [[[2.0, 1.5, 0.75, 0.5]]])
+        assert np.allclose(grid.grid_extents[2], [-7, 0])
+        assert np.allclose(grid.grid_bounds[2], [-9, 0.5])
+        volume = np.prod(grid.grid_bounds[:, 1] - grid.grid_bounds[:, 0])
+        assert np.isclose(np.sum(np.broadcast_to(grid.grid_voxel, (4, 2, 4))), volume)
+
+    def test_extend_grid(self, grid):
+        """Test the grid extends only along the uniform axes."""
+
+        ext_grid_array = grid.extend_grid_by_points([2, 0, 0])
+        assert np.array_equal(ext_grid_array[0].ravel(), np.arange(-3.0, 5.0))
+        assert np.array_equal(ext_grid_array[2], grid.grid_array[2])
+        assert ext_grid_array[2].shape == (1, 1, 4)
+
+        with pytest.raises(ValueError, match="only the uniform axes"):
+            grid.extend_grid_by_length([0, 0, 2.0])
+
+    def test_increasing(self):
+        """Test the coordinates should be increasing."""
+
+        with pytest.raises(ValueError, match="grid_z should be strictly increasing"):
+            RectilinearGrid(grid_x=[0, 1], grid_y=[0], grid_z=[1, 0])
+
+
+class TestAdaptiveGrid:
+    @pytest.fixture
+    def magnet(self):
+        """Sphere magnet."""
+        return SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        )
+
+    @pytest.fixture
+    def extents(self):
+        """Extents of the refined box."""
+        return np.array([[-200.0, 200.0], [-600.0, -200.0], [-200.0, 200.0]])
+
+    def test_grid_array(self):
+        """Test the grid array and voxel of the flattened points."""
+
+        points = np.arange(12.0).reshape(4, 3)
+        grid = AdaptiveGrid(grid_points=points, grid_volumes=[1, 1, 8, 8])
+
+        assert grid.grid_size == 4
+        assert all(a.shape == (1, 4, 1) for a in grid.grid_array)
+        assert np.array_equal(grid.grid_array[1].ravel(), [1, 4, 7, 10])
+        assert np.array_equal(grid.grid_voxel, [[[1], [1], [8], [8]]])
+
+    def test_from_field_uniform(self, magnet, extents):
+        """Test the fully refined grid has the points of the rectangular grid."""
+
+        args = (magnet, [0, 50, 0], 700, 17.7e9, 1.76e8, extents, [100] * 3, [25] * 3)
+        grid = AdaptiveGrid.from_field(*args, dB=np.inf)
+        uniform = Grid(
+            grid_shape=[16] * 3, grid_step=[25] * 3, grid_origin=[0, -400, 0]
+        )
+        points = np.stack(np.broadcast_arrays(*uniform.grid_array), axis=-1)
+
+        assert grid.grid_size == 16**3
+        assert np.allclose(grid.grid_volumes, 25**3)
+        order = np.lexsort(grid.grid_points.T[::-1])
+        assert np.allclose(grid.grid_points[order], points.reshape(-1, 3))
+
+    def test_from_field(self, magnet, extents):
+        """Test the cells are refined only near the resonance."""
+
+        args = (magnet, [0, 50, 0], 700, 17.7e9, 1.76e8, extents, [50] * 3, [5] * 3)
+        grid = AdaptiveGrid.from_field(*args, dB=0.05)
+
+        assert np.isclose(grid.grid_volumes.sum(), 400**3)
+        assert grid.grid_size < 80**3 / 10
+        assert np.isclose(grid.grid_volumes.min(), 6.25**3)
+
+        # the coarse cells are off resonance
+        coarse = grid.grid_points[np.isclose(grid.grid_volumes, 50**3)]
+        Bz = magnet.Bz_method(*(coarse - [0, 50, 0]).T)
+        B_offset = 700 + Bz - 2 * np.pi * 17.7e9 / 1.76e8
+        assert coarse.size and np.all(np.abs(B_offset) > 0.05)
+
+        # the change limit refines the coarse cells
+        limited = AdaptiveGrid.from_field(*args, dB=0.05, dB_max=1)
+        assert limited.grid_size > grid.grid_size
+
+
+class TestPointGrid:
+    @pytest.fixture
+    def grid(self):
+        """Point grid of three spins."""
+        points = [[0.0, 1.0, 2.0], [5.0, -1.0, 0.0], [-3.0, 2.0, 7.0]]
+        return PointGrid(grid_points=points, trajectory_step=2.0)
+
+    def test_grid_array(self, grid):
+        """Test the point arrays and the default unit weights."""
+
+        assert grid.grid_size == 3
+        assert grid.grid_shape == (1, 3, 1)
+        assert all(a.shape == (1, 3, 1) for a in grid.grid_array)
+        assert np.array_equal(grid.grid_array[0].ravel(), [0, 5, -3])
+        assert np.array_equal(grid.grid_voxel, np.ones((1, 3, 1)))
+
+        grid = PointGrid(grid_points=grid.grid_points, grid_weights=[1, 2, 3])
+        assert np.array_equal(grid.grid_voxel.ravel(), [1, 2, 3])
+
+    def test_grid_point_set(self, grid):
+        """Test only the point grids are marked as point sets."""
+
+        assert grid.grid_point_set and AdaptiveGrid.grid_point_set
+        assert not Grid.grid_point_set and not RectilinearGrid.grid_point_set
+        assert "grid_point_set" not in str(grid)
+
+    def test_extend_grid_by_length(self, grid):
+        """Test the x trajectory of each point is sampled with the step."""
+
+        x, y, z = grid.extend_grid_by_length([5.0, 0, 0])
+        assert x.shape == (5, 3, 1)
+        assert np.array_equal(x[:, 0, 0], [-4, -2, 0, 2, 4])
+        assert np.array_equal(x[:, 1, 0], [1, 3, 5, 7, 9])
+        assert np.array_equal(y, grid.grid_array[1])
+
+        with pytest.raises(ValueError, match="can only be extended along x"):
+            grid.extend_grid_by_length([5.0, 1.0, 0])
@@ -24,6 +24,7 @@ Bz_method
 import pytest
 import numpy as np
 from mrfmsim.component import SphereMagnet, RectangularMagnet
+from dataclasses import replace
 from textwrap import dedent
 
 
@@ -37,6 +38,22 @@ class MagnetTester:
 
         assert str(magnet) == dedent(self.magnet_str)
 
+    def test_origin_batch(self, magnet):
+        """Test a stack of magnet origins against a loop over the origins."""
+
+        origins = np.array([[0.0, 0.0, 0.0], [5.0, -10.0, 20.0], [1.5, 0.0, 80.0]])
+        batch_magnet = replace(magnet, magnet_origin=origins)
+        grid = np.ogrid[100:150:3j, -50:50:4j, 100:200:5j]
+
+        for method in ["Bz_method", "Bzx_method", "Bzxx_method"]:
+            result = getattr(batch_magnet, method)(*grid)
+            expected = [
+                getattr(replace(magnet, magnet_origin=list(origin)), method)(*grid)
+                for origin in origins
+            ]
+            assert result.shape == (3, 3, 4, 5)
+            assert np.array_equal(result, expected)
+
     def check_bz(self, magnet, x, y, z, theory):
         """Test Bz calculation against the theory."""
         assert np.allclose(magnet.Bz_method(x, y, z), theory, rtol=1e-12)
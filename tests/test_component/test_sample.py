@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from mrfmsim.component import Sample
+import numpy as np
+import pytest
+from mrfmsim.component import Sample, MultiSample
 from textwrap import dedent
 
 
@@ -23,3 +25,70 @@ def test_sample_str():
       dB_sat = 1.672 mT"""
 
     assert str(sample) == dedent(sample_str)
+
+
+def test_multisample():
+    """Tests the species axis and the str representation of MultiSample."""
+
+    samples = [
+        Sample(spin="1H", T1=1e-6, T2=5e-6, spin_density=49.0, temperature=4.2),
+        Sample(spin="19F", T1=2e-6, T2=4e-6, spin_density=30.0, temperature=4.2),
+    ]
+    multisample = MultiSample(
+        spin=["1H", "19F"],
+        T1=[1e-6, 2e-6],
+        T2=[5e-6, 4e-6],
+        temperature=4.2,
+        spin_density=[49.0, 30.0],
+    )
+
+    for attr in ["T1", "T2", "temperature", "spin_density", "Gamma", "J", "dB_sat"]:
+        values = getattr(multisample, attr)
+        assert values.shape == (2, 1, 1, 1)
+        assert np.array_equal(values.ravel(), [getattr(s, attr) for s in samples])
+        from_samples = getattr(MultiSample.from_samples(samples), attr)
+        assert np.array_equal(from_samples, values)
+
+    multisample_str = """\
+    MultiSample
+      spin = ['1H', '19F']
+      T1 = [1.000e-06, 2.000e-06] s
+      T2 = [5.000e-06, 4.000e-06] s
+      temperature = [4.200, 4.200] K
+      spin_density = [49.000, 30.000] 1/nm^3
+      Gamma = [2.675e+05, 2.516e+05] rad/(s.mT)
+      J = [0.5, 0.5]
+      dB_hom = [0.748, 0.993] mT
+      dB_sat = [1.672, 1.405] mT"""
+
+    assert str(multisample) == dedent(multisample_str)
+
+
+def test_multisample_density_arrays():
+    """Test the spin density arrays are stacked on the species axis.
+
+    The densities broadcast against each other, and the densities that do
+    not broadcast raise a ValueError.
+    """
+
+    density = np.random.rand(4, 3, 2)
+    samples = [
+        Sample(spin="1H", T1=1e-6, T2=5e-6, spin_density=density, temperature=4.2),
+        Sample(spin="19F", T1=2e-6, T2=4e-6, spin_density=30.0, temperature=4.2),
+        Sample(
+            spin="e", T1=1e-3, T2=1e-6, spin_density=np.ones((3, 1)), temperature=4.2
+        ),
+    ]
+    multisample = MultiSample.from_samples(samples)
+    assert multisample.spin_density.shape == (3, 4, 3, 2)
+    assert np.array_equal(multisample.spin_density[0], density)
+    assert np.all(multisample.spin_density[1] == 30.0)
+    assert np.all(multisample.spin_density[2] == 1.0)
+    assert multisample.T1.shape == (3, 1, 1, 1)
+
+    samples[2].spin_density = np.ones((5, 1, 1))
+    with pytest.raises(ValueError, match="spin densities of the species do not"):
+        MultiSample.from_samples(samples)
+    samples[2].spin_density = np.ones((2, 4, 3, 2))
+    with pytest.raises(ValueError, match="at most the three grid axes"):
+        MultiSample.from_samples(samples)
@@ -0,0 +1,102 @@
+from mrfmsim.convergence import refine_grid, richardson
+from mrfmsim.experiment import IBMCyclic
+from mrfmsim.component import SphereMagnet, Grid, RectilinearGrid, Sample
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def inputs():
+    """Return the IBMCyclic inputs with a coarse trapezoid grid."""
+    return {
+        "B0": 2630.5,
+        "df_fm": 2e6,
+        "f_rf": 112e6,
+        "grid": Grid(
+            grid_shape=[13, 13, 11],
+            grid_step=[32, 32, 4],
+            grid_origin=[0, 0, -20],
+            grid_quadrature="trapezoid",
+        ),
+        "h": [0, 0, 64.1],
+        "magnet": SphereMagnet(
+            magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+        ),
+        "sample": Sample(
+            spin="1H", temperature=4.2, T1=10, T2=5e-6, spin_density=49.0
+        ),
+    }
+
+
+def test_refine_grid():
+    """Test the refined grid keeps the range and contains the grid points."""
+
+    grid = Grid(
+        grid_shape=[5, 1, 9],
+        grid_step=[2.0, 3.0, 1.0],
+        grid_origin=[1.0, 2.0, -4.0],
+        grid_quadrature="simpson",
+    )
+    refined = refine_grid(grid)
+    assert refined.grid_shape == (9, 1, 17)
+    assert np.array_equal(refined.grid_step, [1.0, 3.0, 0.5])
+    assert np.allclose(refined.grid_extents, grid.grid_extents)
+    assert refined.grid_quadrature == "simpson"
+    for coarse, fine in zip(grid.grid_array, refined.grid_array):
+        assert np.allclose(fine[::2, ::2, ::2], coarse, rtol=0, atol=1e-12)
+
+
+def test_richardson():
+    """Test the extrapolation of a second order error.
+
+    The order is estimated from three levels, and the levels that oscillate
+    are not extrapolated.
+    """
+
+    values = [1 + 0.3 * h**2 + np.array([0, 0.02]) * h**4 for h in [1, 0.5, 0.25]]
+    value, error, order = richardson(values[:2], order=2)
+    assert np.isclose(value[0], 1)
+    assert np.allclose(error, np.abs(value - values[1]))
+
+    value, error, order = richardson(values)
+    assert np.allclose(order, [2, 2], atol=0.1)
+    assert np.allclose(value, 1, atol=2e-3)
+
+    value, error, order = richardson([1.0, 1.2, 1.1])
+    assert value == 1.1 and error == np.inf
+    value, error, order = richardson([1.0, 1.1, 1.1])
+    assert value == 1.1 and error == 0
+
+
+def test_converge_ibmcyclic(inputs):
+    """Test the converged IBMCyclic signal against the direct executions.
+
+    The levels that reuse the coarse fields equal the direct executions on
+    the refined grids, and the extrapolated value is within the error
+    estimate of the execution on the next refined grid.
+    """
+
+    result = IBMCyclic.converge(output="dF2_spin", rtol=1e-3, **inputs)
+    assert result.converged
+    assert result.grid.grid_shape == (49, 49, 41)
+    assert np.isclose(result.order, 2, atol=0.2)
+    assert abs(result.error) <= 1e-3 * abs(result.value)
+
+    grid = inputs.pop("grid")
+    for value in result.values:
+        assert value == pytest.approx(IBMCyclic(grid=grid, **inputs)[0], rel=1e-12)
+        grid = refine_grid(grid)
+    finer = IBMCyclic(grid=grid, **inputs)[0]
+    assert abs(finer - result.value) <= result.error
+
+    with pytest.raises(ValueError, match="output is required"):
+        IBMCyclic.converge(grid=grid, **inputs)
+
+
+def test_converge_grid_type(inputs):
+    """Test the convergence requires a Grid."""
+
+    grid = inputs.pop("grid")
+    rectilinear = RectilinearGrid(*[np.ravel(a) for a in grid.grid_array])
+    with pytest.raises(ValueError, match="requires a Grid, not RectilinearGrid"):
+        IBMCyclic.converge(output="dF2_spin", grid=rectilinear, **inputs)
@@ -1,11 +1,23 @@
 from mrfmsim.experiment import CermitARPGroup
-from mrfmsim.component import Sample, SphereMagnet, Grid, RectangularMagnet
+from mrfmsim.formula import as_batch
+from mrfmsim.component import (
+    Sample,
+    SphereMagnet,
+    Grid,
+    RectangularMagnet,
+    MultiSample,
+)
 import numpy as np
 import pytest
+import inspect
 
 
 CermitARP = CermitARPGroup.experiments["CermitARP"]
 CermitARPSmallTip = CermitARPGroup.experiments["CermitARPSmallTip"]
+CermitARPSweep = CermitARPGroup.experiments["CermitARPSweep"]
+CermitARPSmallTipAmplitudeSweep = CermitARPGroup.experiments[
+    "CermitARPSmallTipAmplitudeSweep"
+]
 
 
 class TestCERMITARP:
@@ -94,6 +106,33 @@ class TestCERMITARP:
 
         assert np.allclose(result, -2.0 * 4.95203, rtol=2e-2)
 
+    def test_cermitarp_sweep(self):
+        """Test the sweep against CermitARP evaluated at each point.
+
+        The band with rel_dpol_tol of 1e-4 covers less than a fifth of the
+        grid, and the neglected voxels are bounded by the tolerance.
+        """
+
+        grid = Grid(
+            grid_shape=[41, 41, 21], grid_step=[4, 4, 2], grid_origin=[0, 0, -30]
+        )
+        magnet = SphereMagnet(
+            magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+        )
+        sample = Sample(
+            spin="1H", temperature=4.2, T1=20.0, T2=5.0e-6, spin_density=49.0
+        )
+        B1, df_fm, f_rf, h = 0.1, 1e6, 112e6, [0, 0, 10.0]
+        B0 = np.array([2300.0, 2350.0, 2400.0])
+
+        result = CermitARPSweep(
+            B0, B1, df_fm, f_rf, grid, h, magnet, sample, rel_dpol_tol=1e-4
+        )
+        assert result.shape == (3,)
+        for b0, dk_spin in zip(B0, result):
+            expected = CermitARP(b0, B1, df_fm, f_rf, grid, h, magnet, sample)
+            assert dk_spin == pytest.approx(expected, rel=1e-4)
+
     # @pytest.mark.skip(reason="incorrect experimental setup")
     # def test_cermitarp_smalltip(self, grid, magnet, sample):
     #     """Test smallamp_arp experiments."""
@@ -206,3 +245,121 @@ class TestCERMITESRSmallTip:
         )
 
         assert np.isclose(result_no_amp, result_large_amp, rtol=1e-5)
+
+    def test_smalltip_amplitude_sweep(self, sample):
+        """Test the amplitude sweep against CermitARPSmallTip for each amplitude.
+
+        The grid is coarse compared with the magnet, and the results agree
+        within the interpolation error of the fine x line.
+        """
+
+        grid = Grid(
+            grid_shape=[21, 21, 6], grid_step=[75, 75, 30], grid_origin=[0, 0, -150]
+        )
+        magnet = RectangularMagnet(
+            magnet_length=[135.0, 80.0, 1500.0],
+            mu0_Ms=1800.0,
+            magnet_origin=[0, 0, 750],
+        )
+
+        B1 = 2.5
+        B0 = 4850.0
+        df_fm = 1e6
+        f_rf = 210.0e6
+        h = [0, 0, 112]
+        x_0p_array = np.array([10.0, 75.0, 150.0])
+        trapz_pts = 21
+
+        result = CermitARPSmallTipAmplitudeSweep(
+            B0, B1, df_fm, f_rf, grid, h, magnet, sample, trapz_pts, x_0p_array
+        )
+        expected = [
+            CermitARPSmallTip(
+                B0, B1, df_fm, f_rf, grid, h, magnet, sample, trapz_pts, x_0p
+            )
+            for x_0p in x_0p_array
+        ]
+
+        assert result.shape == (3,)
+        assert np.allclose(result, expected, rtol=1e-5, atol=0)
+
+    def test_batch(self, sample):
+        """Test a batch of B1 and df_fm against CermitARP for each value."""
+
+        grid = Grid(
+            grid_shape=[21, 21, 6], grid_step=[75, 75, 30], grid_origin=[0, 0, -150]
+        )
+        magnet = RectangularMagnet(
+            magnet_length=[135.0, 80.0, 1500.0],
+            mu0_Ms=1800.0,
+            magnet_origin=[0, 0, 750],
+        )
+        inputs = {
+            "B0": 4850.0,
+            "f_rf": 210.0e6,
+            "grid": grid,
+            "h": [0, 0, 112],
+            "magnet": magnet,
+            "sample": sample,
+        }
+        B1_array = np.linspace(0.5, 5.0, 8)
+        df_fm_array = np.array([1e5, 1e6])
+
+        dk_spin = CermitARP(
+            B1=as_batch(B1_array), df_fm=df_fm_array.reshape(2, 1, 1, 1, 1), **inputs
+        )
+
+        assert dk_spin.shape == (2, 8)
+        for i, df_fm in enumerate(df_fm_array):
+            for j, B1 in enumerate(B1_array):
+                assert dk_spin[i, j] == CermitARP(B1=B1, df_fm=df_fm, **inputs)
+
+
+@pytest.mark.parametrize("name", list(CermitARPGroup.experiments))
+def test_cermitarp_by_species(name):
+    """Test a MultiSample against each species for the CermitARP experiments.
+
+    The species axis is the last axis of the results, after the cantilever
+    amplitude axis.
+    """
+
+    experiment = CermitARPGroup.experiments[name]
+    samples = [
+        Sample(spin="1H", temperature=4.2, T1=20.0, T2=5.0e-6, spin_density=49.0),
+        Sample(spin="19F", temperature=4.2, T1=2.0, T2=2.0e-6, spin_density=30.0),
+    ]
+    values = {
+        "B0": 4850.0,
+        "B1": 2.5,
+        "df_fm": 1e6,
+        "f_rf": 210e6,
+        "grid": Grid(
+            grid_shape=[21, 21, 6], grid_step=[75, 75, 30], grid_origin=[0, 0, -150]
+        ),
+        "h": [0, 0, 112],
+        "magnet": RectangularMagnet(
+            magnet_length=[135.0, 80.0, 1500.0],
+            mu0_Ms=1800.0,
+            magnet_origin=[0, 0, 750],
+        ),
+        "rel_dpol_tol": 1e-6,
+        "trapz_pts": 21,
+        "x_0p": 50.0,
+        "x_0p_array": np.array([10.0, 75.0, 30.0]),
+    }
+    inputs = {
+        key: values[key]
+        for key in inspect.signature(experiment).parameters
+        if key != "sample"
+    }
+    expected = np.stack([experiment(sample=s, **inputs) for s in samples], axis=-1)
+
+    if "x_0p_array" in inputs:
+        inputs["x_0p_array"] = inputs["x_0p_array"][:, np.newaxis]
+    per_species, total = experiment.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    assert per_species.shape == expected.shape
+    assert expected.shape[-1] == 2
+    assert np.allclose(per_species, expected, rtol=1e-10, atol=0)
+    assert np.allclose(total, expected.sum(axis=-1), rtol=1e-10, atol=0)
@@ -1,11 +1,30 @@
-from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+from mrfmsim.component import (
+    SphereMagnet,
+    Grid,
+    RectilinearGrid,
+    Sample,
+    Cantilever,
+    AdaptiveGrid,
+    PointGrid,
+    MultiSample,
+)
 from mrfmsim.experiment import CermitESRGroup
+from mrfmsim.formula import as_batch
 import numpy as np
 import pytest
+import inspect
 
 
 CermitESR = CermitESRGroup.experiments["CermitESR"]
 CermitESRSmallTip = CermitESRGroup.experiments["CermitESRSmallTip"]
+CermitESRMwSweep = CermitESRGroup.experiments["CermitESRMwSweep"]
+CermitESRSmallTipAmplitudeSweep = CermitESRGroup.experiments[
+    "CermitESRSmallTipAmplitudeSweep"
+]
+CermitESRStationaryTip = CermitESRGroup.experiments["CermitESRStationaryTip"]
+CermitESRStationaryTipSpectrum = CermitESRGroup.experiments[
+    "CermitESRStationaryTipSpectrum"
+]
 # CermitSingleSpinApprox = CermitSingleSpinGroup["CermitSingleSpinApprox"]
 
 
@@ -75,6 +94,343 @@ class TestCERMITESR:
         assert np.isclose(df_spin, cantilever.k2f_modulated * -25.086, rtol=5e-1)
 
 
+def test_cermitesr_stationary_tip_spectrum(sample, cantilever):
+    """Test the spectrum experiment against the stationary tip frequency loop."""
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[51, 11, 31], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B0": 500,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "sample": sample,
+    }
+    f_rf_array = np.linspace(17.6e9, 17.8e9, 11)
+
+    df_spin = CermitESRStationaryTipSpectrum(f_rf_array=f_rf_array, **inputs)
+    df_spin_loop = [CermitESRStationaryTip(f_rf=f_rf, **inputs) for f_rf in f_rf_array]
+
+    assert df_spin.shape == (11,)
+    assert np.allclose(df_spin, df_spin_loop, rtol=1e-4)
+
+
+def test_cermitesr_rectilinear_grid(sample, cantilever):
+    """Test CermitESR on a rectilinear grid with a log-spaced y axis."""
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "mw_x_0p": 80,
+        "sample": sample,
+    }
+    grid = Grid(grid_shape=[51, 11, 31], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    rectilinear = RectilinearGrid(*[np.ravel(a) for a in grid.grid_array])
+    assert CermitESR(grid=rectilinear, **inputs) == CermitESR(grid=grid, **inputs)
+
+    # the voxel bounds of the y axis are log spaced from the surface
+    bounds = -np.concatenate(([0], np.geomspace(0.5, 400, 160)))[::-1]
+    x = np.arange(-200, 201, 8.0)
+    rectilinear = RectilinearGrid(x, (bounds[1:] + bounds[:-1]) / 2, x)
+    grid = Grid(
+        grid_shape=[51, 800, 51], grid_step=[8, 0.5, 8], grid_origin=[0, -200, 0]
+    )
+    df_spin = CermitESR(grid=rectilinear, **inputs)
+    assert np.isclose(df_spin, CermitESR(grid=grid, **inputs), rtol=0.02)
+
+
+def test_cermitesr_stationary_tip_adaptive_grid(sample, cantilever):
+    """Test the stationary tip experiment on the adaptive grid."""
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "sample": sample,
+    }
+    extents = np.array([[-200.0, 200.0], [-600.0, -200.0], [-200.0, 200.0]])
+    args = (magnet, [0, 50, 0], 700, 17.7e9, sample.Gamma, extents, [50] * 3)
+
+    # the fully refined grid has the points of the rectangular grid
+    grid = Grid(grid_shape=[32] * 3, grid_step=[12.5] * 3, grid_origin=[0, -400, 0])
+    refined = AdaptiveGrid.from_field(*args, [12.5] * 3, dB=np.inf)
+    assert np.isclose(
+        CermitESRStationaryTip(grid=refined, **inputs),
+        CermitESRStationaryTip(grid=grid, **inputs),
+        rtol=1e-10,
+    )
+
+    grid = Grid(grid_shape=[100] * 3, grid_step=[4] * 3, grid_origin=[0, -400, 0])
+    adaptive = AdaptiveGrid.from_field(*args, [4] * 3, dB=0.05)
+    assert adaptive.grid_size * 50 < 100**3
+    assert np.isclose(
+        CermitESRStationaryTip(grid=adaptive, **inputs),
+        CermitESRStationaryTip(grid=grid, **inputs),
+        rtol=0.15,
+    )
+
+
+def test_cermitesr_point_grid(sample, cantilever):
+    """Test CermitESR on a point grid.
+
+    The points of a rectangular grid with the voxel weights and the
+    trajectory step of the grid step give the grid result. The signal of a
+    sparse set of spins is the sum of the signals of the single spins.
+    """
+
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "sample": sample,
+    }
+    grid = Grid(grid_shape=[41, 11, 17], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    points = np.stack([a.ravel() for a in np.broadcast_arrays(*grid.grid_array)], 1)
+    point_grid = PointGrid(points, grid.grid_voxel, trajectory_step=8)
+    assert CermitESR(grid=point_grid, **inputs) == pytest.approx(
+        CermitESR(grid=grid, **inputs), rel=1e-12
+    )
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform([-200, -100, -100], [200, 0, 100], size=(20, 3))
+    point_grid = PointGrid(points, rng.uniform(1, 2, 20), trajectory_step=0.5)
+    df_spin = CermitESR(grid=point_grid, **inputs)
+    single = [
+        CermitESR(grid=PointGrid(p, w, trajectory_step=0.5), **inputs)
+        for p, w in zip(point_grid.grid_points, point_grid.grid_weights)
+    ]
+    assert df_spin != 0
+    assert df_spin == pytest.approx(np.sum(single), rel=1e-10)
+
+
+def test_cermitesr_batch(sample, cantilever):
+    """Test a batch of B0 and of temperature against CermitESR for each value."""
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[41, 11, 21], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "mw_x_0p": 40,
+        "sample": sample,
+    }
+    B0_array = np.array([690.0, 700.0, 710.0])
+
+    df_spin = CermitESR(B0=as_batch(B0_array), **inputs)
+    df_spin_loop = [CermitESR(B0=B0, **inputs) for B0 in B0_array]
+
+    assert df_spin.shape == (3,)
+    assert np.array_equal(df_spin, df_spin_loop)
+
+    temperature = sample.temperature
+    sample.temperature = as_batch([4.2, 11.0])
+    df_spin = CermitESR(B0=700, **inputs)
+    df_spin_loop = []
+    for value in [4.2, 11.0]:
+        sample.temperature = value
+        df_spin_loop.append(CermitESR(B0=700, **inputs))
+    sample.temperature = temperature
+
+    assert np.array_equal(df_spin, df_spin_loop)
+
+
+def test_cermitesr_geometry_batch(sample, cantilever):
+    """Test an approach curve and a stack of magnet origins against a loop."""
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[41, 11, 21], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "mw_x_0p": 40,
+        "sample": sample,
+    }
+    # the separations are not aligned to the grid step
+    h_array = np.array([[0, 50, 0], [0, 57.3, 0], [1.2, 64.9, -0.7]])
+
+    df_spin = CermitESR(h=h_array, magnet=magnet, **inputs)
+    df_spin_loop = [CermitESR(h=list(h), magnet=magnet, **inputs) for h in h_array]
+
+    assert df_spin.shape == (3,)
+    assert np.array_equal(df_spin, df_spin_loop)
+
+    origins = np.array([[0, 1850, 0], [0, 1900, 0], [3.5, 1950, 2.5]])
+    batch_magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=origins
+    )
+    df_spin = CermitESR(h=[0, 50, 0], magnet=batch_magnet, **inputs)
+    df_spin_loop = [
+        CermitESR(
+            h=[0, 50, 0],
+            magnet=SphereMagnet(
+                magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=list(origin)
+            ),
+            **inputs,
+        )
+        for origin in origins
+    ]
+
+    assert df_spin.shape == (3,)
+    assert np.array_equal(df_spin, df_spin_loop)
+
+
+def test_cermitesr_mw_sweep(sample, cantilever):
+    """Test the microwave amplitude sweep against CermitESR for each amplitude.
+
+    The extended fields of the smaller amplitudes are sliced from the
+    largest one, so the grid points agree up to rounding.
+    """
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[51, 11, 31], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "sample": sample,
+    }
+    mw_x_0p_array = np.array([40.0, 0.0, 100.0, 20.0])
+
+    df_spin = CermitESRMwSweep(mw_x_0p_array=mw_x_0p_array, **inputs)
+    df_spin_loop = [CermitESR(mw_x_0p=mw_x_0p, **inputs) for mw_x_0p in mw_x_0p_array]
+
+    assert df_spin.shape == (4,)
+    assert np.allclose(df_spin, df_spin_loop, rtol=1e-10, atol=0)
+
+
+def test_cermitesr_smalltip_amplitude_sweep(sample, cantilever):
+    """Test the amplitude sweep against CermitESRSmallTip for each amplitude.
+
+    The sweep on a point grid is exact, and on a rectangular grid within the
+    interpolation error of the fine x line.
+    """
+
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[51, 11, 31], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "mw_x_0p": 80,
+        "sample": sample,
+        "trapz_pts": 20,
+    }
+    x_0p_array = np.array([20.0, 40.0, 80.0])
+
+    df_spin = CermitESRSmallTipAmplitudeSweep(x_0p_array=x_0p_array, **inputs)
+    df_spin_loop = [CermitESRSmallTip(x_0p=x_0p, **inputs) for x_0p in x_0p_array]
+
+    assert df_spin.shape == (3,)
+    assert np.allclose(df_spin, df_spin_loop, rtol=1e-6, atol=0)
+
+    # the point grid is evaluated per amplitude, also for the points evenly
+    # spaced along x
+    points = np.column_stack((np.linspace(-40, 40, 9), np.zeros(9), np.zeros(9)))
+    inputs["grid"] = PointGrid(points, trajectory_step=8)
+    df_spin = CermitESRSmallTipAmplitudeSweep(x_0p_array=x_0p_array, **inputs)
+    df_spin_loop = [CermitESRSmallTip(x_0p=x_0p, **inputs) for x_0p in x_0p_array]
+    assert np.allclose(df_spin, df_spin_loop, rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("name", list(CermitESRGroup.experiments))
+def test_cermitesr_by_species(name, sample, cantilever):
+    """Test a MultiSample against each species for the CermitESR experiments.
+
+    The species axis is the last axis of the results, after the microwave
+    amplitude, the cantilever amplitude, and the frequency axes.
+    """
+
+    experiment = CermitESRGroup.experiments[name]
+    samples = [
+        sample,
+        Sample(spin="e", temperature=11.0, T1=2e-3, T2=0.2e-6, spin_density=0.01),
+    ]
+    values = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "bin_oversample": 4,
+        "cantilever": cantilever,
+        "f_rf": 17.7e9,
+        "f_rf_array": np.linspace(17.6e9, 17.8e9, 11),
+        "grid": Grid(
+            grid_shape=[21, 11, 15], grid_step=[8, 10, 8], grid_origin=[0, -50, 0]
+        ),
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "mw_x_0p_array": np.array([40.0, 16.0, 24.0]),
+        "t_off": 1e-6,
+        "t_on": 1e-6,
+        "trapz_pts": 20,
+        "x_0p": 30.0,
+        "x_0p_array": np.array([20.0, 40.0, 60.0]),
+    }
+    inputs = {
+        key: values[key]
+        for key in inspect.signature(experiment).parameters
+        if key != "sample"
+    }
+    expected = np.stack([experiment(sample=s, **inputs) for s in samples], axis=-1)
+
+    if "x_0p_array" in inputs:
+        inputs["x_0p_array"] = inputs["x_0p_array"][:, np.newaxis]
+    per_species, total = experiment.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    assert per_species.shape == expected.shape
+    assert expected.shape[-1] == 2
+    assert np.allclose(per_species, expected, rtol=1e-10, atol=0)
+    assert np.allclose(total, expected.sum(axis=-1), rtol=1e-10, atol=0)
+
+
 # class TestCERMITESR_smalltip:
 #     """Test cermitesr_smalltip experiment."""
 
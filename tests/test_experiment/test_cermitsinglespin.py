@@ -1,7 +1,7 @@
 """Test the group of CERMIT ESR experiments."""
 
 from mrfmsim.experiment import CermitSingleSpinGroup
-from mrfmsim.component import Sample, SphereMagnet
+from mrfmsim.component import Sample, SphereMagnet, MultiSample
 import numpy as np
 import pytest
 
@@ -87,3 +87,39 @@ class TestCermitSinglespin:
         )
 
         assert np.isclose(approx, exact, rtol=1e-6)
+
+
+def test_cermitsinglespin_by_species():
+    """Test by_species rejects the single spin results without a species axis.
+
+    The single spin results are not sums over the grid, and the species
+    axis of the sample parameters is not the last axis.
+    """
+
+    sample = MultiSample(
+        spin=["e", "e"],
+        temperature=[4.2, 11.0],
+        T1=[1.0e-3, 1.0e-3],
+        T2=[450e-9, 450e-9],
+        spin_density=[1.0, 1.0],
+    )
+    magnet = SphereMagnet(
+        magnet_radius=3300.0, mu0_Ms=440.0, magnet_origin=[0, 3000, 0]
+    )
+    with pytest.raises(ValueError, match="is not the axis of the 2 species"):
+        CermitSingleSpinApprox.by_species(
+            magnet=magnet,
+            sample=sample,
+            grid_array=np.ogrid[0:0:1j, 0:0:1j, 0:0:1j],
+            h=[0, 300, 0],
+            x_0p=100.0,
+            trapz_pts=40,
+        )
+    with pytest.raises(ValueError, match="is not the axis of the 2 species"):
+        CermitESRSingleSpin.by_species(
+            magnet=magnet,
+            sample=sample,
+            magnet_spin_dist=300,
+            x_0p=100.0,
+            geometry="spam",
+        )
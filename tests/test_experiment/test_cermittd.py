@@ -1,4 +1,83 @@
 from mrfmsim.experiment import CermitTDGroup
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever, MultiSample
+import numpy as np
+import pytest
+import inspect
 
 CermitTD = CermitTDGroup.experiments["CermitTD"]
 CermitTDSmallTip = CermitTDGroup.experiments["CermitTDSmallTip"]
+CermitTDMwSweep = CermitTDGroup.experiments["CermitTDMwSweep"]
+
+
+def test_cermittd_mw_sweep():
+    """Test the microwave amplitude sweep against CermitTD for each amplitude."""
+
+    sample = Sample(
+        spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+    )
+    magnet = SphereMagnet(
+        magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+    )
+    grid = Grid(grid_shape=[51, 11, 31], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=7.8e5, f_c=4.975e6),
+        "dt_pulse": 1e-4,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, 0],
+        "magnet": magnet,
+        "sample": sample,
+        "tip_v": 2 * np.pi * 1e4,
+    }
+    mw_x_0p_array = np.array([40.0, 16.0, 100.0, 24.0])
+
+    df_spin = CermitTDMwSweep(mw_x_0p_array=mw_x_0p_array, **inputs)
+    df_spin_loop = [CermitTD(mw_x_0p=mw_x_0p, **inputs) for mw_x_0p in mw_x_0p_array]
+
+    assert df_spin.shape == (4,)
+    assert np.allclose(df_spin, df_spin_loop, rtol=1e-10, atol=0)
+
+
+@pytest.mark.parametrize("name", list(CermitTDGroup.experiments))
+def test_cermittd_by_species(name):
+    """Test a MultiSample against each species for the CermitTD experiments."""
+
+    experiment = CermitTDGroup.experiments[name]
+    samples = [
+        Sample(spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241),
+        Sample(spin="e", temperature=11.0, T1=2e-3, T2=0.2e-6, spin_density=0.01),
+    ]
+    values = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=7.8e5, f_c=4.975e6),
+        "dt_pulse": 1e-4,
+        "f_rf": 17.7e9,
+        "grid": Grid(
+            grid_shape=[21, 11, 15], grid_step=[8, 10, 8], grid_origin=[0, -50, 0]
+        ),
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "mw_x_0p_array": np.array([40.0, 16.0, 24.0]),
+        "tip_v": 2 * np.pi * 1e4,
+        "trapz_pts": 20,
+        "x_0p": 30.0,
+    }
+    inputs = {
+        key: values[key]
+        for key in inspect.signature(experiment).parameters
+        if key != "sample"
+    }
+    expected = np.stack([experiment(sample=s, **inputs) for s in samples], axis=-1)
+
+    per_species, total = experiment.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    assert per_species.shape == expected.shape
+    assert np.allclose(per_species, expected, rtol=1e-10, atol=0)
+    assert np.allclose(total, expected.sum(axis=-1), rtol=1e-10, atol=0)
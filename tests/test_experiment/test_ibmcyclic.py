@@ -1,5 +1,6 @@
-from mrfmsim.experiment import IBMCyclic
-from mrfmsim.component import Grid, Sample, SphereMagnet
+from mrfmsim.experiment import IBMCyclic, IBMCyclicSweep
+from mrfmsim.component import Grid, Sample, SphereMagnet, MultiSample
+from mrfmsim.formula import expand_weights
 import numpy as np
 import pytest
 
@@ -64,3 +65,146 @@ class TestIBMCyclic:
         dF2_spin, _ = IBMCyclic(B0, df_fm, f_rf, grid, h, magnet, sample)
 
         assert pytest.approx(dF2_spin, 5e-4) == -477.032
+
+
+def test_IBMCyclicSweep():
+    """Test the sweep against IBMCyclic evaluated at each point."""
+
+    grid = Grid(grid_shape=[41, 41, 21], grid_step=[4, 4, 2], grid_origin=[0, 0, -30])
+    magnet = SphereMagnet(
+        magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+    )
+    sample = Sample(spin="1H", temperature=4.2, T1=10, T2=5e-6, spin_density=49.0)
+    h = [0, 0, 10.0]
+    B0 = np.array([[2600.0], [2650.0]])
+    f_rf = np.linspace(108e6, 116e6, 5)
+    df_fm = 2e6
+
+    dF2_sweep, dF_sweep = IBMCyclicSweep(B0, df_fm, f_rf, grid, h, magnet, sample)
+    assert dF_sweep.shape == dF2_sweep.shape == (2, 5)
+
+    for (i, j), _ in np.ndenumerate(dF_sweep):
+        dF2_spin, dF_spin = IBMCyclic(B0[i, 0], df_fm, f_rf[j], grid, h, magnet, sample)
+        assert dF_sweep[i, j] == pytest.approx(dF_spin, rel=1e-10)
+        assert dF2_sweep[i, j] == pytest.approx(dF2_spin, rel=1e-10)
+
+
+def test_IBMCyclic_by_species_density():
+    """Test a MultiSample with spatially varying densities for each species."""
+
+    grid = Grid(
+        grid_shape=[21, 21, 6], grid_step=[10, 10, 10], grid_origin=[100, 0, -30]
+    )
+    rng = np.random.default_rng(0)
+    samples = [
+        Sample(
+            spin="1H",
+            temperature=4.2,
+            T1=20.0,
+            T2=5.0e-6,
+            spin_density=49.0 * rng.random(grid.grid_shape),
+        ),
+        Sample(
+            spin="19F",
+            temperature=4.2,
+            T1=2.0,
+            T2=2.0e-6,
+            spin_density=30.0 * rng.random((1, 21, 6)),
+        ),
+    ]
+    inputs = {
+        "B0": 1000.0,
+        "df_fm": 2e6,
+        "f_rf": 43.0e6,
+        "grid": grid,
+        "h": [0, 0, 30],
+        "magnet": SphereMagnet(
+            magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+        ),
+    }
+
+    per_species, total = IBMCyclic.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    expected = np.array([IBMCyclic(sample=sample, **inputs) for sample in samples])
+    for i in range(2):
+        assert np.allclose(per_species[i], expected[:, i], rtol=1e-12, atol=0)
+        assert np.isclose(total[i], expected[:, i].sum(), rtol=1e-12)
+
+
+def test_IBMCyclic_by_species():
+    """Test a MultiSample against IBMCyclic for each species."""
+
+    samples = [
+        Sample(spin="1H", temperature=4.2, T1=20.0, T2=5.0e-6, spin_density=49.0),
+        Sample(spin="19F", temperature=4.2, T1=2.0, T2=2.0e-6, spin_density=30.0),
+    ]
+    inputs = {
+        "B0": 1000.0,
+        "df_fm": 2e6,
+        "f_rf": 43.0e6,
+        "grid": Grid(
+            grid_shape=[21, 21, 6], grid_step=[10, 10, 10], grid_origin=[100, 0, -30]
+        ),
+        "h": [0, 0, 30],
+        "magnet": SphereMagnet(
+            magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+        ),
+    }
+
+    per_species, total = IBMCyclic.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    expected = np.array([IBMCyclic(sample=sample, **inputs) for sample in samples])
+
+    assert len(per_species) == len(total) == 2
+    for i in range(2):
+        assert per_species[i].shape == (2,)
+        assert np.allclose(per_species[i], expected[:, i], rtol=1e-12, atol=0)
+        assert np.isclose(total[i], expected[:, i].sum(), rtol=1e-12)
+
+    with pytest.raises(ValueError, match="MultiSample"):
+        IBMCyclic.by_species(sample=samples[0], **inputs)
+
+    inputs["B0"] = np.array([[990.0], [1000.0]])
+    inputs["f_rf"] = np.linspace(42e6, 44e6, 3)
+    per_species, total = IBMCyclicSweep.by_species(
+        sample=MultiSample.from_samples(samples), **inputs
+    )
+    expected = [IBMCyclicSweep(sample=sample, **inputs) for sample in samples]
+    for i in range(2):
+        assert per_species[i].shape == (2, 3, 2)
+        value = np.stack([result[i] for result in expected], axis=-1)
+        assert np.allclose(per_species[i], value, rtol=1e-12, atol=0)
+        assert np.allclose(total[i], value.sum(axis=-1), rtol=1e-12, atol=0)
+
+
+def test_IBMCyclic_grid_quadrature():
+    """Test the separable quadrature weights against the expanded weights.
+
+    The sums, the sweep, and the compiled experiment multiply the per-axis
+    weights in separately.
+    """
+
+    kwargs = {"grid_shape": [41, 41, 21], "grid_step": [4, 4, 2]}
+    grid = Grid(grid_origin=[0, 0, -30], grid_quadrature="simpson", **kwargs)
+    expanded = Grid(grid_origin=[0, 0, -30], **kwargs)
+    expanded.grid_voxel = expand_weights(grid.grid_voxel)
+    assert expanded.grid_voxel.shape == (41, 41, 21)
+
+    magnet = SphereMagnet(
+        magnet_radius=100.0, mu0_Ms=1800, magnet_origin=[0.0, 0.0, 100.0]
+    )
+    sample = Sample(spin="1H", temperature=4.2, T1=10, T2=5e-6, spin_density=49.0)
+    inputs = {"df_fm": 2e6, "h": [0, 0, 10.0], "magnet": magnet, "sample": sample}
+
+    expected = IBMCyclic(B0=2600.0, f_rf=112e6, grid=expanded, **inputs)
+    result = IBMCyclic(B0=2600.0, f_rf=112e6, grid=grid, **inputs)
+    assert np.allclose(result, expected, rtol=1e-12)
+    compiled = IBMCyclic.compile()(B0=2600.0, f_rf=112e6, grid=grid, **inputs)
+    assert np.allclose(compiled, expected, rtol=1e-10)
+
+    B0, f_rf = np.array([[2600.0], [2650.0]]), np.array([108e6, 112e6])
+    result = IBMCyclicSweep(B0=B0, f_rf=f_rf, grid=grid, **inputs)
+    expected = IBMCyclicSweep(B0=B0, f_rf=f_rf, grid=expanded, **inputs)
+    assert np.allclose(result, expected, rtol=1e-12)
@@ -2,8 +2,12 @@ from mrfmsim.formula import (
     B_offset,
     xtrapz_fxdtheta,
     xtrapz_field_gradient,
+    xtrapz_field_gradient_batch,
+    LINE_REFINE,
     min_abs_offset,
+    min_abs_offset_nested,
     field_func,
+    slice_matrix,
 )
 import numpy as np
 import pytest
@@ -191,6 +195,22 @@ class TestXTrapzFxDtheta:
         ]
 
 
+def test_min_abs_offset_nested():
+    """Test the nested windows against min_abs_offset for each window.
+
+    The extended grid of each window is sliced from the largest one.
+    """
+
+    matrix = np.random.rand(30, 20, 10) - 0.3
+    ext_pts_array = np.array([3, 0, 6, 1, 3])
+    result = min_abs_offset_nested(matrix, ext_pts_array)
+
+    assert result.shape == (5, 18, 20, 10)
+    for ext_pts, offset in zip(ext_pts_array, result):
+        ext_matrix = slice_matrix(matrix, (18 + 2 * ext_pts, 20, 10))
+        assert np.array_equal(offset, min_abs_offset(ext_matrix, ext_pts))
+
+
 class TestXTrapzFieldGradient:
     """Test trapz field gradient."""
 
@@ -254,6 +274,57 @@ class TestXTrapzFieldGradient:
         assert pytest.approx(gradient, 1e-3) == real
 
 
+def test_xtrapz_field_gradient_batch():
+    """Test the batched gradient against a loop over the amplitudes.
+
+    The magnet method should be called once, on the fine x line, for all
+    the amplitudes, and the results agree within the interpolation error.
+    A point set is evaluated per amplitude.
+    """
+
+    from mrfmsim.component import RectangularMagnet, Grid
+
+    magnet = RectangularMagnet(
+        magnet_length=[40.0, 60.0, 100.0],
+        mu0_Ms=1800.0,
+        magnet_origin=[10.0, 0.0, 200.0],
+    )
+    grid = Grid(grid_shape=[5, 3, 2], grid_step=[10, 20, 20], grid_origin=[0, 0, 0])
+
+    calls = []
+
+    def Bzx_method(x, y, z):
+        calls.append(np.shape(x))
+        return magnet.Bzx_method(x, y, z)
+
+    trapz_pts = 32
+    x_0p_array = np.array([0.5, 10.0, 20.0, 35.0])
+    h = [0, 0, 5]
+
+    gradient = xtrapz_field_gradient_batch(
+        Bzx_method, grid.grid_array, h, trapz_pts, x_0p_array
+    )
+
+    assert gradient.shape == (4, 5, 3, 2)
+    # the line covers the grid and twice the largest amplitude
+    assert calls == [(LINE_REFINE * (4 + 7) + 5, 1, 1)]
+    for x_0p, result in zip(x_0p_array, gradient):
+        expected = xtrapz_field_gradient(
+            magnet.Bzx_method, grid.grid_array, h, trapz_pts, x_0p
+        )
+        assert np.allclose(result, expected, rtol=1e-6, atol=0)
+
+    # the flattened points of the grid are evaluated per amplitude
+    points = [np.broadcast_to(a, (5, 3, 2)).reshape(1, -1, 1) for a in grid.grid_array]
+    result = xtrapz_field_gradient_batch(
+        magnet.Bzx_method, points, h, trapz_pts, x_0p_array, grid_point_set=True
+    )
+    assert result.shape == (4, 1, 30, 1)
+    for x_0p, result_i in zip(x_0p_array, result):
+        expected = xtrapz_field_gradient(magnet.Bzx_method, points, h, trapz_pts, x_0p)
+        assert np.array_equal(result_i, expected)
+
+
 def test_field_func():
     """Test field.
 
@@ -278,6 +349,54 @@ def test_field_func():
     )
 
 
+def test_field_func_batch():
+    """Test a stack of tip-sample separations against a loop, off the grid."""
+
+    def field_method(x, y, z):
+        """Field method."""
+        return x * y + z**2
+
+    ogrid = np.ogrid[0:2:3j, 0:1:2j, 0:1:2j]
+    h = np.array([[1, 2, 3], [0.25, -0.4, 1.7], [0, 0, 0]])
+
+    result = field_func(field_method, ogrid, h)
+    assert result.shape == (3, 3, 2, 2)
+    for h_i, result_i in zip(h, result):
+        assert np.array_equal(result_i, field_func(field_method, ogrid, list(h_i)))
+
+
+def test_xtrapz_field_gradient_h_batch():
+    """Test the trapezoidal gradients for a stack of tip-sample separations."""
+
+    from mrfmsim.component import RectangularMagnet, Grid
+
+    magnet = RectangularMagnet(
+        magnet_length=[40.0, 60.0, 100.0],
+        mu0_Ms=1800.0,
+        magnet_origin=[10.0, 0.0, 200.0],
+    )
+    grid = Grid(grid_shape=[5, 3, 2], grid_step=[10, 20, 20], grid_origin=[0, 0, 0])
+    h = np.array([[0, 0, 5], [3.3, 0, 7.1], [0, 1.5, 20]])
+    x_0p_array = np.array([10.0, 35.0])
+
+    gradient = xtrapz_field_gradient(magnet.Bzx_method, grid.grid_array, h, 32, 10.0)
+    gradient_batch = xtrapz_field_gradient_batch(
+        magnet.Bzx_method, grid.grid_array, h, 32, x_0p_array
+    )
+
+    assert gradient.shape == (3, 5, 3, 2)
+    assert gradient_batch.shape == (2, 3, 5, 3, 2)
+    for i, h_i in enumerate(h):
+        expected = xtrapz_field_gradient(
+            magnet.Bzx_method, grid.grid_array, list(h_i), 32, 10.0
+        )
+        assert np.array_equal(gradient[i], expected)
+        expected = xtrapz_field_gradient_batch(
+            magnet.Bzx_method, grid.grid_array, list(h_i), 32, x_0p_array
+        )
+        assert np.array_equal(gradient_batch[:, i], expected)
+
+
 def test_field_func_singularity():
     """Test field when the grid has one point in one direction.
 
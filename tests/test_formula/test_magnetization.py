@@ -38,3 +38,34 @@ def test_mz2_eq_H():
     var_eq = mz2_eq(Gamma, J)
     var_eq_expect = 0.0141 * 0.0141
     assert pytest.approx(var_eq, 2.0e-3) == var_eq_expect
+
+
+def test_mz_eq_curie_limit():
+    """Test mz_eq against the Curie law for nuclear spins at high temperature.
+
+    For x around 1e-9, the closed form cancels catastrophically, while the
+    series evaluation should agree with the Curie law to machine precision.
+    """
+
+    Gamma, J, temperature = 2.675222005e05, 0.5, 300
+    B_tot = np.linspace(-1000, 1000, 11)
+
+    mz_eq_true = B_tot * (HBAR**2 * Gamma**2 * J * (J + 1)) / (3 * KB * temperature)
+    assert np.allclose(mz_eq(B_tot, Gamma, J, temperature), mz_eq_true, rtol=1e-12)
+    assert mz_eq(0.0, Gamma, J, temperature) == 0
+
+
+@pytest.mark.parametrize("J", [0.5, 1.5, 4.0])
+def test_mz_eq_branch_continuity(J):
+    """Test mz_eq is continuous across the series and saturation thresholds."""
+
+    Gamma, temperature = 1.760859708e8, 4.2
+    mu_z = HBAR * Gamma * J
+    a, b = (2 * J + 1) / (2 * J), 1 / (2 * J)
+
+    for x in [0.02 / a, 20.0 / b]:
+        B_tot = np.array([x * (1 - 1e-9), x * (1 + 1e-9)]) * KB * temperature / mu_z
+        mz_lower, mz_upper = mz_eq(B_tot, Gamma, J, temperature)
+        assert mz_lower == pytest.approx(mz_upper, rel=1e-8)
+        mz_neg = mz_eq(-B_tot, Gamma, J, temperature)
+        assert mz_neg == pytest.approx(-mz_eq(B_tot, Gamma, J, temperature))
@@ -1,4 +1,13 @@
-from mrfmsim.formula.math import slice_matrix, as_strided_x
+from mrfmsim.formula.math import (
+    slice_matrix,
+    as_strided_x,
+    as_batch,
+    slice_x,
+    split_position,
+    SeparableWeights,
+    expand_weights,
+    weight_factors,
+)
 import numpy as np
 
 
@@ -39,3 +48,57 @@ def test_as_strided_x():
     strided_result = as_strided_x(matrix_a, window).max(axis=1)
 
     assert np.array_equal(result, strided_result)
+
+
+def test_as_batch():
+    """Test the batch axis is leading and broadcasts against a grid."""
+
+    values = as_batch([1.0, 2.0, 3.0])
+
+    assert values.shape == (3, 1, 1, 1)
+    assert (values * np.ones((4, 5, 6))).shape == (3, 4, 5, 6)
+
+
+def test_split_position():
+    """Test a stack of positions is split into batched coordinates."""
+
+    assert split_position([1.0, 2.0, 3.0]) == (1.0, 2.0, 3.0)
+
+    x, y, z = split_position([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    assert x.shape == y.shape == z.shape == (2, 1, 1, 1)
+    assert np.array_equal(z.ravel(), [3.0, 6.0])
+
+
+def test_batched_x_axis():
+    """Test the x operations skip the leading batch axes."""
+
+    matrix = np.random.rand(2, 7, 5, 3)
+
+    sliced = slice_matrix(matrix, (3, 3, 3))
+    assert sliced.shape == (2, 3, 3, 3)
+    assert np.array_equal(sliced, matrix[:, 2:5, 1:4, :])
+
+    assert np.array_equal(slice_x(matrix, 1, 4), matrix[:, 1:4])
+    assert np.array_equal(slice_x(matrix[0], 1, 4), matrix[0, 1:4])
+
+    strided = as_strided_x(matrix, 3, axis=1).max(axis=2)
+    for i in range(2):
+        assert np.array_equal(strided[i], as_strided_x(matrix[i], 3).max(axis=1))
+
+
+
+def test_separable_weights():
+    """Test only SeparableWeights are expanded into their factors.
+
+    A plain list of arrays is a regular argument.
+    """
+
+    x = np.arange(1.0, 4.0).reshape(3, 1, 1)
+    y = np.arange(1.0, 3.0).reshape(1, 2, 1)
+    weights = SeparableWeights([x, y])
+
+    assert np.array_equal(expand_weights(weights), x * y)
+    assert weight_factors([1.0, weights]) == [1.0, x, y]
+    values = [x, y]
+    assert expand_weights(values) is values
+    assert weight_factors([values]) == [values]
@@ -1,4 +1,5 @@
-from mrfmsim.formula.misc import convert_grid_pts, sum_of_product
+from mrfmsim.formula.misc import convert_grid_pts, sum_of_product, neg_sum_of_product
+from mrfmsim.formula.math import SeparableWeights
 import numpy as np
 
 
@@ -22,3 +23,58 @@ def test_sum_of_product():
     a = np.ones(shape)
 
     assert sum_of_product(a, 10) == 40
+
+
+def test_sum_of_product_broadcast():
+    """Test sum_of_product with a mix of broadcastable arrays and scalars.
+
+    The fused reduction should match the numpy product and sum for
+    one to four dimensional inputs.
+    """
+
+    a = np.random.rand(6, 5, 4)
+    b = np.random.rand(6, 1, 4)
+    c = np.random.rand(5, 1)
+
+    assert np.isclose(sum_of_product(a, b, 2.0, c, 0.5), np.sum(a * b * c))
+    assert np.isclose(neg_sum_of_product(a, c), -np.sum(a * c))
+    assert np.isclose(sum_of_product(a[0, 0], 3), 3 * np.sum(a[0, 0]))
+    assert np.isclose(sum_of_product(a[None], b), np.sum(a * b))
+    assert sum_of_product(2, 3.0) == 6
+
+
+def test_sum_of_product_batch_axes():
+    """Test sum_of_product reduces only the grid axes of batched arrays.
+
+    The axes before the last three are batch axes, and the result has the
+    batch shape.
+    """
+
+    a = np.random.rand(6, 5, 4)
+    B1 = np.array([1.0, 2.0, 3.0]).reshape(3, 1, 1, 1)
+    b = np.random.rand(2, 1, 1, 1, 4)
+
+    result = sum_of_product(a, B1, 0.5)
+    assert result.shape == (3,)
+    assert np.allclose(result, [0.5 * np.sum(a * value) for value in B1.ravel()])
+
+    result = neg_sum_of_product(a, B1, b)
+    assert result.shape == (2, 3)
+    assert np.allclose(result, -np.sum(a * B1 * b, axis=(-3, -2, -1)))
+
+
+def test_sum_of_product_weights():
+    """Test sum_of_product multiplies the separable per-axis weights in."""
+
+    a = np.random.rand(2, 6, 5, 4)
+    weights = SeparableWeights(
+        [
+            np.random.rand(6, 1, 1),
+            np.random.rand(1, 5, 1),
+            np.full((1, 1, 4), 0.5),
+        ]
+    )
+
+    expected = np.sum(a * weights[0] * weights[1] * 0.5, axis=(-3, -2, -1))
+    assert np.allclose(sum_of_product(a, weights), expected)
+    assert np.allclose(neg_sum_of_product(weights, a), -expected)
@@ -2,7 +2,7 @@
 
 import mrfmsim.formula.polarization as pol
 import numpy as np
-from mrfmsim.component import Sample
+from mrfmsim.component import Sample, MultiSample
 import pytest
 
 
@@ -87,6 +87,59 @@ def test_rel_dpol_arp(sample_h):
     assert pytest.approx(0.0, abs=5e-10) == rpol_0
 
 
+def test_rel_dpol_nut_multi_freq_pulse(sample_h):
+    """Test rel_dpol_nut_multi_freq_pulse against a loop over rel_dpol_nut.
+
+    The relative polarization after the pulses is the product of the
+    polarization after each pulse.
+    """
+
+    B_tot = np.random.rand(4, 3, 2) * 0.2 + 100
+    f_rf_array = np.linspace(99.9, 100.1, 5) * sample_h.Gamma / (2 * np.pi)
+    B1, t_p = 0.05, 1e-6
+
+    pol_exp = np.ones(B_tot.shape)
+    for f_rf in f_rf_array:
+        B_offset = B_tot - 2 * np.pi * f_rf / sample_h.Gamma
+        pol_exp *= pol.rel_dpol_nut(B_offset, B1, sample_h.Gamma, t_p) + 1
+
+    rpol = pol.rel_dpol_nut_multi_freq_pulse(
+        B_tot, B1, f_rf_array, sample_h.Gamma, t_p
+    )
+    assert rpol.shape == (4, 3, 2)
+    assert np.allclose(rpol, pol_exp - 1)
+
+
+def test_rel_dpol_nut_multi_freq_pulse_species(sample_h):
+    """Test rel_dpol_nut_multi_freq_pulse with the species of a MultiSample.
+
+    The Gamma and the frequency batches are looped over as the B1 batch.
+    """
+
+    sample_f = Sample(spin="19F", temperature=4.2, T1=2, T2=2e-6, spin_density=30)
+    sample = MultiSample.from_samples([sample_h, sample_f])
+    B_tot = np.random.rand(4, 3, 2) * 0.2 + 100
+    f_rf_array = np.linspace(99.9, 100.1, 5) * sample_h.Gamma / (2 * np.pi)
+    B1, t_p = 0.05, 1e-6
+
+    rpol = pol.rel_dpol_nut_multi_freq_pulse(B_tot, B1, f_rf_array, sample.Gamma, t_p)
+    assert rpol.shape == (2, 4, 3, 2)
+    for i, species in enumerate([sample_h, sample_f]):
+        expected = pol.rel_dpol_nut_multi_freq_pulse(
+            B_tot, B1, f_rf_array, species.Gamma, t_p
+        )
+        assert np.allclose(rpol[i], expected, rtol=1e-12, atol=0)
+
+    f_rf_batch = np.stack([f_rf_array, f_rf_array * 1.001])
+    rpol = pol.rel_dpol_nut_multi_freq_pulse(B_tot, B1, f_rf_batch, sample.Gamma, t_p)
+    assert rpol.shape == (2, 4, 3, 2)
+    for i, species in enumerate([sample_h, sample_f]):
+        expected = pol.rel_dpol_nut_multi_freq_pulse(
+            B_tot, B1, f_rf_batch[i], species.Gamma, t_p
+        )
+        assert np.allclose(rpol[i], expected, rtol=1e-12, atol=0)
+
+
 def test_rel_dpol_periodic_irrad_cont(sample_e):
     """Test rel_dpol_periodic_irrad in the continuous case.
 
@@ -197,6 +250,16 @@ def test_rel_dpol_sat_td_nan(sample_e):
     assert not np.any(np.isnan(rpol_b))
 
 
+def test_rel_dpol_sat_td_errstate(sample_e):
+    """Test rel_dpol_sat_td does not change the global floating-point state."""
+    Bzx = np.array([1, 0, -1])
+    ext_B_offset = np.array([2, 0, 0, 0, 2])
+
+    errstate = np.geterr()
+    pol.rel_dpol_sat_td(Bzx, 1.0, ext_B_offset, 1, sample_e.Gamma, sample_e.T2, 2000)
+    assert np.geterr() == errstate
+
+
 def test_rel_dpol_sat_td_nan_boundary(sample_e):
     """Test rel_dpol_sat_td raises an error if nan values are at the boundary."""
     Bzx = np.array([0, 0, -1])
@@ -208,6 +271,32 @@ def test_rel_dpol_sat_td_nan_boundary(sample_e):
         )
 
 
+def test_rel_dpol_sat_td_nested(sample_e):
+    """Test the nested windows against rel_dpol_sat_td for each window."""
+
+    Bzx = np.random.rand(8, 3, 2) + 0.5
+    ext_B_offset = np.random.rand(20, 3, 2) - 0.5
+    ext_pts_array = np.array([2, 6, 1])
+
+    rpol = pol.rel_dpol_sat_td_nested(
+        Bzx, 1.0, ext_B_offset, ext_pts_array, sample_e.Gamma, sample_e.T2, 2000
+    )
+
+    assert rpol.shape == (3, 8, 3, 2)
+    for ext_pts, result in zip(ext_pts_array, rpol):
+        start = 6 - ext_pts
+        expected = pol.rel_dpol_sat_td(
+            Bzx,
+            1.0,
+            ext_B_offset[start : start + 8 + 2 * ext_pts],
+            ext_pts,
+            sample_e.Gamma,
+            sample_e.T2,
+            2000,
+        )
+        assert np.array_equal(result, expected)
+
+
 def test_rel_dpol_sat_td_nan_division(sample_e):
     """Test rel_dpol_sat_td raises an error if nan values are from division."""
     Bzx = np.array([2, 0, 0, -1])
@@ -268,7 +357,74 @@ def test_rel_dol_sat_td_smallsteps(sample_e):
         1.0, ext_Bzx, ext_B_offset, 1, sample_e.Gamma, sample_e.T2, 2000.0
     )
 
-    assert np.array_equal(rpol_td, rpol_smallsteps)
+    assert np.allclose(rpol_td, rpol_smallsteps, rtol=1e-12, atol=0)
+
+
+def test_rel_dpol_sat_td_smallsteps_long_window(sample_h):
+    """Test rel_dpol_sat_td_smallsteps with long windows on a 3D grid.
+
+    The sliding sum over many small steps should agree with the arctangent
+    difference of rel_dpol_sat_td within the rounding error, when Bzx is
+    constant along x and the offset is monotonic.
+    """
+
+    ext_pts = 400
+    x = np.linspace(-0.02, 0.02, 1000)
+    ext_B_offset = x[:, None, None] * np.linspace(0.5, 2.0, 6)[None, :, None]
+    ext_B_offset = np.broadcast_to(ext_B_offset, (1000, 6, 4))
+    ext_Bzx = np.full((1000, 6, 4), 2.0)
+    Bzx = np.full((1000 - ext_pts * 2, 6, 4), 2.0)
+    args = (sample_h.Gamma, sample_h.T2, 1e5)
+
+    rpol_td = pol.rel_dpol_sat_td(Bzx, 0.3, ext_B_offset, ext_pts, *args)
+    rpol_smallsteps = pol.rel_dpol_sat_td_smallsteps(
+        0.3, ext_Bzx, ext_B_offset, ext_pts, *args
+    )
+
+    assert rpol_smallsteps.shape == (200, 6, 4)
+    assert np.any(np.abs(rpol_td) > 1e-3)
+    assert np.allclose(rpol_smallsteps, rpol_td, rtol=1e-10, atol=0)
+
+
+def test_rel_dpol_sat_td_smallsteps_window_sum(sample_h):
+    """Test rel_dpol_sat_td_smallsteps against an explicit window sum.
+
+    The sliding-sum kernel should match the strided window sum over the
+    extended grid, including the zero Bzx steps that give nan or inf
+    increments. The numpy error state should not be modified.
+    """
+
+    ext_Bzx = np.random.rand(12, 4, 3) + 0.5
+    ext_B_offset = np.random.rand(12, 4, 3) - 0.5
+    # inf increment: the mean Bzx is zero and the offset changes
+    ext_Bzx[3:5, 1, 2] = [0.3, -0.3]
+    # nan increment: the mean Bzx is zero and the offset is constant
+    ext_Bzx[6:8, 0, 0] = 0
+    ext_B_offset[6:8, 0, 0] = 0.2
+    ext_pts = 2
+    Gamma, T2, tip_v = sample_h.Gamma, sample_h.T2, 1e6
+
+    err_state = np.geterr()
+    rpol = pol.rel_dpol_sat_td_smallsteps(
+        1.0, ext_Bzx, ext_B_offset, ext_pts, Gamma, T2, tip_v
+    )
+    assert np.geterr() == err_state
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        atan_diff = np.diff(np.arctan(ext_B_offset * Gamma * T2), axis=0)
+        Bzx_mean = (ext_Bzx[1:] + ext_Bzx[:-1]) / 2
+        f_array = np.nan_to_num(np.abs(atan_diff / Bzx_mean))
+
+    rpol_exp = np.zeros((8, 4, 3))
+    for i in range(rpol_exp.shape[0]):
+        f_sum = f_array[i : i + ext_pts * 2].sum(axis=0)
+        with np.errstate(over="ignore"):
+            rpol_exp[i] = np.exp(-Gamma * f_sum / tip_v) - 1
+
+    assert rpol.shape == (8, 4, 3)
+    assert np.allclose(rpol, rpol_exp)
+    assert np.all(rpol[0:4, 1, 2] == -1)
+    assert not np.any(np.isnan(rpol))
 
 
 def test_rel_dpol_multipulse_no_pol(sample_e):
@@ -298,3 +454,62 @@ def test_rel_dpol_multipulse_long(sample_e):
 
     rpol = pol.rel_dpol_multipulse(-0.5, sample_e.T1, 500.0)
     assert pytest.approx(rpol, abs=0.001) == 0
+
+
+def test_rel_dpol_batch(sample_e):
+    """Test the kernels broadcast a batch of parameters along a leading axis.
+
+    Each member of the batch should equal the result for a scalar parameter.
+    """
+
+    B_offset = np.random.rand(4, 3, 2) - 0.5
+    B1_array = np.array([0.1, 0.5, 2.0])
+    B1 = B1_array.reshape(3, 1, 1, 1)
+    Gamma, T1, T2 = sample_e.Gamma, sample_e.T1, sample_e.T2
+
+    batched = {
+        "sat": pol.rel_dpol_sat_steadystate(B_offset, B1, 0.3, 0.2),
+        "arp": pol.rel_dpol_arp(B_offset, B1, 1e6, Gamma),
+        "nut": pol.rel_dpol_nut(B_offset, B1, Gamma, 1e-9),
+        "multi_freq": pol.rel_dpol_nut_multi_freq_pulse(
+            B_offset, B1, [0, 1e6], Gamma, 1e-9
+        ),
+    }
+    for i, value in enumerate(B1_array):
+        single = {
+            "sat": pol.rel_dpol_sat_steadystate(B_offset, value, 0.3, 0.2),
+            "arp": pol.rel_dpol_arp(B_offset, value, 1e6, Gamma),
+            "nut": pol.rel_dpol_nut(B_offset, value, Gamma, 1e-9),
+            "multi_freq": pol.rel_dpol_nut_multi_freq_pulse(
+                B_offset, value, [0, 1e6], Gamma, 1e-9
+            ),
+        }
+        for key, result in batched.items():
+            assert result.shape == (3, 4, 3, 2)
+            assert np.array_equal(result[i], single[key])
+
+    Bzx = np.random.rand(4, 3, 2) + 0.5
+    ext_Bzx = np.random.rand(8, 3, 2) + 0.5
+    ext_B_offset = np.random.rand(8, 3, 2) - 0.5
+    td = pol.rel_dpol_sat_td(Bzx, B1, ext_B_offset, 2, Gamma, T2, 2000)
+    smallsteps = pol.rel_dpol_sat_td_smallsteps(
+        B1, ext_Bzx, ext_B_offset, 2, Gamma, T2, 2000
+    )
+    T2_batch = np.array([T2, 2 * T2]).reshape(2, 1, 1, 1)
+    td_T2 = pol.rel_dpol_sat_td(Bzx, 1.0, ext_B_offset, 2, Gamma, T2_batch, 2000)
+
+    for i, value in enumerate(B1_array):
+        assert np.array_equal(
+            td[i], pol.rel_dpol_sat_td(Bzx, value, ext_B_offset, 2, Gamma, T2, 2000)
+        )
+        assert np.allclose(
+            smallsteps[i],
+            pol.rel_dpol_sat_td_smallsteps(
+                value, ext_Bzx, ext_B_offset, 2, Gamma, T2, 2000
+            ),
+            rtol=1e-12,
+            atol=0,
+        )
+    for i, value in enumerate(T2_batch.ravel()):
+        expected = pol.rel_dpol_sat_td(Bzx, 1.0, ext_B_offset, 2, Gamma, value, 2000)
+        assert np.array_equal(td_T2[i], expected)
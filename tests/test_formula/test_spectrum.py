@@ -0,0 +1,94 @@
+from mrfmsim.formula import (
+    SeparableWeights,
+    rel_dpol_sat_steadystate,
+    spectrum_sat_steadystate,
+    spectrum_weight,
+)
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def field_weight():
+    """Random total field and weight arrays."""
+    B_tot = np.random.rand(20, 10, 5) * 20 + 690
+    weight = np.random.rand(20, 10, 5)
+    return B_tot, weight
+
+
+def sat_loop(B_tot, weight, f_rf_array, Gamma, B1, dB_sat, dB_hom):
+    """Calculate the spectrum by looping over the frequencies."""
+    return np.array(
+        [
+            np.sum(
+                weight
+                * rel_dpol_sat_steadystate(
+                    B_tot - 2 * np.pi * f_rf / Gamma, B1, dB_sat, dB_hom
+                )
+            )
+            for f_rf in f_rf_array
+        ]
+    )
+
+
+def test_spectrum_sat_steadystate(field_weight):
+    """Test the histogram spectrum against the frequency loop.
+
+    The binning error should decrease quadratically with the oversampling,
+    and the frequencies can be increasing or decreasing.
+    """
+
+    B_tot, weight = field_weight
+    Gamma, B1, dB_sat, dB_hom = 1.760859708e8, 1e-3, 2e-3, 0.5
+    f_rf_array = np.linspace(685, 715, 61) * Gamma / (2 * np.pi)
+    args = (Gamma, B1, dB_sat, dB_hom)
+
+    spectrum = sat_loop(B_tot, weight, f_rf_array, *args)
+    scale = np.max(np.abs(spectrum))
+
+    error_2 = np.max(
+        np.abs(spectrum_sat_steadystate(B_tot, weight, f_rf_array, *args, 2) - spectrum)
+    )
+    error_8 = np.max(
+        np.abs(spectrum_sat_steadystate(B_tot, weight, f_rf_array, *args, 8) - spectrum)
+    )
+    assert error_8 < 1e-3 * scale
+    assert error_8 < error_2 / 8
+
+    spectrum_reversed = spectrum_sat_steadystate(
+        B_tot, weight, f_rf_array[::-1], *args, 8
+    )
+    assert np.allclose(spectrum_reversed[::-1], spectrum, rtol=0, atol=1e-3 * scale)
+
+
+def test_spectrum_sat_steadystate_single_frequency(field_weight):
+    """Test the spectrum of a single frequency is the direct sum."""
+
+    B_tot, weight = field_weight
+    args = (1.760859708e8, 1e-3, 2e-3, 0.5)
+    f_rf_array = np.array([700 * args[0] / (2 * np.pi)])
+
+    spectrum = spectrum_sat_steadystate(B_tot, weight, f_rf_array, *args, 4)
+    assert np.allclose(spectrum, sat_loop(B_tot, weight, f_rf_array, *args))
+
+
+def test_spectrum_sat_steadystate_uneven(field_weight):
+    """Test the spectrum raises an error for unevenly spaced frequencies."""
+
+    B_tot, weight = field_weight
+    with pytest.raises(ValueError, match="evenly spaced"):
+        spectrum_sat_steadystate(B_tot, weight, [1e9, 2e9, 4e9], 1.76e8, 1, 1, 1, 4)
+
+
+def test_spectrum_weight():
+    """Test the spectrum weight with a scalar and separable voxel weights."""
+
+    Bzxx = np.random.rand(4, 3, 2)
+    mz_eq = np.random.rand(4, 3, 2)
+    factors = [np.random.rand(4, 1, 1), np.random.rand(1, 3, 1), np.ones((1, 1, 2))]
+
+    weight = spectrum_weight(Bzxx, mz_eq, 2.0, 0.5)
+    assert np.allclose(weight, -Bzxx * mz_eq)
+
+    weight = spectrum_weight(Bzxx, mz_eq, 2.0, SeparableWeights(factors))
+    assert np.allclose(weight, -2.0 * Bzxx * mz_eq * factors[0] * factors[1])
@@ -0,0 +1,38 @@
+import pytest
+import numpy as np
+from mrfmsim.formula import (
+    field_index,
+    resonant_slice,
+    arp_half_width,
+    rel_dpol_arp,
+)
+
+
+def test_resonant_slice():
+    """Test the slice contains exactly the voxels within the band."""
+
+    Bz = np.random.default_rng(0).normal(size=(10, 20, 30))
+    Bz_index = field_index(Bz)
+    assert np.array_equal(Bz.ravel()[Bz_index.order], Bz_index.field)
+
+    start, stop = resonant_slice(Bz_index, 5.0, 5.3, 0.25)
+    ids = Bz_index.order[start:stop]
+    mask = np.abs(Bz + 5.0 - 5.3) <= 0.25
+    assert np.array_equal(np.sort(ids), np.flatnonzero(mask))
+
+
+def test_field_index_batch():
+    """Test the field index rejects a field with batch axes."""
+
+    with pytest.raises(ValueError, match="batch axes"):
+        field_index(np.zeros((2, 3, 4, 5)))
+
+
+@pytest.mark.parametrize("rel_dpol_tol", [1e-2, 1e-4, 1e-6])
+def test_arp_half_width(rel_dpol_tol):
+    """Test rel_dpol_arp is within the tolerance outside the band."""
+
+    B1, df_fm, Gamma = 2.5, 1e6, 2.675222005e05
+    half_width = arp_half_width(B1, df_fm, Gamma, rel_dpol_tol)
+    B_offset = half_width * np.array([1.0, 1.5, 10.0, -1.0, -3.0])
+    assert np.all(np.abs(rel_dpol_arp(B_offset, B1, df_fm, Gamma)) <= rel_dpol_tol)
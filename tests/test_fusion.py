@@ -0,0 +1,181 @@
+from mrfmsim.fusion import fusible_regions, FusedKernel
+from mrfmsim.experiment import CermitESRGroup, CermitARPGroup, IBMCyclic
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+from mrfmsim import formula
+import numpy as np
+import operator
+import pytest
+
+
+@pytest.fixture
+def sample():
+    """Return the sample object."""
+    return Sample(
+        spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+    )
+
+
+@pytest.fixture
+def magnet():
+    """Return the magnet object."""
+    return SphereMagnet(magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0])
+
+
+@pytest.fixture
+def grid():
+    """Return the grid object."""
+    return Grid(grid_shape=[41, 11, 21], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+
+
+def test_fusible_regions():
+    """Test the regions stop at nodes used outside the chain and at returns."""
+
+    graph = CermitARPGroup.experiments["CermitARP"].graph
+    region = ["B_tot", "mz_eq", "B_offset", "rel_dpol arp", "spring constant shift"]
+    assert fusible_regions(graph, ["dk_spin"]) == [region]
+    assert fusible_regions(graph, ["dk_spin", "mz_eq"]) == [
+        ["B_offset", "rel_dpol arp", "spring constant shift"]
+    ]
+
+    # rel_dpol is used by two reductions, only mz_eq is fused
+    assert fusible_regions(IBMCyclic.graph, IBMCyclic.returns) == [
+        ["mz_eq", "force signal"]
+    ]
+
+
+def test_fused_kernel():
+    """Test the fused kernel against the original functions.
+
+    The kernel should work with scalar and array inputs, and fall back to
+    the original functions if all the inputs are scalar.
+    """
+
+    kernel = FusedKernel(
+        [("B_tot", operator.add, ["Bz", "B0"])],
+        formula.neg_sum_of_product,
+        ["B_tot", "Bzxx", "spin_density"],
+    )
+    assert kernel.params == ["Bz", "B0", "Bzxx", "spin_density"]
+
+    Bz = np.random.rand(5, 4, 3)
+    Bzxx = np.random.rand(5, 1, 3)
+    spin_density = np.random.rand(4, 1)
+    expected = -np.sum((Bz + 2.0) * Bzxx * spin_density)
+    assert np.isclose(kernel(Bz, 2.0, Bzxx, spin_density), expected)
+    assert np.isclose(kernel(Bz[0, 0], 2.0, 3.0, 0.5), -np.sum(Bz[0, 0] + 2.0) * 1.5)
+    assert kernel(1.0, 2.0, 3.0, 0.5) == -4.5
+
+
+def test_fused_kernel_separable_weights(monkeypatch):
+    """Test the fused kernel multiplies the separable weights per voxel.
+
+    The factors are passed to the kernel without the full-grid product, in
+    the reduction and in the element-wise steps.
+    """
+
+    def expand_weights(weights):
+        raise AssertionError("the separable weights are expanded")
+
+    monkeypatch.setattr(formula, "expand_weights", expand_weights)
+    kernel = FusedKernel(
+        [("B_tot", operator.add, ["Bz", "B0"])],
+        formula.sum_of_product,
+        ["B_tot", "Bzxx", "grid_voxel"],
+    )
+    Bz = np.random.rand(2, 5, 4, 3)
+    Bzxx = np.random.rand(5, 1, 3)
+    weights = formula.SeparableWeights(
+        [np.random.rand(5, 1, 1), np.random.rand(1, 4, 1), np.random.rand(1, 1, 3)]
+    )
+    product = weights[0] * weights[1] * weights[2]
+    expected = np.sum((Bz + 2.0) * Bzxx * product, axis=(-3, -2, -1))
+    assert np.allclose(kernel(Bz, 2.0, Bzxx, weights), expected, rtol=1e-12)
+
+    kernel = FusedKernel(
+        [("B_tot", operator.add, ["Bz", "grid_voxel"])],
+        formula.sum_of_product,
+        ["B_tot", "Bzxx"],
+    )
+    expected = np.sum((Bz[0] + product) * Bzxx)
+    assert np.isclose(kernel(Bz[0], weights, Bzxx), expected, rtol=1e-12)
+
+
+class TestCompile:
+    """Test the compiled experiments match the original experiments."""
+
+    def test_compile_stationary_tip(self, sample, magnet, grid):
+        """Test CermitESRStationaryTip with a scalar and an array spin density.
+
+        The separable weights of the Simpson rule are fused as well.
+        """
+
+        experiment = CermitESRGroup.experiments["CermitESRStationaryTip"]
+        compiled = experiment.compile()
+
+        assert "mz_eq" not in compiled.graph.nodes
+        assert compiled.signature == experiment.signature
+        assert compiled.returns == experiment.returns
+
+        inputs = {
+            "B0": 700,
+            "B1": 3.9e-4,
+            "f_rf": 17.7e9,
+            "grid": grid,
+            "h": [0, 50, 0],
+            "magnet": magnet,
+            "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        }
+        assert np.isclose(
+            compiled(sample=sample, **inputs), experiment(sample=sample, **inputs)
+        )
+
+        sample.spin_density = np.random.rand(*grid.grid_shape)
+        assert np.isclose(
+            compiled(sample=sample, **inputs), experiment(sample=sample, **inputs)
+        )
+
+        inputs["grid"] = Grid(
+            grid_shape=grid.grid_shape,
+            grid_step=grid.grid_step,
+            grid_origin=grid.grid_origin,
+            grid_quadrature="simpson",
+        )
+        assert np.isclose(
+            compiled(sample=sample, **inputs), experiment(sample=sample, **inputs)
+        )
+
+    def test_compile_ibmcyclic(self, sample, magnet, grid):
+        """Test IBMCyclic with two reduction nodes."""
+
+        compiled = IBMCyclic.compile()
+        inputs = {
+            "B0": 700,
+            "df_fm": 1e8,
+            "f_rf": 17.7e9,
+            "grid": grid,
+            "h": [0, 50, 0],
+            "magnet": magnet,
+            "sample": sample,
+        }
+        assert np.allclose(compiled(**inputs), IBMCyclic(**inputs))
+
+    def test_compile_batch(self, sample, magnet, grid):
+        """Test a compiled experiment reduces a batch of B1 to one value each."""
+
+        experiment = CermitESRGroup.experiments["CermitESRStationaryTip"]
+        compiled = experiment.compile()
+        inputs = {
+            "B0": 700,
+            "f_rf": 17.7e9,
+            "grid": grid,
+            "h": [0, 50, 0],
+            "magnet": magnet,
+            "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+            "sample": sample,
+        }
+        B1_array = np.array([1e-4, 3.9e-4, 1e-3])
+
+        df_spin = compiled(B1=formula.as_batch(B1_array), **inputs)
+
+        assert df_spin.shape == (3,)
+        assert np.allclose(df_spin, [experiment(B1=B1, **inputs) for B1 in B1_array])
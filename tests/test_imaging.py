@@ -0,0 +1,98 @@
+from mrfmsim.imaging import ConvolutionOperator, padded_grid
+from mrfmsim.experiment import CermitESRGroup, IBMCyclic
+from mrfmsim.component import SphereMagnet, Grid, RectilinearGrid, Sample, Cantilever
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def grid():
+    """Return the grid object."""
+    return Grid(grid_shape=[21, 11, 5], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+
+
+@pytest.fixture
+def magnet():
+    """Return the magnet object."""
+    return SphereMagnet(magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0])
+
+
+@pytest.fixture
+def sample(grid):
+    """Return the sample object with a random spin density."""
+    return Sample(
+        spin="e",
+        temperature=11.0,
+        T1=1.3e-3,
+        T2=0.45e-6,
+        spin_density=np.random.rand(*grid.grid_shape),
+    )
+
+
+def test_convolution_operator_adjoint():
+    """Test the adjoint operator against the dense matrix."""
+
+    kernel = np.random.rand(6, 5, 4)
+    operator = ConvolutionOperator(kernel, (4, 3, 2), (3, 3, 3))
+    matrix = operator @ np.eye(operator.shape[1])
+
+    image = np.random.rand(operator.shape[0])
+    assert np.allclose(operator.rmatvec(image), matrix.T @ image)
+    assert operator.shape == (27, 24)
+
+
+def test_linear_operator_cermitesr(grid, magnet, sample):
+    """Test the 2D image of dk_spin against the experiment per position."""
+
+    experiment = CermitESRGroup.experiments["CermitESRStationaryTip"]
+    cantilever = Cantilever(k_c=2e4, f_c=3e6)
+    inputs = {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [-16, 40, 0],
+        "magnet": magnet,
+        "sample": sample,
+        "cantilever": cantilever,
+    }
+    operator = experiment.linear_operator("dk_spin", (4, 3), **inputs)
+    image = (operator @ sample.spin_density.ravel()).reshape(operator.image_shape)
+
+    assert image.shape == (4, 3)
+    for (i, j), value in np.ndenumerate(image):
+        inputs["h"] = [-16 + 8 * i, 40 + 10 * j, 0]
+        expected = experiment(**inputs) / cantilever.k2f_modulated
+        assert value == pytest.approx(expected, rel=1e-9)
+
+
+def test_linear_operator_ibmcyclic(grid, magnet, sample):
+    """Test the 3D image of dF_spin against the experiment per position."""
+
+    inputs = {
+        "B0": 757,
+        "df_fm": 1e8,
+        "f_rf": 17.7e9,
+        "grid": grid,
+        "h": [0, 50, -8],
+        "magnet": magnet,
+        "sample": sample,
+    }
+    operator = IBMCyclic.linear_operator("dF_spin", (2, 2, 3), **inputs)
+    image = (operator @ sample.spin_density.ravel()).reshape(2, 2, 3)
+    assert np.all(image != 0)
+
+    for (i, j, k), value in np.ndenumerate(image):
+        inputs["h"] = [8 * i, 50 + 10 * j, -8 + 8 * k]
+        _, dF_spin = IBMCyclic(**inputs)
+        assert value == pytest.approx(dF_spin, rel=1e-9, abs=1e-12 * abs(image).max())
+
+    with pytest.raises(ValueError, match="not the output of a sum of products"):
+        IBMCyclic.linear_operator("B_tot", (2, 2), **inputs)
+
+    inputs["grid"] = RectilinearGrid(*[np.ravel(a) for a in grid.grid_array])
+    match = "linear operator requires a Grid, not RectilinearGrid"
+    with pytest.raises(ValueError, match=match):
+        IBMCyclic.linear_operator("dF_spin", (2, 2), **inputs)
+    with pytest.raises(ValueError, match="grid padding requires a Grid"):
+        padded_grid(inputs["grid"], (2, 2, 1))
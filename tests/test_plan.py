@@ -0,0 +1,106 @@
+from mrfmsim.plan import plan, plan_block_shape, ArraySpec
+from mrfmsim.chunk import block_grid, peak_bytes
+from mrfmsim.experiment import CermitESRGroup, CermitARPGroup, IBMCyclic
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+from mrfmsim.formula import as_batch
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def inputs():
+    """Return the CermitESR inputs."""
+    return {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        "f_rf": 17.7e9,
+        "grid": Grid(
+            grid_shape=[41, 23, 17], grid_step=[8, 10, 8], grid_origin=[0, -50, 0]
+        ),
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "sample": Sample(
+            spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+        ),
+    }
+
+
+def node_outputs(experiment, **inputs):
+    """Return the outputs of all the nodes of an execution."""
+
+    experiment = experiment.edit(returns=[])
+    outputs = [obj.output for _, obj in experiment.graph.nodes(data="node_object")]
+    return dict(zip(outputs, experiment.edit(returns=outputs)(**inputs)))
+
+
+def test_array_spec():
+    """Test the memory of an array spec and its views."""
+
+    spec = ArraySpec((2, 3, 4))
+    assert spec.size == 24
+    assert spec.nbytes == 24 * 8
+    assert ArraySpec((3, 4), base=spec).nbytes == 0
+
+
+@pytest.mark.parametrize(
+    "experiment",
+    [
+        CermitESRGroup.experiments["CermitESR"],
+        CermitESRGroup.experiments["CermitESRSmallTip"],
+        CermitARPGroup.experiments["CermitARP"],
+    ],
+)
+def test_plan_shapes(experiment, inputs):
+    """Test the planned shapes against the node outputs of an execution."""
+
+    inputs.update(x_0p=40, trapz_pts=20, df_fm=1e9)
+    params = experiment.signature.parameters
+    inputs = {key: value for key, value in inputs.items() if key in params}
+    inputs["B1"] = as_batch([3.9e-4, 5e-4])
+    memory_plan = plan(experiment, **inputs)
+    outputs = node_outputs(experiment, **inputs)
+
+    for node in memory_plan.nodes:
+        if isinstance(node.value, ArraySpec):
+            assert node.shape == np.shape(outputs[node.output]), node.node
+            assert node.dtype == np.asarray(outputs[node.output]).dtype
+    assert memory_plan.nodes[-1].shape == (2,)
+    assert memory_plan.peak == max(node.peak for node in memory_plan.nodes)
+
+
+def test_plan_peak(inputs):
+    """Test the planned peak is close to the measured peak memory."""
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    CermitESR(**inputs)
+    measured = peak_bytes(CermitESR, **inputs)
+    assert 0.8 < CermitESR.plan(**inputs).peak / measured < 1.25
+
+    inputs = {key: inputs[key] for key in ["B0", "h", "magnet", "sample", "grid"]}
+    memory_plan = IBMCyclic.plan(f_rf=16.1e9, df_fm=1e9, **inputs)
+    assert [node.shape for node in memory_plan.nodes[-2:]] == [(), ()]
+
+
+def test_plan_budget(inputs):
+    """Test the plan refuses the execution and suggests the block shape."""
+
+    CermitESR = CermitESRGroup.experiments["CermitESR"]
+    peak = CermitESR.plan(**inputs).peak
+    assert CermitESR.plan(max_bytes=peak, **inputs).peak == peak
+
+    max_bytes = peak // 4
+    block_shape = plan_block_shape(CermitESR, max_bytes, **inputs)
+    assert np.prod(block_shape) < 23 * 17
+    grid = inputs.pop("grid")
+    block = block_grid(grid, slice(0, block_shape[0]), slice(0, block_shape[1]))
+    assert CermitESR.plan(grid=block, **inputs).peak <= max_bytes
+
+    with pytest.raises(MemoryError, match=rf"chunked\(block_shape=\({block_shape[0]}"):
+        CermitESR.plan(max_bytes=max_bytes, grid=grid, **inputs)
+
+    with pytest.raises(MemoryError, match="exceeds the budget of 1000 bytes$"):
+        CermitESR.plan(max_bytes=1000, grid=grid, **inputs)
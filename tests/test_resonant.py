@@ -0,0 +1,96 @@
+from mrfmsim.resonant import gather, gathered_grid, resonant_mask
+from mrfmsim.experiment import CermitESRGroup
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def inputs():
+    """Return the CermitESRSmallTip inputs."""
+    return {
+        "B0": 700,
+        "B1": 3.9e-4,
+        "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        "f_rf": 17.7e9,
+        "grid": Grid(
+            grid_shape=[41, 23, 17], grid_step=[8, 10, 8], grid_origin=[0, -50, 0]
+        ),
+        "h": [0, 50, 0],
+        "magnet": SphereMagnet(
+            magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+        ),
+        "mw_x_0p": 40,
+        "sample": Sample(
+            spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+        ),
+        "trapz_pts": 20,
+        "x_0p": 40,
+    }
+
+
+def test_gather():
+    """Test gathering the grid axes keeps the batch and broadcast axes."""
+
+    value = np.arange(48.0).reshape(2, 2, 3, 4)
+    index = np.array([0, 5, 23])
+    gathered = gather(value, index, (2, 3, 4))
+    assert gathered.shape == (2, 1, 3, 1)
+    assert np.array_equal(gathered[:, 0, :, 0], value.reshape(2, -1)[:, index])
+    assert np.array_equal(
+        gather(value[0, :1, :, :1], index, (2, 3, 4)).ravel(), [0, 4, 8]
+    )
+    assert gather(2.0, index, (2, 3, 4)) == 2.0
+
+    grid_array = np.ogrid[0:2, 0:3, 0:4]
+    x, y, z = gathered_grid(grid_array, index)
+    assert x.shape == (1, 3, 1)
+    assert np.array_equal(np.ravel(z + 4 * y + 12 * x), index)
+
+
+def test_resonant_mask():
+    """Test the mask selects a voxel if any batch member exceeds the tolerance."""
+
+    rel_dpol = np.zeros((2, 2, 1, 2))
+    rel_dpol[0, 0, 0, 1] = 0.1
+    rel_dpol[1, 1, 0, 0] = -0.1
+    mask = resonant_mask(rel_dpol, 0.05)
+    assert np.array_equal(mask, [[[False, True]], [[True, False]]])
+
+
+@pytest.mark.parametrize("name", ["CermitESR", "CermitESRSmallTip"])
+def test_resonant_run(name, inputs):
+    """Test the resonant sum and the estimate of the dropped voxels.
+
+    The estimate of a sample is stochastic, and is compared with the exact
+    contribution within its standard errors.
+    """
+
+    experiment = CermitESRGroup.experiments[name]
+    params = experiment.signature.parameters
+    inputs = {key: value for key, value in inputs.items() if key in params}
+    df_spin = experiment(**inputs)
+
+    assert experiment.resonant("dk_spin", 0, **inputs) == (df_spin, 0, 0)
+
+    # the dropped voxels are all evaluated for the exact estimate
+    result, estimate, stderr = experiment.resonant(
+        "dk_spin", 1e-3, error_samples=10**5, **inputs
+    )
+    assert result != df_spin
+    assert stderr == 0
+    k2f = inputs["cantilever"].k2f_modulated
+    assert np.isclose(result + estimate * k2f, df_spin, rtol=1e-12)
+
+    # the estimate from a sample of the dropped voxels is within the
+    # confidence interval of four standard errors
+    _, sample_estimate, sample_stderr = experiment.resonant(
+        "dk_spin", 1e-3, error_samples=500, **inputs
+    )
+    assert 0 < sample_stderr < abs(estimate)
+    assert abs(sample_estimate - estimate) <= 4 * sample_stderr
+
+    with pytest.raises(ValueError, match="'Bz' is not a factor of 'dk_spin'"):
+        experiment.resonant("dk_spin", 1e-3, mask_factor="Bz", **inputs)
+    with pytest.raises(ValueError, match="'grid_voxel' is not the output of a node"):
+        experiment.resonant("dk_spin", 1e-3, mask_factor="grid_voxel", **inputs)
@@ -0,0 +1,114 @@
+from mrfmsim.sampling import adaptive_sample, spectrum_features
+from mrfmsim.experiment import CermitESRGroup, IBMCyclic
+from mrfmsim.component import SphereMagnet, Grid, Sample, Cantilever
+import numpy as np
+import pytest
+
+
+class CountedLineshape:
+    """Lorentzian absorption or dispersion lineshape that counts the calls."""
+
+    def __init__(self, center, hwhm, dispersion=False):
+        self.center = center
+        self.hwhm = hwhm
+        self.dispersion = dispersion
+        self.calls = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        u = (x - self.center) / self.hwhm
+        return u / (1 + u**2) if self.dispersion else -1 / (1 + u**2)
+
+
+def test_adaptive_sample_absorption():
+    """Test a narrow absorption line is located with few evaluations.
+
+    A uniform sweep needs thousands of points to locate the peak and the
+    width to 1e-3 relative error.
+    """
+
+    func = CountedLineshape(0.3137, 0.01)
+    x, y = adaptive_sample(func, (-1, 1), tol=1e-3, n_initial=33)
+
+    assert func.calls == x.size < 200
+    assert np.all(np.diff(x) > 0)
+
+    features = spectrum_features(x, y)
+    assert features.peaks == pytest.approx([0.3137], abs=1e-5)
+    assert features.peak_values == pytest.approx([-1], rel=1e-3)
+    assert features.widths == pytest.approx([0.02], rel=1e-3)
+    assert features.zero_crossings.size == 0
+
+
+def test_spectrum_features_dispersion():
+    """Test the extrema and zero crossing of a dispersion line."""
+
+    func = CountedLineshape(0.3137, 0.01, dispersion=True)
+    x, y = adaptive_sample(func, (-1, 1), tol=1e-3, n_initial=33)
+    features = spectrum_features(x, y)
+
+    assert features.peaks == pytest.approx([0.3037, 0.3237], abs=1e-4)
+    assert features.peak_values == pytest.approx([-0.5, 0.5], rel=1e-3)
+    assert features.zero_crossings == pytest.approx([0.3137], abs=1e-5)
+
+
+def test_adaptive_sample_limits():
+    """Test the initial points and the maximum number of evaluations."""
+
+    with pytest.raises(ValueError, match="n_initial should be at least 3"):
+        adaptive_sample(np.sin, (0, 1), n_initial=2)
+
+    x, y = adaptive_sample(CountedLineshape(0, 1e-4), (-1, 1), max_points=50)
+    assert x.size == 50
+
+    x, y = adaptive_sample(lambda x: 1.0, (0, 1), n_initial=5)
+    assert x.size == 5
+
+
+class TestAdaptiveSweep:
+    """Test the adaptive sweep of the experiments."""
+
+    @pytest.fixture
+    def inputs(self):
+        """Return the inputs of the stationary tip experiment.
+
+        The short T2 broadens the line over the field step between voxels.
+        """
+        return {
+            "B1": 3.9e-4,
+            "f_rf": 17.7e9,
+            "grid": Grid(
+                grid_shape=[21, 11, 11], grid_step=[16, 20, 16], grid_origin=[0, 0, 0]
+            ),
+            "h": [0, 50, 0],
+            "magnet": SphereMagnet(
+                magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0]
+            ),
+            "sample": Sample(
+                spin="e", temperature=11.0, T1=1.3e-3, T2=2e-9, spin_density=0.0241
+            ),
+            "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+        }
+
+    def test_adaptive_sweep_B0(self, inputs):
+        """Test the B0 sweep of the stationary tip experiment.
+
+        The largest peak of a uniform sweep with 2001 points is at
+        774.85 mT with a value of 0.938157. The adaptive sweep should find
+        it with an order of magnitude fewer executions.
+        """
+
+        experiment = CermitESRGroup.experiments["CermitESRStationaryTip"]
+        x, y, features = experiment.adaptive_sweep("B0", (700, 850), **inputs)
+
+        assert x.size < 250
+        assert y[5] == pytest.approx(experiment(B0=x[5], **inputs))
+        largest = np.argmax(np.abs(features.peak_values))
+        assert features.peaks[largest] == pytest.approx(774.85, abs=0.1)
+        assert features.peak_values[largest] == pytest.approx(0.938157, rel=1e-4)
+
+    def test_adaptive_sweep_output(self):
+        """Test the output is required for experiments with several returns."""
+
+        with pytest.raises(ValueError, match="output is required"):
+            IBMCyclic.adaptive_sweep("f_rf", (1e8, 2e8))
@@ -0,0 +1,126 @@
+from mrfmsim.scan import scan_offsets, ScanField
+from mrfmsim.experiment import CermitESRGroup, IBMCyclic
+from mrfmsim.component import (
+    SphereMagnet,
+    Grid,
+    RectilinearGrid,
+    AdaptiveGrid,
+    PointGrid,
+    Sample,
+    Cantilever,
+)
+from mrfmsim import formula
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def grid():
+    """Return the grid object."""
+    return Grid(grid_shape=[21, 11, 5], grid_step=[8, 10, 8], grid_origin=[0, -50, 0])
+
+
+@pytest.fixture
+def magnet():
+    """Return the magnet object."""
+    return SphereMagnet(magnet_radius=1850.0, mu0_Ms=440.0, magnet_origin=[0, 1850, 0])
+
+
+@pytest.fixture
+def h_array():
+    """Return the scan positions in x and y."""
+    return [[x, 50 + y, 0] for x in [-16, 0, 8, 24] for y in [-10, 0, 10]]
+
+
+def test_scan_offsets():
+    """Test the offsets and the alignment check."""
+
+    offsets = scan_offsets([[0, 50, 0], [16, 40, 0], [-8, 50, 8]], [8, 10, 8])
+    assert np.array_equal(offsets, [[0, 0, 0], [2, -1, 0], [-1, 0, 1]])
+
+    with pytest.raises(ValueError, match="aligned to the grid step"):
+        scan_offsets([[0, 50, 0], [3, 50, 0]], [8, 10, 8])
+
+
+def test_scan_field(grid, magnet, h_array):
+    """Test the scan field windows are views of one padded field."""
+
+    scan_field = ScanField(
+        h_array[0], grid.grid_step, scan_offsets(h_array, grid.grid_step)
+    )
+    padded = scan_field.padded_field(magnet.Bz_method, grid.grid_array)
+    assert padded.shape == (21 + 5, 11 + 2, 5)
+
+    for h in h_array:
+        Bz = scan_field(magnet.Bz_method, grid.grid_array, h)
+        assert np.shares_memory(Bz, padded)
+        assert np.allclose(
+            Bz, formula.field_func(magnet.Bz_method, grid.grid_array, h), rtol=1e-12
+        )
+
+
+class TestExperimentScan:
+    """Test the scans match the experiments executed per position."""
+
+    @pytest.fixture
+    def sample(self):
+        """Return the sample object."""
+        return Sample(
+            spin="e", temperature=11.0, T1=1.3e-3, T2=0.45e-6, spin_density=0.0241
+        )
+
+    @pytest.mark.parametrize(
+        "name, extra",
+        [["CermitESRStationaryTip", {}], ["CermitESR", {"mw_x_0p": 40}]],
+    )
+    def test_scan_cermitesr(self, name, extra, grid, magnet, sample, h_array):
+        """Test the scan with the standard and the extended grid."""
+
+        experiment = CermitESRGroup.experiments[name]
+        inputs = {
+            "B0": 700,
+            "B1": 3.9e-4,
+            "f_rf": 17.7e9,
+            "grid": grid,
+            "magnet": magnet,
+            "sample": sample,
+            "cantilever": Cantilever(k_c=2e4, f_c=3e6),
+            **extra,
+        }
+        expected = [experiment(h=h, **inputs) for h in h_array]
+        assert np.allclose(experiment.scan(h_array, **inputs), expected, rtol=1e-10)
+
+        with ThreadPoolExecutor(2) as executor:
+            result = experiment.scan(h_array, executor=executor, **inputs)
+        assert np.allclose(result, expected, rtol=1e-10)
+
+    def test_scan_ibmcyclic(self, grid, magnet, sample, h_array):
+        """Test the scan of an experiment with several returns."""
+
+        inputs = {
+            "B0": 700,
+            "df_fm": 1e8,
+            "f_rf": 17.7e9,
+            "grid": grid,
+            "magnet": magnet,
+            "sample": sample,
+        }
+        result = IBMCyclic.scan(h_array, **inputs)
+        expected = [IBMCyclic(h=h, **inputs) for h in h_array]
+        assert np.allclose(result, expected, rtol=1e-10)
+
+    def test_scan_grid_type(self, grid, magnet, sample, h_array):
+        """Test the scan requires a Grid."""
+
+        inputs = {"B0": 700, "df_fm": 1e8, "f_rf": 17.7e9, "magnet": magnet}
+        points = np.stack([np.ravel(a) for a in grid.grid_array[:1]] * 3, axis=1)
+        grids = [
+            RectilinearGrid(*[np.ravel(a) for a in grid.grid_array]),
+            PointGrid(grid_points=points),
+            AdaptiveGrid(grid_points=points, grid_volumes=np.ones(len(points))),
+        ]
+        for other in grids:
+            name = type(other).__name__
+            with pytest.raises(ValueError, match=f"scan requires a Grid, not {name}"):
+                IBMCyclic.scan(h_array, grid=other, sample=sample, **inputs)